@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 19:41:09 2026
+
+@author: eo
+"""
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Add local path
+
+import os
+import sys
+
+def find_path_to_local(target_folder = "local"):
+    
+    # Skip path finding if we successfully import the dummy file
+    try:
+        from local.dummy import dummy_func; dummy_func(); return
+    except ImportError:
+        print("", "Couldn't find local directory!", "Searching for path...", sep="\n")
+    
+    # Figure out where this file is located so we can work backwards to find the target folder
+    file_directory = os.path.dirname(os.path.abspath(__file__))
+    path_check = []
+    
+    # Check parent directories to see if we hit the main project directory containing the target folder
+    prev_working_path = working_path = file_directory
+    while True:
+        
+        # If we find the target folder in the given directory, add it to the python path (if it's not already there)
+        if target_folder in os.listdir(working_path):
+            if working_path not in sys.path:
+                tilde_swarm = "~"*(4 + len(working_path))
+                print("\n{}\nPython path updated:\n  {}\n{}".format(tilde_swarm, working_path, tilde_swarm))
+                sys.path.append(working_path)
+            break
+        
+        # Stop if we hit the filesystem root directory (parent directory isn't changing)
+        prev_working_path, working_path = working_path, os.path.dirname(working_path)
+        path_check.append(prev_working_path)
+        if prev_working_path == working_path:
+            print("\nTried paths:", *path_check, "", sep="\n  ")
+            raise ImportError("Can't find '{}' directory!".format(target_folder))
+
+find_path_to_local()
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Imports
+
+import argparse
+
+from time import perf_counter
+
+from local.lib.environment import get_dbserver_protocol, get_dbserver_host, get_dbserver_port
+from local.lib.environment import get_max_concurrent_downloads
+from local.lib.request_helpers import check_server_connection, get_snapshot_ems_list, iter_snapshot_image_bytes
+from local.lib.request_helpers import SNAPSHOT_BYTES_CACHE, BATCH_UNSUPPORTED_TIME_LUT
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Functions
+
+# .....................................................................................................................
+
+def parse_benchmark_args():
+    
+    ''' Helper function used to get benchmark settings from the command line '''
+    
+    # Use the same dbserver as the gifwrapper by default
+    default_dbserver_url = "{}://{}:{}".format(get_dbserver_protocol(), get_dbserver_host(), get_dbserver_port())
+    
+    # Set up argument parsing
+    ap_obj = argparse.ArgumentParser(description = "Time snapshot downloads from the dbserver, with & without batching")
+    ap_obj.add_argument("-u", "--dbserver_url", default = default_dbserver_url, type = str,
+                        help = "dbserver url (default: {})".format(default_dbserver_url))
+    ap_obj.add_argument("-c", "--camera", default = "standin", type = str,
+                        help = "Camera to download snapshots from")
+    ap_obj.add_argument("-n", "--num_snapshots", default = 300, type = int,
+                        help = "Number of (most recent) snapshots to download")
+    ap_obj.add_argument("-b", "--batch_sizes", default = "1,8,32,64", type = str,
+                        help = "Comma separated list of batch sizes to try (1 disables batching)")
+    ap_obj.add_argument("-r", "--repeats", default = 3, type = int,
+                        help = "Number of times to repeat each download (the best time is reported)")
+    
+    return ap_obj.parse_args()
+
+# .....................................................................................................................
+
+def time_snapshot_downloads(dbserver_url, camera_select, snapshot_ems_list, batch_size, max_in_flight):
+    
+    ''' Function which times the download of all listed snapshots, without any help from cached data '''
+    
+    # Make sure we actually download everything & re-check batch support on every run
+    SNAPSHOT_BYTES_CACHE.clear()
+    BATCH_UNSUPPORTED_TIME_LUT.clear()
+    
+    t_start = perf_counter()
+    snapshot_data_iter = \
+    iter_snapshot_image_bytes(dbserver_url, camera_select, snapshot_ems_list, max_in_flight, batch_size)
+    num_downloaded = sum(1 for got_snapshot, _ in snapshot_data_iter if got_snapshot)
+    t_end = perf_counter()
+    
+    return num_downloaded, (t_end - t_start)
+
+# .....................................................................................................................
+# .....................................................................................................................
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Demo
+
+if __name__ == "__main__":
+    
+    # Get benchmark settings & make sure we can talk to the dbserver
+    bench_args = parse_benchmark_args()
+    dbserver_url = bench_args.dbserver_url
+    camera_select = bench_args.camera
+    if not check_server_connection(dbserver_url):
+        raise SystemExit("Can't benchmark without a dbserver! (try running standin_dbserver.py)")
+    
+    # Get the most recent snapshots to download
+    all_ems_list = get_snapshot_ems_list(dbserver_url, camera_select, 0, 2 ** 62)
+    snapshot_ems_list = all_ems_list[-bench_args.num_snapshots:]
+    print("", "Downloading {} snapshots @ {}".format(len(snapshot_ems_list), dbserver_url), sep = "\n")
+    
+    # Time downloads using each of the batch sizes
+    max_in_flight = get_max_concurrent_downloads()
+    batch_sizes_list = [int(each_size) for each_size in bench_args.batch_sizes.split(",")]
+    for each_batch_size in batch_sizes_list:
+        timing_results = [time_snapshot_downloads(dbserver_url, camera_select, snapshot_ems_list,
+                                                  each_batch_size, max_in_flight)
+                          for _ in range(max(1, bench_args.repeats))]
+        num_downloaded, best_time_sec = min(timing_results, key = lambda result: result[1])
+        print("  Batch size {:>4}: {} snapshots in {:.3f} s ({:.0f} snapshots/s)".format(
+              each_batch_size, num_downloaded, best_time_sec, num_downloaded / max(1E-9, best_time_sec)))
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Scrap
+
+
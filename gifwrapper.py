@@ -12,23 +12,42 @@ Created on Thu May 14 11:43:55 2020
 
 import signal
 
+from requests.exceptions import RequestException
+
 from waitress import serve as wsgi_serve
 
-from flask import Flask
+from flask import Flask, send_file
 from flask import request as flask_request
 from flask_cors import CORS
 
-from local.lib.environment import using_spyder_ide, get_default_fps
+from local.lib.environment import using_spyder_ide, get_default_fps, get_max_replay_frames
 from local.lib.environment import get_gifserver_protocol, get_gifserver_host, get_gifserver_port
 from local.lib.environment import get_dbserver_protocol, get_dbserver_host, get_dbserver_port
+from local.lib.environment import get_render_cache_folder, get_render_cache_size_mb
+from local.lib.environment import get_render_max_concurrent, get_render_max_per_camera, get_render_cost_budget_mpx
+from local.lib.environment import get_render_max_queued, get_render_queue_timeout_sec
+from local.lib.environment import get_render_job_workers, get_render_job_folder, get_render_job_retention_sec
+from local.lib.environment import get_render_job_max_queued, get_default_encoder_profile
 
 from local.lib.timekeeper_utils import datetime_to_isoformat_string
 
 from local.lib.request_helpers import connect_to_dbserver, check_server_connection, get_snapshot_ems_list
-from local.lib.response_helpers import json_response, error_response
+from local.lib.response_helpers import json_response, error_response, busy_response
 
 from local.lib.video_creation import create_video_simple_replay
 from local.lib.video_creation import create_video_from_instructions, create_video_response_from_b64_jpgs
+from local.lib.video_creation import submit_video_simple_replay_job, get_shared_render_stats
+from local.lib.video_creation import submit_video_from_instructions_job, submit_video_from_b64_jpgs_job
+
+from local.lib.video_encoding import get_encoder_profile_names
+from local.lib.drawing_functions import Drawing_Plan
+from local.lib.json_streaming import parse_streamed_json_object
+from local.lib.frame_spooling import Jpeg_Frame_Spool, decode_b64_jpg, spool_length_prefixed_jpegs, check_jpeg_bytes
+from local.lib.frame_selection import select_evenly_spaced_ems
+from local.lib.render_cache import Render_Cache
+from local.lib.render_jobs import Render_Job_Queue
+from local.lib.render_scheduler import Render_Scheduler
+from local.lib.snapshot_loading import get_snapshot_cache_stats
 
 from local.lib.perspective_correction import check_valid_quad, calculate_perspective_correction_factors
 
@@ -86,6 +105,87 @@ def check_git_version():
     
     return is_valid, commit_date_str, version_indicator_str
 
+# .....................................................................................................................
+
+def render_job_response(render_job):
+    
+    ''' Helper function used to respond to requests for background renders, with info for checking on the job '''
+    
+    # Tell the client to try again later if the job was refused (too many jobs are already waiting to run)
+    if render_job is None:
+        error_msg = "Server is busy, too many render jobs are queued"
+        return busy_response(error_msg, status_code = 503, retry_after_sec = RENDER_JOBS.get_retry_after_sec())
+    
+    # Include urls for following up on the job, for convenience
+    job_id = render_job.job_id
+    return_result = render_job.get_status_dict()
+    return_result["status_url"] = "/render-jobs/status/{}".format(job_id)
+    return_result["result_url"] = "/render-jobs/result/{}".format(job_id)
+    
+    return json_response(return_result, status_code = 202)
+
+# .....................................................................................................................
+
+def get_output_size_dict(settings_dict):
+    
+    '''
+    Helper function used to pull out (optional) output sizing settings from request data
+    Works with both query args & json data. Raises a ValueError if the settings aren't valid numbers
+    Returns:
+        output_size_dict (or None if no output sizing was given)
+    '''
+    
+    # Interpret each of the sizing settings, ignoring anything that isn't given (or isn't positive)
+    output_size_dict = {}
+    for each_key, each_type in [("output_width", int), ("output_height", int), ("output_scale", float)]:
+        each_value = settings_dict.get(each_key, None)
+        if each_value is None:
+            continue
+        try:
+            each_value = each_type(each_value)
+        except (ValueError, TypeError):
+            raise ValueError("Bad '{}' value: {}".format(each_key, each_value))
+        if each_value > 0:
+            output_size_dict[each_key] = each_value
+    
+    return output_size_dict if len(output_size_dict) > 0 else None
+
+# .....................................................................................................................
+
+def get_output_format(settings_dict, enable_streaming = False):
+    
+    '''
+    Helper function used to pull out the (optional) output format from request data
+    Works with both query args & json data. Raises a ValueError if the format isn't supported,
+    or if streaming is requested for a format that can't be streamed (only mp4 can be streamed)
+    '''
+    
+    output_format = str(settings_dict.get("output_format", "mp4")).lower()
+    if output_format not in {"mp4", "webp", "gif"}:
+        raise ValueError("Bad 'output_format' value: {} (must be 'mp4', 'webp' or 'gif')".format(output_format))
+    
+    if enable_streaming and output_format != "mp4":
+        raise ValueError("Streaming is only supported for mp4 output")
+    
+    return output_format
+
+# .....................................................................................................................
+
+def get_encoder_profile(settings_dict):
+    
+    '''
+    Helper function used to pull out the (optional) encoder profile from request data, or the default if not given
+    Works with both query args & json data. Raises a ValueError if the profile doesn't exist
+    '''
+    
+    encoder_profile = str(settings_dict.get("encoder_profile", get_default_encoder_profile())).lower()
+    valid_profiles_list = get_encoder_profile_names()
+    if encoder_profile not in valid_profiles_list:
+        raise ValueError("Bad 'encoder_profile' value: {} (must be one of: {})".format(encoder_profile,
+                                                                                      ", ".join(valid_profiles_list)))
+    
+    return encoder_profile
+
 # .....................................................................................................................
 # .....................................................................................................................
 
@@ -205,6 +305,15 @@ def get_server_version():
 
 # .....................................................................................................................
 
+@wsgi_app.route("/get-cache-info")
+def get_cache_info_route():
+    
+    ''' Route used to check how well the (in-memory) snapshot caches are being used '''
+    
+    return json_response(get_snapshot_cache_stats(), status_code = 200)
+
+# .....................................................................................................................
+
 @wsgi_app.route("/<string:camera_select>/simple-replay/<int:start_ems>/<int:end_ems>")
 def simple_replay_route(camera_select, start_ems, end_ems):
     
@@ -218,8 +327,42 @@ def simple_replay_route(camera_select, start_ems, end_ems):
     enable_ghosting_str = flask_request.args.get("ghost", "true")
     enable_ghosting_bool = (enable_ghosting_str.lower() in {"1", "true", "on", "enable"})
     
+    # Interpret streaming flag
+    enable_streaming_str = flask_request.args.get("stream", "false")
+    enable_streaming_bool = (enable_streaming_str.lower() in {"1", "true", "on", "enable"})
+    
+    # Interpret background rendering flag
+    enable_async_str = flask_request.args.get("async", "false")
+    enable_async_bool = (enable_async_str.lower() in {"1", "true", "on", "enable"})
+    
+    # Interpret frame budget, which can be given as a frame count or as a video duration (but never above the max)
+    # -> There is no budget unless one is requested or the server has a max (a max of 0 or less means no max)
+    max_frames = flask_request.args.get("max_frames", None, type = int)
+    target_duration_sec = flask_request.args.get("duration_sec", None, type = float)
+    if target_duration_sec is not None:
+        max_frames = int(round(target_duration_sec * get_default_fps()))
+    server_max_frames = get_max_replay_frames()
+    if server_max_frames > 0:
+        max_frames = server_max_frames if max_frames is None else min(max_frames, server_max_frames)
+    
+    # Interpret gap-keeping flag (only used if the frame budget is exceeded)
+    keep_gaps_str = flask_request.args.get("keep_gaps", "false")
+    keep_gaps_bool = (keep_gaps_str.lower() in {"1", "true", "on", "enable"})
+    
+    # Interpret output sizing (if any), so that smaller videos can be rendered more quickly, as well as the format
+    try:
+        output_size_dict = get_output_size_dict(flask_request.args)
+        output_format = get_output_format(flask_request.args, enable_streaming_bool)
+        encoder_profile = get_encoder_profile(flask_request.args)
+    except ValueError as err:
+        return error_response(str(err), status_code = 400)
+    
     # Request snapshot timing info from dbserver
-    snap_ems_list = get_snapshot_ems_list(DBSERVER_URL, camera_select, start_ems, end_ems)
+    try:
+        snap_ems_list = get_snapshot_ems_list(DBSERVER_URL, camera_select, start_ems, end_ems)
+    except RequestException as err:
+        error_msg = ["Error requesting snapshot listing from dbserver", str(err)]
+        return error_response(error_msg, status_code = 500)
     no_snapshots_to_download = (len(snap_ems_list) == 0)
     if no_snapshots_to_download:
         error_msg = "No snapshots in provided time range"
@@ -228,7 +371,24 @@ def simple_replay_route(camera_select, start_ems, end_ems):
     # Make sure snapshot times are ordered!
     snap_ems_list = sorted(snap_ems_list)
     
-    return create_video_simple_replay(DBSERVER_URL, camera_select, snap_ems_list, enable_ghosting_bool)
+    # Thin out the snapshots (evenly in time) if there are too many, so long time ranges still render quickly
+    if max_frames is not None:
+        snap_ems_list = select_evenly_spaced_ems(snap_ems_list, max(1, max_frames), keep_gaps_bool)
+    
+    # Render in the background if needed, so we don't tie up the server while rendering
+    if enable_async_bool:
+        try:
+            render_job = submit_video_simple_replay_job(RENDER_JOBS, DBSERVER_URL, camera_select, snap_ems_list,
+                                                        enable_ghosting_bool, RENDER_CACHE, RENDER_SCHEDULER,
+                                                        output_size_dict, output_format, encoder_profile)
+        except RequestException as err:
+            error_msg = ["Error requesting snapshot data from dbserver", str(err)]
+            return error_response(error_msg, status_code = 500)
+        return render_job_response(render_job)
+    
+    return create_video_simple_replay(DBSERVER_URL, camera_select, snap_ems_list, enable_ghosting_bool,
+                                      enable_streaming_bool, RENDER_CACHE, RENDER_SCHEDULER,
+                                      output_size_dict, output_format, encoder_profile)
 
 # .....................................................................................................................
 
@@ -248,9 +408,24 @@ def create_animation_from_instructions_route():
                      "              'blur_size': (int),",
                      "              'pixelation_factor': (int)",
                      "             },",
-                     " 'instructions': [...]",
+                     " 'instructions': [...],",
+                     " 'stream': (boolean, optional),",
+                     " 'async': (boolean, optional),",
+                     " 'output_width': (int, optional),",
+                     " 'output_height': (int, optional),",
+                     " 'output_scale': (float, optional),",
+                     " 'output_format': ('mp4', 'webp' or 'gif', optional),",
+                     " 'encoder_profile': ('default', 'interactive', 'balanced' or 'archive', optional)",
                      "}",
                      "",
+                     "If 'stream' is true, the video is sent (as fragmented mp4) while it is still being rendered",
+                     "If 'async' is true, the video is rendered in the background and a job id is returned,",
+                     "which can be used with the /render-jobs routes to check progress & download the result",
+                     "The 'output_...' entries can be used to render a smaller video (videos are never scaled up)",
+                     "If only one of the output width or height is given, the other is set to preserve aspect ratio",
+                     "The 'output_format' defaults to mp4. Streaming is only supported for mp4 output",
+                     "The 'encoder_profile' trades encoding speed against file size (mp4 only)",
+                     "",
                      "The 'instructions' key should be a list drawing instructions for each snapshot",
                      "The first entry in the list will be the first frame of the animation",
                      "Each entry in the instructions list should be another JSON object, in the following format:",
@@ -264,6 +439,7 @@ def create_animation_from_instructions_route():
                      "The 'drawing' key should hold a list of what should be drawn on the corresponding snapshot",
                      "Each entry in the drawing list should be a JSON object (see below for options)",
                      "If nothing is to be drawn, the drawing instructions should be an empty list: []",
+                     "All drawing instructions are checked before rendering, bad instructions result in an error",
                      "The following drawing instructions are available:",
                      "{",
                      " 'type': 'polyline',",
@@ -320,6 +496,16 @@ def create_animation_from_instructions_route():
     frame_rate = animation_data_dict.get("frame_rate", get_default_fps())
     ghost_config_dict = animation_data_dict.get("ghosting", {"enable": False})
     instructions_list = animation_data_dict.get("instructions", [])
+    enable_streaming = bool(animation_data_dict.get("stream", False))
+    enable_async = bool(animation_data_dict.get("async", False))
+    
+    # Interpret output sizing & format
+    try:
+        output_size_dict = get_output_size_dict(animation_data_dict)
+        output_format = get_output_format(animation_data_dict, enable_streaming)
+        encoder_profile = get_encoder_profile(animation_data_dict)
+    except ValueError as err:
+        return error_response(str(err), status_code = 400)
     
     # Bail if no camera was selected
     bad_camera = (camera_select is None)
@@ -333,15 +519,36 @@ def create_animation_from_instructions_route():
         error_msg = "Did not find any drawing instructions"
         return error_response(error_msg, status_code = 400)
     
+    # Check all drawing instructions before rendering, so that mistakes aren't found part way through a video
+    try:
+        drawing_plan = Drawing_Plan(instructions_list)
+    except ValueError as err:
+        return error_response(str(err), status_code = 400)
+    
     # Check dbserver connection, since we'll need it to get snapshot data
     dbserver_is_connected = check_server_connection(DBSERVER_URL, feedback_on_error = False)
     if not dbserver_is_connected:
         error_msg = "No connection to dbserver!"
         return error_response(error_msg, status_code = 500)
     
+    # Render in the background if needed, so we don't tie up the server while rendering
+    if enable_async:
+        try:
+            render_job = submit_video_from_instructions_job(RENDER_JOBS, DBSERVER_URL,
+                                                            camera_select, instructions_list, frame_rate,
+                                                            ghost_config_dict, RENDER_CACHE, RENDER_SCHEDULER,
+                                                            output_size_dict, output_format, encoder_profile,
+                                                            drawing_plan)
+        except RequestException as err:
+            error_msg = ["Error requesting snapshot data from dbserver", str(err)]
+            return error_response(error_msg, status_code = 500)
+        return render_job_response(render_job)
+    
     # Use instructions to get target snapshots & draw overlay as needed
     return create_video_from_instructions(DBSERVER_URL,
-                                          camera_select, instructions_list, frame_rate, ghost_config_dict)
+                                          camera_select, instructions_list, frame_rate, ghost_config_dict,
+                                          enable_streaming, RENDER_CACHE, RENDER_SCHEDULER,
+                                          output_size_dict, output_format, encoder_profile, drawing_plan)
 
 # .....................................................................................................................
 
@@ -354,32 +561,218 @@ def create_animation_from_b64_jpgs_route():
                      "Data is expected to be provided in JSON, in the following format:",
                      "{",
                      " 'frame_rate': (float),",
-                     " 'b64_jpgs': (list of b64-encoded jpgs)",
+                     " 'b64_jpgs': (list of b64-encoded jpgs),",
+                     " 'stream': (boolean, optional),",
+                     " 'async': (boolean, optional),",
+                     " 'output_width': (int, optional),",
+                     " 'output_height': (int, optional),",
+                     " 'output_scale': (float, optional),",
+                     " 'output_format': ('mp4', 'webp' or 'gif', optional),",
+                     " 'encoder_profile': ('default', 'interactive', 'balanced' or 'archive', optional)",
                      "}",
                      "The 'b64_jpgs' entry should contain a sequence of base64 encoded jpgs to be rendered",
-                     "The first entry in the list will be the first frame of the animation"]
+                     "The first entry in the list will be the first frame of the animation",
+                     "If 'stream' is true, the video is sent (as fragmented mp4) while it is still being rendered",
+                     "If 'async' is true, the video is rendered in the background and a job id is returned,",
+                     "which can be used with the /render-jobs routes to check progress & download the result",
+                     "The 'output_...' entries can be used to render a smaller video (videos are never scaled up)",
+                     "If only one of the output width or height is given, the other is set to preserve aspect ratio",
+                     "The 'output_format' defaults to mp4. Streaming is only supported for mp4 output",
+                     "The 'encoder_profile' trades encoding speed against file size (mp4 only)"]
         return json_response(info_list, status_code = 200)
     
     # -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -
     
-    # If we get here, we're dealing with a POST request, make sure we got something...
-    animation_data_dict = flask_request.get_json(force = True)
-    missing_animation_data = (animation_data_dict is None)
-    if missing_animation_data:
-        error_msg = "Missing animation data. Call this route as a GET request for more info"
+    # If we get here, we're dealing with a POST request
+    # -> Image data can be very large, so it's read in as a stream, with each frame decoded & stored on disk
+    #    as it arrives (instead of holding the full request, the b64 strings and the decoded frames in memory)
+    jpeg_frames_spool = Jpeg_Frame_Spool()
+    def store_b64_jpg(b64_jpg_bytes):
+        frame_index = len(jpeg_frames_spool)
+        try:
+            jpeg_bytes = decode_b64_jpg(b64_jpg_bytes)
+        except ValueError as err:
+            raise ValueError("Error decoding b64 jpg (index {}): {}".format(frame_index, err))
+        jpeg_frames_spool.append(check_jpeg_bytes(jpeg_bytes, frame_index))
+    
+    # Make sure we got something...
+    try:
+        animation_data_dict = parse_streamed_json_object(flask_request.stream, {"b64_jpgs": store_b64_jpg})
+    except ValueError as err:
+        error_msg = ["Missing or bad animation data. Call this route as a GET request for more info", str(err)]
         return error_response(error_msg, status_code = 400)
     
     # Pull out global information
     frame_rate = animation_data_dict.get("frame_rate", get_default_fps())
-    b64_jpgs_list = animation_data_dict.get("b64_jpgs", [])
+    enable_streaming = bool(animation_data_dict.get("stream", False))
+    enable_async = bool(animation_data_dict.get("async", False))
+    
+    # Interpret output sizing & format
+    try:
+        output_size_dict = get_output_size_dict(animation_data_dict)
+        output_format = get_output_format(animation_data_dict, enable_streaming)
+        encoder_profile = get_encoder_profile(animation_data_dict)
+    except ValueError as err:
+        return error_response(str(err), status_code = 400)
     
     # Bail if we got no image data
-    data_is_valid = (len(b64_jpgs_list) > 0)
+    data_is_valid = (len(jpeg_frames_spool) > 0)
     if not data_is_valid:
         error_msg = "Did not find any base64 jpgs data to render!"
         return error_response(error_msg, status_code = 400)
     
-    return create_video_response_from_b64_jpgs(b64_jpgs_list, frame_rate)
+    # Render in the background if needed, so we don't tie up the server while rendering
+    if enable_async:
+        render_job = submit_video_from_b64_jpgs_job(RENDER_JOBS, jpeg_frames_spool, frame_rate, RENDER_SCHEDULER,
+                                                    output_size_dict, output_format, encoder_profile)
+        return render_job_response(render_job)
+    
+    return create_video_response_from_b64_jpgs(jpeg_frames_spool, frame_rate, enable_streaming, RENDER_SCHEDULER,
+                                               output_size_dict, output_format, encoder_profile)
+
+# .....................................................................................................................
+
+@wsgi_app.route("/create-animation/from-jpgs", methods = ["GET", "POST"])
+def create_animation_from_jpgs_route():
+    
+    # If using a GET request, return some info for how to use POST route
+    if flask_request.method == "GET":
+        info_list = ["Use (as a POST request) to create animations from (binary) jpgs, without base64 encoding",
+                     "Jpgs can be provided in one of two ways:",
+                     "",
+                     "1) As multipart/form-data, with each jpg given as a file named 'jpgs' (in frame order)",
+                     "",
+                     "2) As application/octet-stream, with each jpg given (in frame order) as:",
+                     "   (4-byte frame size, as a big-endian unsigned int) followed by (jpg data)",
+                     "",
+                     "Settings can be given as query arguments or as (multipart) form fields:",
+                     " frame_rate: (float, optional)",
+                     " stream: (boolean, optional)",
+                     " async: (boolean, optional)",
+                     " output_width: (int, optional)",
+                     " output_height: (int, optional)",
+                     " output_scale: (float, optional)",
+                     " output_format: ('mp4', 'webp' or 'gif', optional)",
+                     " encoder_profile: ('default', 'interactive', 'balanced' or 'archive', optional)",
+                     "",
+                     "Settings work the same way as with the /create-animation/from-b64-jpgs route"]
+        return json_response(info_list, status_code = 200)
+    
+    # -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -
+    
+    # If we get here, we're dealing with a POST request, so store frame data on disk as it's read in
+    # -> Large multipart uploads are already stored in temporary files (by flask), so parts are read one-by-one
+    jpeg_frames_spool = Jpeg_Frame_Spool()
+    try:
+        is_multipart = (flask_request.mimetype == "multipart/form-data")
+        if is_multipart:
+            for each_file in flask_request.files.getlist("jpgs"):
+                jpeg_frames_spool.append(check_jpeg_bytes(each_file.read(), len(jpeg_frames_spool)))
+                each_file.close()
+        else:
+            spool_length_prefixed_jpegs(flask_request.stream, jpeg_frames_spool)
+    except ValueError as err:
+        error_msg = ["Bad jpg data. Call this route as a GET request for more info", str(err)]
+        return error_response(error_msg, status_code = 400)
+    
+    # Pull out global information (from query args or form data)
+    settings_dict = flask_request.values
+    frame_rate = settings_dict.get("frame_rate", get_default_fps(), type = float)
+    enable_streaming_str = settings_dict.get("stream", "false")
+    enable_streaming = (enable_streaming_str.lower() in {"1", "true", "on", "enable"})
+    enable_async_str = settings_dict.get("async", "false")
+    enable_async = (enable_async_str.lower() in {"1", "true", "on", "enable"})
+    
+    # Interpret output sizing & format
+    try:
+        output_size_dict = get_output_size_dict(settings_dict)
+        output_format = get_output_format(settings_dict, enable_streaming)
+        encoder_profile = get_encoder_profile(settings_dict)
+    except ValueError as err:
+        return error_response(str(err), status_code = 400)
+    
+    # Bail if we got no image data
+    data_is_valid = (len(jpeg_frames_spool) > 0)
+    if not data_is_valid:
+        error_msg = "Did not find any jpg data to render!"
+        return error_response(error_msg, status_code = 400)
+    
+    # Render in the background if needed, so we don't tie up the server while rendering
+    if enable_async:
+        render_job = submit_video_from_b64_jpgs_job(RENDER_JOBS, jpeg_frames_spool, frame_rate, RENDER_SCHEDULER,
+                                                    output_size_dict, output_format, encoder_profile)
+        return render_job_response(render_job)
+    
+    return create_video_response_from_b64_jpgs(jpeg_frames_spool, frame_rate, enable_streaming, RENDER_SCHEDULER,
+                                               output_size_dict, output_format, encoder_profile)
+
+# .....................................................................................................................
+
+@wsgi_app.route("/get-scheduler-info")
+def get_scheduler_info_route():
+    
+    ''' Route used to check how many renders are running/waiting, to help with tuning the render limits '''
+    
+    # Include info about renders shared between identical requests
+    return_result = RENDER_SCHEDULER.get_stats()
+    return_result["shared_renders"] = get_shared_render_stats()
+    
+    return json_response(return_result, status_code = 200)
+
+# .....................................................................................................................
+
+@wsgi_app.route("/render-jobs/get-info")
+def render_jobs_info_route():
+    
+    ''' Route used to check how many background renders are queued/running/finished '''
+    
+    return json_response(RENDER_JOBS.get_stats(), status_code = 200)
+
+# .....................................................................................................................
+
+@wsgi_app.route("/render-jobs/status/<string:job_id>")
+def render_job_status_route(job_id):
+    
+    ''' Route used to check on the progress of a background render '''
+    
+    # Bail if the job doesn't exist
+    render_job = RENDER_JOBS.get_job(job_id)
+    if render_job is None:
+        error_msg = "Unknown render job ({}). Results are only kept for a limited time".format(job_id)
+        return error_response(error_msg, status_code = 404)
+    
+    return json_response(render_job.get_status_dict(), status_code = 200)
+
+# .....................................................................................................................
+
+@wsgi_app.route("/render-jobs/result/<string:job_id>")
+def render_job_result_route(job_id):
+    
+    ''' Route used to download the result of a (finished) background render '''
+    
+    # Bail if the job doesn't exist
+    render_job = RENDER_JOBS.get_job(job_id)
+    if render_job is None:
+        error_msg = "Unknown render job ({}). Results are only kept for a limited time".format(job_id)
+        return error_response(error_msg, status_code = 404)
+    
+    # Report rendering errors
+    job_status_dict = render_job.get_status_dict()
+    job_status = job_status_dict["status"]
+    if job_status == "failed":
+        error_msg = ["Error creating animation (render job: {})".format(job_id), job_status_dict["error"]]
+        return error_response(error_msg, status_code = 500)
+    
+    # Bail if the job isn't done yet
+    result_file = RENDER_JOBS.open_result_file(job_id)
+    if result_file is None:
+        error_msg = "Render job isn't finished yet (status: {})".format(job_status)
+        return error_response(error_msg, status_code = 409)
+    
+    return send_file(result_file,
+                     attachment_filename = render_job.file_name,
+                     mimetype = render_job.mimetype,
+                     as_attachment = True)
 
 # .....................................................................................................................
 
@@ -474,6 +867,18 @@ def get_perspective_correction_route():
 # Set up git repo access
 GIT_READER = Git_Reader(None)
 
+# Set up storage for re-using finished renders
+RENDER_CACHE = Render_Cache(get_render_cache_folder(), get_render_cache_size_mb())
+
+# Set up limits on the number of renders that can run at once
+RENDER_SCHEDULER = Render_Scheduler(get_render_max_concurrent(), get_render_max_per_camera(),
+                                    get_render_cost_budget_mpx(), get_render_max_queued(),
+                                    get_render_queue_timeout_sec())
+
+# Set up background rendering
+RENDER_JOBS = Render_Job_Queue(get_render_job_folder(), get_render_job_workers(), get_render_job_retention_sec(),
+                               get_render_job_max_queued())
+
 
 # ---------------------------------------------------------------------------------------------------------------------
 #%% *** Launch server ***
@@ -11,15 +11,167 @@ Created on Mon Sep 21 14:17:38 2020
 #%% Imports
 
 import cv2
+import json
 import numpy as np
 
+from threading import Lock
+
+from collections import Counter
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Define classes
+
+class Drawing_Plan:
+    
+    '''
+    Class used to prepare all of the drawing instructions of a render ahead of time
+    All drawing calls are validated & typecast once (when the plan is created), so that bad instructions
+    can be reported before rendering starts (a ValueError is raised), rather than showing up mid-video.
+    Drawing calls are later converted into 'draw ops' (functions which draw onto a frame), with all
+    pixel co-ordinates & text positioning calculated once for each frame size, instead of on every frame
+    
+    Drawing calls that are repeated (identically) on many frames, like filled zones or outlines, are
+    drawn once into a 'static layer', which is copied onto each frame instead of being redrawn.
+    Consecutive repeated calls share a single layer, while calls in between are still drawn per-frame,
+    so that everything is drawn in the original order
+    '''
+    
+    # .................................................................................................................
+    
+    def __init__(self, instructions_list, static_layer_min_frames = 4):
+        
+        # Validate & typecast every drawing call, keeping track of where errors occur to help with debugging
+        self._parsed_calls_per_frame = []
+        self._call_keys_per_frame = []
+        for frame_index, each_instruction_dict in enumerate(instructions_list):
+            
+            # Make sure each instruction has the expected structure
+            if type(each_instruction_dict) is not dict:
+                raise ValueError("Instruction {} is malformed! Got: {}".format(frame_index, each_instruction_dict))
+            drawing_list = each_instruction_dict.get("drawing", [])
+            if type(drawing_list) is not list:
+                raise ValueError("Instruction {} drawing must be a list! Got: {}".format(frame_index, drawing_list))
+            
+            parsed_calls_list = []
+            for draw_index, each_draw_call in enumerate(drawing_list):
+                try:
+                    parsed_calls_list.append(parse_drawing_call(each_draw_call))
+                except ValueError as err:
+                    raise ValueError("Instruction {}, drawing {}: {}".format(frame_index, draw_index, str(err)))
+            self._parsed_calls_per_frame.append(parsed_calls_list)
+            self._call_keys_per_frame.append([get_drawing_call_key(each_call) for each_call in drawing_list])
+        
+        # Count the number of frames each drawing call appears on, to decide which calls belong in static layers
+        call_frame_counts = Counter(each_key
+                                    for each_keys_list in self._call_keys_per_frame
+                                    for each_key in set(each_keys_list))
+        self._is_static_per_frame = [[call_frame_counts[each_key] >= static_layer_min_frames
+                                      for each_key in each_keys_list]
+                                     for each_keys_list in self._call_keys_per_frame]
+        
+        # Allocate storage for draw ops, which are built (once) for each frame size that is drawn on
+        self._build_lock = Lock()
+        self._draw_ops_per_frame_by_wh_lut = {}
+    
+    # .................................................................................................................
+    
+    def __repr__(self):
+        num_calls = sum(len(each_list) for each_list in self._parsed_calls_per_frame)
+        num_static = sum(sum(each_list) for each_list in self._is_static_per_frame)
+        return "Drawing_Plan ({} frames, {} drawing calls, {} static)".format(len(self._parsed_calls_per_frame),
+                                                                             num_calls, num_static)
+    
+    # .................................................................................................................
+    
+    def has_drawing(self, frame_index):
+        
+        ''' Function used to check if anything needs to be drawn on a given frame '''
+        
+        return len(self._parsed_calls_per_frame[frame_index]) > 0
+    
+    # .................................................................................................................
+    
+    def get_draw_ops(self, frame_index, frame_wh):
+        
+        ''' Function which returns the list of draw ops for a given frame (index), at the given frame size '''
+        
+        # Build draw ops for every frame the first time we see a frame size
+        # -> Frames are drawn on several threads, so lock while building to avoid drawing static layers repeatedly
+        frame_wh = tuple(frame_wh)
+        draw_ops_per_frame = self._draw_ops_per_frame_by_wh_lut.get(frame_wh, None)
+        if draw_ops_per_frame is None:
+            with self._build_lock:
+                draw_ops_per_frame = self._draw_ops_per_frame_by_wh_lut.get(frame_wh, None)
+                if draw_ops_per_frame is None:
+                    draw_ops_per_frame = self._build_draw_ops(frame_wh)
+                    self._draw_ops_per_frame_by_wh_lut[frame_wh] = draw_ops_per_frame
+        
+        return draw_ops_per_frame[frame_index]
+    
+    # .................................................................................................................
+    
+    def _build_draw_ops(self, frame_wh):
+        
+        '''
+        Helper used to build the draw ops for every frame at a given frame size
+        Runs of (consecutive) static drawing calls are replaced by a single static layer op,
+        which is shared by all frames with the same run of calls
+        '''
+        
+        # Allocate storage for layers, so each unique run of static calls is only drawn once
+        layer_op_lut = {}
+        def get_layer_ops(static_run_list):
+            if len(static_run_list) == 0:
+                return []
+            layer_key = tuple(each_key for each_key, _ in static_run_list)
+            if layer_key not in layer_op_lut:
+                layer_draw_ops = [make_draw_op(frame_wh, *each_call) for _, each_call in static_run_list]
+                layer_op_lut[layer_key] = make_static_layer_op(frame_wh, layer_draw_ops)
+            return [layer_op_lut[layer_key]]
+        
+        draw_ops_per_frame = []
+        for calls_list, keys_list, is_static_list in zip(self._parsed_calls_per_frame,
+                                                         self._call_keys_per_frame,
+                                                         self._is_static_per_frame):
+            
+            # Gather up consecutive static calls, which are drawn as a layer once a per-frame call comes up
+            frame_ops_list = []
+            static_run_list = []
+            for each_call, each_key, each_is_static in zip(calls_list, keys_list, is_static_list):
+                if each_is_static:
+                    static_run_list.append((each_key, each_call))
+                    continue
+                frame_ops_list += get_layer_ops(static_run_list)
+                frame_ops_list.append(make_draw_op(frame_wh, *each_call))
+                static_run_list = []
+            frame_ops_list += get_layer_ops(static_run_list)
+            
+            draw_ops_per_frame.append(frame_ops_list)
+        
+        return draw_ops_per_frame
+    
+    # .................................................................................................................
+    
+    def draw(self, frame_index, display_frame):
+        
+        ''' Function which draws everything for a given frame (index). Draws directly onto the given frame! '''
+        
+        frame_height, frame_width = display_frame.shape[0:2]
+        for each_draw_op in self.get_draw_ops(frame_index, (frame_width, frame_height)):
+            each_draw_op(display_frame)
+        
+        return display_frame
+    
+    # .................................................................................................................
+    # .................................................................................................................
+
 
 # ---------------------------------------------------------------------------------------------------------------------
 #%% Drawing functions
 
 # .....................................................................................................................
 
-
 def typecast_arguments(arg_value_type_tuple_list):
     
     '''
@@ -41,213 +193,335 @@ def typecast_arguments(arg_value_type_tuple_list):
 
 def interpret_drawing_call(display_frame, drawing_instructions_dict):
     
-    ''' Function which handles 'drawing calls' for videos rendered by instructions '''
+    '''
+    Function which handles a single 'drawing call' for videos rendered by instructions
+    Bad drawing calls result in a blank frame with an error message. When drawing many frames,
+    it's better to use a Drawing_Plan, which avoids re-interpreting the same calls on every frame
+    '''
+    
+    try:
+        frame_height, frame_width = display_frame.shape[0:2]
+        draw_op = make_draw_op((frame_width, frame_height), *parse_drawing_call(drawing_instructions_dict))
+    except ValueError as err:
+        return draw_error_message(display_frame, str(err))
+    
+    return draw_op(display_frame)
+
+# .....................................................................................................................
+
+def parse_drawing_call(drawing_instructions_dict):
+    
+    '''
+    Function which validates & typecasts the settings of a single drawing call
+    Returns:
+        draw_type, parsed_settings_dict
+    
+    Raises a ValueError if the drawing call is not valid
+    '''
     
     # Make sure we got a dictionary
     drawing_is_dict = (type(drawing_instructions_dict) is dict)
     if not drawing_is_dict:
-        error_msg = "Drawing instructions malformed! Got: {}".format(drawing_instructions_dict)
-        return draw_error_message(display_frame, error_msg)
+        raise ValueError("Drawing instructions malformed! Got: {}".format(drawing_instructions_dict))
     
     # Get the drawing type
     draw_type = drawing_instructions_dict.get("type", None)
     if draw_type is None:
-        return draw_error_message(display_frame, "Missing drawing type!")
+        raise ValueError("Missing drawing type!")
     
-    # Handle lines/polygons
-    if draw_type == "polyline":
-        return draw_polyline(display_frame, **drawing_instructions_dict)
+    # Make sure we know how to draw the given type
+    parse_func = DRAWING_PARSE_FUNCS_LUT.get(draw_type, None)
+    if parse_func is None:
+        raise ValueError("Unrecognized drawing type! ({})".format(draw_type))
     
-    # Handle circles
-    if draw_type == "circle":
-        return draw_circle(display_frame, **drawing_instructions_dict)
+    # Force arguments to be correct types (missing/bad arguments lead to type errors)
+    try:
+        parsed_settings_dict = parse_func(**drawing_instructions_dict)
+    except (ValueError, TypeError) as err:
+        raise ValueError("({}) Error: {}".format(draw_type, str(err)))
     
-    # Handle squares/rectangles
-    if draw_type == "rectangle":
-        return draw_rectangle(display_frame, **drawing_instructions_dict)
+    return draw_type, parsed_settings_dict
+
+# .....................................................................................................................
+
+def make_draw_op(frame_wh, draw_type, parsed_settings_dict):
     
-    # Handle text display
-    if draw_type == "text":
-        return draw_text(display_frame, **drawing_instructions_dict)
+    '''
+    Function which converts (parsed) drawing settings into a 'draw op' for a specific frame size
+    The draw op is a function which takes a frame, draws onto it (in-place) & returns the frame
+    '''
     
-    # Send a blank frame if we didn't get an expected type, just to make it clear something went wrong
-    return draw_error_message(display_frame, "Unrecognized drawing type! ({})".format(draw_type))
+    # Get frame sizing to convert normalized co-ords to pixels
+    frame_width, frame_height = frame_wh
+    frame_scaling = np.float32((frame_width - 1, frame_height - 1))
+    
+    make_op_func = DRAWING_MAKE_OP_FUNCS_LUT[draw_type]
+    
+    return make_op_func(frame_scaling, **parsed_settings_dict)
 
 # .....................................................................................................................
 
-def draw_polyline(display_image, xy_points_norm,
-                  is_closed = False, color_rgb = (255, 255, 0), thickness_px = 1, antialiased = True, **kwargs):
+def make_static_layer_op(frame_wh, draw_ops_list, band_height_px = 32):
     
-    # Force arguments to be correct types
-    try:
-        xy_points_norm, is_closed, color_rgb, thickness_px, antialiased = \
-        typecast_arguments([(xy_points_norm, list),
-                            (is_closed, bool),
-                            (color_rgb, list),
-                            (thickness_px, int),
-                            (antialiased, bool)])
-        
-    except ValueError as err:
-        error_message = "(polyline) Error: {}".format(str(err))
-        return draw_error_message(display_image, error_message)
+    '''
+    Function which draws a list of draw ops once, into a layer that can be copied onto frames
+    Returns a single draw op, which gives exactly the same result as running all of the given draw ops
+    
+    The layer is found by drawing onto black & white frames. Pixels that come out the same on both frames
+    are fully covered by the drawing, so they can be copied onto frames (using a mask) instead of being redrawn.
+    To avoid copying more than needed, the layer is split into horizontal bands, each of which only covers the
+    (horizontal) extent of drawn pixels
+    
+    Partially covered pixels (e.g. antialiased edges) depend on the frame underneath, so a layer with these
+    pixels can't be copied exactly. In this case, or if there is only a single draw op (which is never slower
+    to draw directly), the draw ops are used as-is. The choice only depends on the drawing itself,
+    so the same drawing calls always give the same result
+    '''
     
-    # Convert color to bgr for opencv
-    color_bgr = color_rgb[::-1]
+    def draw_all_ops(display_image):
+        for each_draw_op in draw_ops_list:
+            each_draw_op(display_image)
+        return display_image
+    
+    # Nothing to gain from a layer if there's only one thing to draw
+    if len(draw_ops_list) < 2:
+        return draw_all_ops
+    
+    # Draw everything onto black & white frames
+    frame_width, frame_height = frame_wh
+    black_frame = draw_all_ops(np.zeros((frame_height, frame_width, 3), dtype = np.uint8))
+    white_frame = draw_all_ops(np.full((frame_height, frame_width, 3), 255, dtype = np.uint8))
+    
+    # Use the draw ops directly if any pixels are only partially covered, since these can't be copied
+    drawn_mask = np.any((black_frame != 0) | (white_frame != 255), axis = 2)
+    covered_mask = np.all(black_frame == white_frame, axis = 2)
+    has_partial_pixels = np.any(drawn_mask & np.logical_not(covered_mask))
+    if has_partial_pixels:
+        return draw_all_ops
+    
+    # Find the covered region within each band of rows, so we don't copy more than we need to
+    layer_bands_list = []
+    for y1 in range(0, frame_height, band_height_px):
+        y2 = min(frame_height, y1 + band_height_px)
+        drawn_xs = np.flatnonzero(np.any(drawn_mask[y1:y2], axis = 0))
+        if len(drawn_xs) == 0:
+            continue
+        x1, x2 = drawn_xs[0], drawn_xs[-1] + 1
+        band_mask = np.repeat(drawn_mask[y1:y2, x1:x2, np.newaxis], 3, axis = 2)
+        band_color = black_frame[y1:y2, x1:x2].copy()
+        layer_bands_list.append((y1, y2, x1, x2, band_mask, band_color))
+    
+    def draw_static_layer(display_image):
+        for y1, y2, x1, x2, band_mask, band_color in layer_bands_list:
+            np.copyto(display_image[y1:y2, x1:x2], band_color, where = band_mask)
+        return display_image
+    
+    # Make sure copying gives the same result as drawing (on a frame of noise), otherwise stick to drawing
+    noise_frame = np.random.RandomState(0).randint(0, 256, (frame_height, frame_width, 3), dtype = np.uint8)
+    layer_is_exact = np.array_equal(draw_static_layer(noise_frame.copy()), draw_all_ops(noise_frame))
+    
+    return draw_static_layer if layer_is_exact else draw_all_ops
+
+# .....................................................................................................................
+
+def parse_polyline(xy_points_norm,
+                   is_closed = False, color_rgb = (255, 255, 0), thickness_px = 1, antialiased = True, **kwargs):
     
-    # Use filled polygon if thickness is negative
-    fill_polygon = (thickness_px < 1)
+    # Force arguments to be correct types
+    xy_points_norm, is_closed, color_rgb, thickness_px, antialiased = \
+    typecast_arguments([(xy_points_norm, list),
+                        (is_closed, bool),
+                        (color_rgb, list),
+                        (thickness_px, int),
+                        (antialiased, bool)])
+    
+    return {"xy_array_norm": parse_xy_array(xy_points_norm, "xy_points_norm"),
+            "is_closed": is_closed,
+            "color_bgr": parse_color_bgr(color_rgb),
+            "thickness_px": thickness_px,
+            "line_type": cv2.LINE_AA if antialiased else cv2.LINE_4}
     
-    # Decide on line type
-    line_type = cv2.LINE_AA if antialiased else cv2.LINE_4
+# .....................................................................................................................
     
-    # Get frame sizing to convert normalized co-ords to pixels
-    frame_height, frame_width = display_image.shape[0:2]
-    frame_scaling = np.float32((frame_width - 1, frame_height - 1))
+def make_polyline_op(frame_scaling, xy_array_norm, is_closed, color_bgr, thickness_px, line_type):
     
     # Scale xy-points to pixels
-    xy_array_px = np.int32(np.round(np.float32(xy_points_norm) * frame_scaling))
+    xy_array_px = np.int32(np.round(xy_array_norm * frame_scaling))
     
-    # Draw a polyline/filled polygon, depending on settings
+    # Draw a filled polygon if thickness is negative, otherwise a polyline
+    fill_polygon = (thickness_px < 1)
     if fill_polygon:
-        return cv2.fillPoly(display_image, [xy_array_px], color_bgr, line_type)
-    return cv2.polylines(display_image, [xy_array_px], is_closed, color_bgr, thickness_px, line_type)
+        return lambda display_image: cv2.fillPoly(display_image, [xy_array_px], color_bgr, line_type)
+    
+    return lambda display_image: cv2.polylines(display_image, [xy_array_px], is_closed,
+                                               color_bgr, thickness_px, line_type)
 
 # .....................................................................................................................
 
-def draw_circle(display_image, center_xy_norm,
-                radius_norm = 0.05, color_rgb = (255, 255, 0), thickness_px = 1, antialiased = True, **kwargs):
+def parse_circle(center_xy_norm,
+                 radius_norm = 0.05, color_rgb = (255, 255, 0), thickness_px = 1, antialiased = True, **kwargs):
     
     # Force arguments to be correct types
-    try:
-        center_xy_norm, radius_norm, color_rgb, thickness_px, antialiased = \
-        typecast_arguments([(center_xy_norm, list),
-                            (radius_norm, float),
-                            (color_rgb, list),
-                            (thickness_px, int),
-                            (antialiased, bool)])
-        
-    except ValueError as err:
-        error_message = "(circle) Error: {}".format(str(err))
-        return draw_error_message(display_image, error_message)
-    
-    # Convert color to bgr for opencv
-    color_bgr = color_rgb[::-1]
-    
-    # Decide on line type
-    line_type = cv2.LINE_AA if antialiased else cv2.LINE_4
-    
-    # Get frame sizing to convert normalized co-ords to pixels
-    frame_height, frame_width = display_image.shape[0:2]
-    frame_scaling = np.float32((frame_width - 1, frame_height - 1))
+    center_xy_norm, radius_norm, color_rgb, thickness_px, antialiased = \
+    typecast_arguments([(center_xy_norm, list),
+                        (radius_norm, float),
+                        (color_rgb, list),
+                        (thickness_px, int),
+                        (antialiased, bool)])
+    
+    return {"center_xy_norm": parse_xy_array(center_xy_norm, "center_xy_norm", single_point = True),
+            "radius_norm": radius_norm,
+            "color_bgr": parse_color_bgr(color_rgb),
+            "thickness_px": thickness_px,
+            "line_type": cv2.LINE_AA if antialiased else cv2.LINE_4}
+
+# .....................................................................................................................
+
+def make_circle_op(frame_scaling, center_xy_norm, radius_norm, color_bgr, thickness_px, line_type):
     
     # Calculate diagonal length and use it to determine radius in pixels
     frame_diagonal_px = np.sqrt(np.sum(np.square(frame_scaling)))
     radius_px = int(round(radius_norm * frame_diagonal_px))
     
     # Scale xy-points to pixels
-    center_xy_px = np.int32(np.round(np.float32(center_xy_norm) * frame_scaling))
+    center_xy_px = tuple(np.int32(np.round(center_xy_norm * frame_scaling)).tolist())
     
-    return cv2.circle(display_image, tuple(center_xy_px), radius_px, color_bgr, thickness_px, line_type)
+    return lambda display_image: cv2.circle(display_image, center_xy_px, radius_px,
+                                            color_bgr, thickness_px, line_type)
 
 # .....................................................................................................................
 
-def draw_rectangle(display_image, top_left_norm, bottom_right_norm,
-                   color_rgb = (255, 255, 0), thickness_px = 1, antialiased = False, **kwargs):
+def parse_rectangle(top_left_norm, bottom_right_norm,
+                    color_rgb = (255, 255, 0), thickness_px = 1, antialiased = False, **kwargs):
     
     # Force arguments to be correct types
-    try:
-        top_left_norm, bottom_right_norm, color_rgb, thickness_px, antialiased = \
-        typecast_arguments([(top_left_norm, list),
-                            (bottom_right_norm, list),
-                            (color_rgb, list),
-                            (thickness_px, int),
-                            (antialiased, bool)])
-        
-    except ValueError as err:
-        error_message = "(rectangle) Error: {}".format(str(err))
-        return draw_error_message(display_image, error_message)
-    
-    # Convert color to bgr for opencv
-    color_bgr = color_rgb[::-1]
-    
-    # Decide on line type
-    line_type = cv2.LINE_AA if antialiased else cv2.LINE_4
-    
-    # Get frame sizing to convert normalized co-ords to pixels
-    frame_height, frame_width = display_image.shape[0:2]
-    frame_scaling = np.float32((frame_width - 1, frame_height - 1))
+    top_left_norm, bottom_right_norm, color_rgb, thickness_px, antialiased = \
+    typecast_arguments([(top_left_norm, list),
+                        (bottom_right_norm, list),
+                        (color_rgb, list),
+                        (thickness_px, int),
+                        (antialiased, bool)])
+    
+    return {"top_left_norm": parse_xy_array(top_left_norm, "top_left_norm", single_point = True),
+            "bottom_right_norm": parse_xy_array(bottom_right_norm, "bottom_right_norm", single_point = True),
+            "color_bgr": parse_color_bgr(color_rgb),
+            "thickness_px": thickness_px,
+            "line_type": cv2.LINE_AA if antialiased else cv2.LINE_4}
+
+# .....................................................................................................................
+
+def make_rectangle_op(frame_scaling, top_left_norm, bottom_right_norm, color_bgr, thickness_px, line_type):
     
     # Scale xy-points to pixels
-    tl_px = np.int32(np.round(np.float32(top_left_norm) * frame_scaling))
-    br_px = np.int32(np.round(np.float32(bottom_right_norm) * frame_scaling))
+    tl_px = tuple(np.int32(np.round(top_left_norm * frame_scaling)).tolist())
+    br_px = tuple(np.int32(np.round(bottom_right_norm * frame_scaling)).tolist())
     
-    return cv2.rectangle(display_image, tuple(tl_px), tuple(br_px), color_bgr, thickness_px, line_type)
+    return lambda display_image: cv2.rectangle(display_image, tl_px, br_px, color_bgr, thickness_px, line_type)
 
 # .....................................................................................................................
 
-def draw_text(display_image, message, text_xy_norm,
-              align_horizontal = "center", align_vertical = "center",
-              text_scale = 0.5, color_rgb = (255, 255, 255), bg_color_rgb = None, thickness_px = 1, antialiased = True,
-              **kwargs):
+def parse_text(message, text_xy_norm,
+               align_horizontal = "center", align_vertical = "center",
+               text_scale = 0.5, color_rgb = (255, 255, 255), bg_color_rgb = None, thickness_px = 1, antialiased = True,
+               **kwargs):
     
     # Force arguments to be correct types
-    try:
-        message, text_xy_norm, align_horizontal, align_vertical, text_scale, color_rgb, thickness_px, antialiased = \
-        typecast_arguments([(message, str),
-                            (text_xy_norm, list),
-                            (align_horizontal, str),
-                            (align_vertical, str),
-                            (text_scale, float),
-                            (color_rgb, list),
-                            (thickness_px, int),
-                            (antialiased, bool)])
-        
-        # Handle background color typecase separately, since it can take multiple types
-        if bg_color_rgb is not None:
-            bg_color_rgb = tuple(bg_color_rgb)
-        
-    except ValueError as err:
-        error_message = "(text) Error: {}".format(str(err))
-        return draw_error_message(display_image, error_message)
+    message, text_xy_norm, align_horizontal, align_vertical, text_scale, color_rgb, thickness_px, antialiased = \
+    typecast_arguments([(message, str),
+                        (text_xy_norm, list),
+                        (align_horizontal, str),
+                        (align_vertical, str),
+                        (text_scale, float),
+                        (color_rgb, list),
+                        (thickness_px, int),
+                        (antialiased, bool)])
+    
+    # Handle background color typecase separately, since it can take multiple types
+    if bg_color_rgb is not None:
+        bg_color_rgb = tuple(parse_color_bgr(bg_color_rgb)[::-1])
+    
+    return {"message": message,
+            "text_xy_norm": parse_xy_array(text_xy_norm, "text_xy_norm", single_point = True),
+            "align_horizontal": align_horizontal.lower(),
+            "align_vertical": align_vertical.lower(),
+            "text_scale": text_scale,
+            "color_bgr": parse_color_bgr(color_rgb),
+            "bg_color_rgb": bg_color_rgb,
+            "thickness_px": thickness_px,
+            "line_type": cv2.LINE_AA if antialiased else cv2.LINE_4}
+
+# .....................................................................................................................
+
+def make_text_op(frame_scaling, message, text_xy_norm, align_horizontal, align_vertical,
+                 text_scale, color_bgr, bg_color_rgb, thickness_px, line_type):
     
     # Hard-code font type
     text_font = cv2.FONT_HERSHEY_SIMPLEX
     
-    # Convert color to bgr for opencv
-    color_bgr = color_rgb[::-1]
-    
-    # Decide on line type
-    line_type = cv2.LINE_AA if antialiased else cv2.LINE_4
-    
-    # Get frame sizing to convert normalized co-ords to pixels
-    frame_height, frame_width = display_image.shape[0:2]
-    frame_scaling = np.float32((frame_width - 1, frame_height - 1))
-    
     # Scale text-xy co-ordinates to pixels
-    text_x_px, text_y_px = np.int32(np.round(np.float32(text_xy_norm) * frame_scaling))
+    text_x_px, text_y_px = np.int32(np.round(text_xy_norm * frame_scaling)).tolist()
     
     # Figure out text sizing for handling alignment
     (text_w, text_h), text_baseline = cv2.getTextSize(message, text_font, text_scale, thickness_px)
     
     # Figure out text x-location
     h_align_lut = {"left": 0, "center":  -int(text_w / 2), "right": -text_w}
-    lowered_h_align = str(align_horizontal).lower()
-    x_offset = h_align_lut.get(lowered_h_align, h_align_lut["left"])
+    x_offset = h_align_lut.get(align_horizontal, h_align_lut["left"])
     
     # Figure out text y-location
     v_align_lut = {"top": text_h, "center": text_baseline, "bottom": -text_baseline}
-    lowered_v_align = str(align_vertical).lower()
-    y_offset = v_align_lut.get(lowered_v_align, v_align_lut["top"])
+    y_offset = v_align_lut.get(align_vertical, v_align_lut["top"])
     
     # Calculate final text postion
     text_pos = (1 + text_x_px + x_offset, 1 + text_y_px + y_offset)
     
-    # Drawn background text, if needed
-    if bg_color_rgb is not None:
-        bg_thickness = (2 * thickness_px)
-        cv2.putText(display_image, message, text_pos, text_font, text_scale, bg_color_rgb, bg_thickness, line_type)
+    def draw_text(display_image):
+    
+        # Drawn background text, if needed
+        if bg_color_rgb is not None:
+            bg_thickness = (2 * thickness_px)
+            cv2.putText(display_image, message, text_pos, text_font, text_scale, bg_color_rgb, bg_thickness, line_type)
+        
+        return cv2.putText(display_image, message, text_pos, text_font, text_scale, color_bgr, thickness_px, line_type)
     
-    return cv2.putText(display_image, message, text_pos, text_font, text_scale, color_bgr, thickness_px, line_type)
+    return draw_text
+
+# .....................................................................................................................
+
+def get_drawing_call_key(drawing_instructions_dict):
+    
+    ''' Helper used to get a key (string) for a drawing call, so that identical calls can be found '''
+    
+    return json.dumps(drawing_instructions_dict, sort_keys = True, default = str)
+
+# .....................................................................................................................
+
+def parse_xy_array(xy_values, arg_name, single_point = False):
+    
+    '''
+    Helper used to convert normalized xy co-ordinates into a float32 array
+    Expects a list of xy pairs, or a single xy pair if 'single_point' is True. Raises a ValueError otherwise
+    '''
+    
+    xy_array = np.float32(xy_values)
+    expected_shape_str = "[x, y]" if single_point else "[[x1, y1], [x2, y2], ...]"
+    is_valid_shape = (xy_array.shape == (2,)) if single_point else (xy_array.ndim == 2 and xy_array.shape[1] == 2)
+    if not is_valid_shape:
+        raise ValueError("Bad '{}' value, expecting {}. Got: {}".format(arg_name, expected_shape_str, xy_values))
+    
+    return xy_array
+
+# .....................................................................................................................
+
+def parse_color_bgr(color_rgb):
+    
+    ''' Helper used to convert an rgb color into a bgr tuple, for opencv. Raises a ValueError if not valid '''
+    
+    color_rgb = list(color_rgb)
+    if len(color_rgb) != 3:
+        raise ValueError("Colors must have 3 values (rgb). Got: {}".format(color_rgb))
+    
+    return tuple(float(each_value) for each_value in color_rgb[::-1])
 
 # .....................................................................................................................
 
@@ -256,18 +530,66 @@ def draw_error_message(display_image, error_message):
     ''' Helper function used to return (blank) frames with error messages '''
     
     blank_frame = np.zeros_like(display_image)
-    return draw_text(blank_frame, error_message, (0.5, 0.5), text_scale = 0.4, color_rgb = (255, 70, 20))
+    frame_height, frame_width = blank_frame.shape[0:2]
+    draw_settings_dict = parse_text(error_message, (0.5, 0.5), text_scale = 0.4, color_rgb = (255, 70, 20))
+    draw_op = make_draw_op((frame_width, frame_height), "text", draw_settings_dict)
+    
+    return draw_op(blank_frame)
 
 # .....................................................................................................................
 # .....................................................................................................................
 
 
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Set up globals
+
+# Functions used to validate & typecast the settings of each type of drawing
+DRAWING_PARSE_FUNCS_LUT = \
+{"polyline": parse_polyline,
+ "circle": parse_circle,
+ "rectangle": parse_rectangle,
+ "text": parse_text}
+
+# Functions used to build draw ops from parsed settings, for a specific frame size
+DRAWING_MAKE_OP_FUNCS_LUT = \
+{"polyline": make_polyline_op,
+ "circle": make_circle_op,
+ "rectangle": make_rectangle_op,
+ "text": make_text_op}
+
+
 # ---------------------------------------------------------------------------------------------------------------------
 #%% Demo
 
 if __name__ == "__main__":
     
-    pass
+    # Make a set of instructions with repeated (static) drawing calls, both with and without antialiasing
+    zone_calls_list = [{"type": "rectangle", "top_left_norm": [0.1, 0.1], "bottom_right_norm": [0.4, 0.5],
+                        "color_rgb": [255, 0, 0], "thickness_px": -1},
+                       {"type": "polyline", "xy_points_norm": [[0.5, 0.2], [0.9, 0.3], [0.7, 0.8]],
+                        "is_closed": True, "thickness_px": 2, "antialiased": False},
+                       {"type": "circle", "center_xy_norm": [0.3, 0.7], "radius_norm": 0.1, "thickness_px": -1,
+                        "antialiased": False}]
+    label_calls_list = [{"type": "text", "message": "Zone A", "text_xy_norm": [0.25, 0.3], "bg_color_rgb": [0, 0, 0]},
+                        {"type": "polyline", "xy_points_norm": [[0.1, 0.9], [0.9, 0.9]], "thickness_px": 3}]
+    example_instructions_list = []
+    for k in range(20):
+        frame_calls_list = [{"type": "circle", "center_xy_norm": [0.05 * k, 0.5], "radius_norm": 0.02}]
+        example_instructions_list.append({"drawing": zone_calls_list + frame_calls_list + label_calls_list})
+    
+    # Check that drawing with a plan gives exactly the same result as interpreting each drawing call separately
+    example_plan = Drawing_Plan(example_instructions_list)
+    random_gen = np.random.RandomState(1)
+    num_changed_px = 0
+    for frame_index, each_instruction_dict in enumerate(example_instructions_list):
+        example_frame = random_gen.randint(0, 256, (360, 640, 3), dtype = np.uint8)
+        per_call_frame = example_frame.copy()
+        for each_draw_call in each_instruction_dict["drawing"]:
+            per_call_frame = interpret_drawing_call(per_call_frame, each_draw_call)
+        plan_frame = example_plan.draw(frame_index, example_frame.copy())
+        num_changed_px += np.count_nonzero(np.any(plan_frame != per_call_frame, axis = 2))
+    print(example_plan, "", "Pixels changed by drawing plan: {}".format(num_changed_px), sep = "\n")
+    assert num_changed_px == 0, "Drawing plan does not match per-call drawing!"
 
 
 # ---------------------------------------------------------------------------------------------------------------------
@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 20:34:12 2026
+
+@author: eo
+"""
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Imports
+
+from time import time
+from bisect import bisect_left, bisect_right
+from threading import Lock
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Define classes
+
+class Ems_List_Cache:
+    
+    '''
+    Class used to store snapshot epoch ms listings (per camera), so that requests for time ranges that were
+    already listed can be answered without asking the dbserver again. Each camera has a sorted list of every
+    known snapshot time, along with a record of which time ranges ('coverage') the list is complete for.
+    Only the uncovered gaps of a requested range need to be listed by the dbserver.
+    
+    Time ranges near the current time (within the 'live window') may still be gaining new snapshots,
+    so coverage of these ranges only lasts for a short time ('live ttl'), after which they're listed again.
+    If a camera has more than 'max_entries' known snapshot times, the known times furthest from the most
+    recently stored listing are forgotten. Listings that are larger than 'max_entries' on their own aren't stored.
+    A max entries of zero disables the cache.
+    
+    Safe to use from multiple threads
+    '''
+    
+    # .................................................................................................................
+    
+    def __init__(self, max_entries = 500000, live_window_sec = 60, live_ttl_sec = 2):
+        
+        # Store cache settings
+        self.max_entries = int(max_entries)
+        self.live_window_sec = live_window_sec
+        self.live_ttl_sec = live_ttl_sec
+        self.enabled = (self.max_entries > 0)
+        
+        # Allocate storage for each camera's known snapshot times & coverage, as (start, end, expiry) entries
+        self._lock = Lock()
+        self._ems_lut = {}
+        self._coverage_lut = {}
+        
+        # Keep track of cache usage, for reporting
+        self.hit_count = 0
+        self.partial_hit_count = 0
+        self.miss_count = 0
+    
+    # .................................................................................................................
+    
+    def __repr__(self):
+        return "Ems_List_Cache ({} cameras, {} entries)".format(len(self._ems_lut), self._count_entries())
+    
+    # .................................................................................................................
+    
+    def find_gaps(self, camera_select, start_ems, end_ems):
+        
+        '''
+        Function which finds the parts of a time range that aren't covered by the cache (end points included)
+        Returns:
+            gaps_list (list of (gap_start_ems, gap_end_ems) entries, empty if the whole range is covered)
+        '''
+        
+        with self._lock:
+            gaps_list = self._find_gaps(camera_select, start_ems, end_ems)
+            
+            # Record cache usage
+            is_hit = (len(gaps_list) == 0)
+            is_miss = (gaps_list == [(start_ems, end_ems)])
+            self.hit_count += int(is_hit)
+            self.miss_count += int(is_miss)
+            self.partial_hit_count += int(not (is_hit or is_miss))
+        
+        return gaps_list
+    
+    # .................................................................................................................
+    
+    def get(self, camera_select, start_ems, end_ems):
+        
+        '''
+        Function used to retrieve the (sorted) snapshot times within a time range (end points included)
+        Returns None if the range isn't fully covered by the cache
+        '''
+        
+        with self._lock:
+            
+            # Don't hand back partial listings
+            if len(self._find_gaps(camera_select, start_ems, end_ems)) > 0:
+                return None
+            
+            known_ems_list = self._ems_lut.get(camera_select, None)
+            if known_ems_list is None:
+                return None
+            start_idx = bisect_left(known_ems_list, start_ems)
+            end_idx = bisect_right(known_ems_list, end_ems)
+            snapshot_ems_list = known_ems_list[start_idx:end_idx]
+        
+        return snapshot_ems_list
+    
+    # .................................................................................................................
+    
+    def get_covered(self, camera_select, start_ems, end_ems):
+        
+        '''
+        Function used to retrieve the (sorted) snapshot times within the parts of a time range that are
+        covered by the cache, along with the parts that aren't covered (end points included)
+        Only the gaps need to be listed to complete the listing, even if the full range is too large to cache
+        Returns:
+            covered_ems_list, gaps_list
+        '''
+        
+        with self._lock:
+            gaps_list = self._find_gaps(camera_select, start_ems, end_ems)
+            
+            # Record cache usage
+            is_hit = (len(gaps_list) == 0)
+            is_miss = (gaps_list == [(start_ems, end_ems)])
+            self.hit_count += int(is_hit)
+            self.miss_count += int(is_miss)
+            self.partial_hit_count += int(not (is_hit or is_miss))
+            
+            # Collect known times in between the gaps (times inside the gaps may be out of date)
+            covered_ems_list = []
+            known_ems_list = self._ems_lut.get(camera_select, [])
+            next_covered_ems = start_ems
+            for gap_start_ems, gap_end_ems in gaps_list + [(end_ems + 1, end_ems + 1)]:
+                if gap_start_ems > next_covered_ems:
+                    start_idx = bisect_left(known_ems_list, next_covered_ems)
+                    end_idx = bisect_left(known_ems_list, gap_start_ems)
+                    covered_ems_list += known_ems_list[start_idx:end_idx]
+                next_covered_ems = gap_end_ems + 1
+        
+        return covered_ems_list, gaps_list
+    
+    # .................................................................................................................
+    
+    def store(self, camera_select, start_ems, end_ems, snapshot_ems_list, request_time = None):
+        
+        '''
+        Function used to add a (complete) listing of the snapshot times within a time range to the cache
+        The request time (in epoch seconds) should be the time just before the listing was requested,
+        which is used to decide how much of the range may still be gaining snapshots
+        '''
+        
+        # Don't store anything if the cache is disabled
+        if not self.enabled:
+            return
+        
+        # Figure out which part of the range is settled, anything after this may still be gaining snapshots
+        time_now = time()
+        if request_time is None:
+            request_time = time_now
+        live_edge_ems = int(1000 * (request_time - self.live_window_sec))
+        new_coverage_list = []
+        if start_ems <= live_edge_ems:
+            new_coverage_list.append((start_ems, min(end_ems, live_edge_ems), None))
+        if end_ems > live_edge_ems:
+            new_coverage_list.append((max(start_ems, live_edge_ems + 1), end_ems, request_time + self.live_ttl_sec))
+        
+        # Only keep listed times that are actually in the range, in sorted order
+        new_ems_list = sorted(each_ems for each_ems in snapshot_ems_list if start_ems <= each_ems <= end_ems)
+        
+        # Don't bother storing listings that could never fit in the cache
+        if len(new_ems_list) > self.max_entries:
+            return
+        
+        with self._lock:
+            
+            # Replace anything previously known within the range (e.g. an expired live range) with the new listing
+            known_ems_list = self._ems_lut.setdefault(camera_select, [])
+            start_idx = bisect_left(known_ems_list, start_ems)
+            end_idx = bisect_right(known_ems_list, end_ems)
+            known_ems_list[start_idx:end_idx] = new_ems_list
+            
+            # Update coverage, dropping expired ranges
+            coverage_list = [each_range for each_range in self._coverage_lut.get(camera_select, [])
+                             if (each_range[2] is None) or (each_range[2] > time_now)]
+            self._coverage_lut[camera_select] = merge_coverage(coverage_list + new_coverage_list)
+            
+            # Forget the times furthest from the new listing if the camera's listing grows too large
+            self._trim_to_size(camera_select, start_ems, end_ems)
+        
+        return
+    
+    # .................................................................................................................
+    
+    def clear(self):
+        
+        ''' Function used to remove all cached listings '''
+        
+        with self._lock:
+            self._ems_lut = {}
+            self._coverage_lut = {}
+    
+    # .................................................................................................................
+    
+    def get_stats(self):
+        
+        ''' Function which returns a dictionary describing the cache usage '''
+        
+        with self._lock:
+            stats_dict = {"cameras": len(self._ems_lut),
+                          "entries": self._count_entries(),
+                          "max_entries": self.max_entries,
+                          "hits": self.hit_count,
+                          "partial_hits": self.partial_hit_count,
+                          "misses": self.miss_count}
+        
+        return stats_dict
+    
+    # .................................................................................................................
+    
+    def _count_entries(self):
+        return sum(len(each_ems_list) for each_ems_list in self._ems_lut.values())
+    
+    # .................................................................................................................
+    
+    def _trim_to_size(self, camera_select, keep_start_ems, keep_end_ems):
+        
+        '''
+        Helper used to forget known times (along with their coverage) until a camera has at most 'max_entries'
+        known times. Times are removed from whichever end has more times outside of the 'keep' range,
+        so that the keep range itself is never affected. Must be called while holding the lock!
+        '''
+        
+        known_ems_list = self._ems_lut[camera_select]
+        num_to_remove = len(known_ems_list) - self.max_entries
+        if num_to_remove <= 0:
+            return
+        
+        # Figure out how many times to remove from each end, without removing anything from the keep range
+        num_before = bisect_left(known_ems_list, keep_start_ems)
+        num_after = len(known_ems_list) - bisect_right(known_ems_list, keep_end_ems)
+        remove_from_end = (num_after >= num_before)
+        num_first_removed = min(num_to_remove, num_after if remove_from_end else num_before)
+        num_end_removed = num_first_removed if remove_from_end else (num_to_remove - num_first_removed)
+        num_start_removed = (num_to_remove - num_first_removed) if remove_from_end else num_first_removed
+        
+        # Only keep coverage between the removed times, since the cache no longer knows about anything beyond them
+        covered_start_ems = None if num_start_removed == 0 else (known_ems_list[num_start_removed - 1] + 1)
+        covered_end_ems = None if num_end_removed == 0 else (known_ems_list[-num_end_removed] - 1)
+        trimmed_coverage_list = []
+        for range_start_ems, range_end_ems, expiry_time in self._coverage_lut[camera_select]:
+            if covered_start_ems is not None:
+                range_start_ems = max(range_start_ems, covered_start_ems)
+            if covered_end_ems is not None:
+                range_end_ems = min(range_end_ems, covered_end_ems)
+            if range_start_ems <= range_end_ems:
+                trimmed_coverage_list.append((range_start_ems, range_end_ems, expiry_time))
+        
+        self._ems_lut[camera_select] = known_ems_list[num_start_removed:(len(known_ems_list) - num_end_removed)]
+        self._coverage_lut[camera_select] = trimmed_coverage_list
+        
+        return
+    
+    # .................................................................................................................
+    
+    def _find_gaps(self, camera_select, start_ems, end_ems):
+        
+        ''' Helper used to find uncovered parts of a time range. Must be called while holding the lock! '''
+        
+        time_now = time()
+        gaps_list = []
+        next_uncovered_ems = start_ems
+        
+        # Walk through coverage (sorted by start time), recording any uncovered space in between
+        for range_start_ems, range_end_ems, expiry_time in self._coverage_lut.get(camera_select, []):
+            if range_start_ems > end_ems:
+                break
+            is_expired = (expiry_time is not None) and (expiry_time <= time_now)
+            if is_expired or (range_end_ems < next_uncovered_ems):
+                continue
+            if range_start_ems > next_uncovered_ems:
+                gaps_list.append((next_uncovered_ems, range_start_ems - 1))
+            next_uncovered_ems = max(next_uncovered_ems, range_end_ems + 1)
+            if next_uncovered_ems > end_ems:
+                break
+        
+        # Anything left after the last covered range is also a gap
+        if next_uncovered_ems <= end_ems:
+            gaps_list.append((next_uncovered_ems, end_ems))
+        
+        return gaps_list
+    
+    # .................................................................................................................
+    # .................................................................................................................
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Functions
+
+# .....................................................................................................................
+
+def merge_coverage(coverage_list):
+    
+    '''
+    Helper function which sorts coverage ranges by start time and merges together overlapping (or touching)
+    ranges that don't expire. Expiring ranges are left as-is, since they need to expire separately
+    '''
+    
+    merged_list = []
+    for each_range in sorted(coverage_list, key = lambda coverage_range: coverage_range[0]):
+        range_start_ems, range_end_ems, expiry_time = each_range
+        if len(merged_list) > 0:
+            prev_start_ems, prev_end_ems, prev_expiry_time = merged_list[-1]
+            can_merge = (expiry_time is None) and (prev_expiry_time is None)
+            if can_merge and (range_start_ems <= prev_end_ems + 1):
+                merged_list[-1] = (prev_start_ems, max(prev_end_ems, range_end_ems), None)
+                continue
+        merged_list.append(each_range)
+    
+    return merged_list
+
+# .....................................................................................................................
+# .....................................................................................................................
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Demo
+
+if __name__ == "__main__":
+    
+    # Store a listing that is entirely in the past, then check which parts of a larger range are missing
+    example_cache = Ems_List_Cache()
+    example_cache.store("cam", 1000, 5000, [1000, 2000, 3000, 4000, 5000])
+    print(example_cache.get("cam", 1500, 4500))
+    print(example_cache.find_gaps("cam", 0, 9000))
+    print(example_cache.get_covered("cam", 0, 9000))
+    print(example_cache.get_stats())
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Scrap
+
+
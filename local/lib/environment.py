@@ -12,6 +12,8 @@ Created on Mon Sep 21 13:44:41 2020
 
 import os
 
+from tempfile import gettempdir
+
 
 # ---------------------------------------------------------------------------------------------------------------------
 #%% Script control
@@ -19,7 +21,7 @@ import os
 # .....................................................................................................................
 
 def using_spyder_ide():
-    
+
     return any("spyder" in os.environ[each_key].lower() for each_key in os.environ.keys())
 
 # .....................................................................................................................
@@ -61,9 +63,173 @@ def get_dbserver_port():
 
 # .....................................................................................................................
 
+def get_dbserver_pool_size():
+    return int(os.environ.get("DBSERVER_POOL_SIZE", 16))
+
+# .....................................................................................................................
+
+def get_dbserver_timeout_sec():
+    return float(os.environ.get("DBSERVER_TIMEOUT_SEC", 10))
+
+# .....................................................................................................................
+
 def get_default_fps():
     return int(os.environ.get("DEFAULT_FPS", 8))
 
+# .....................................................................................................................
+
+def get_max_replay_frames():
+    return int(os.environ.get("MAX_REPLAY_FRAMES", 0))
+
+# .....................................................................................................................
+
+def get_gif_palette_mode():
+    return os.environ.get("GIF_PALETTE_MODE", "global")
+
+# .....................................................................................................................
+
+def get_default_encoder_profile():
+    return os.environ.get("ENCODER_PROFILE", "default")
+
+# .....................................................................................................................
+
+def get_encoder_threads():
+    default_threads = max(1, (os.cpu_count() or 1) // max(1, get_render_max_concurrent()))
+    return int(os.environ.get("ENCODER_THREADS", default_threads))
+
+# .....................................................................................................................
+
+def get_segment_encoding_workers():
+    return int(os.environ.get("SEGMENT_ENCODING_WORKERS", 1))
+
+# .....................................................................................................................
+
+def get_segment_encoding_sec():
+    return float(os.environ.get("SEGMENT_ENCODING_SEC", 30))
+
+# .....................................................................................................................
+
+def get_segment_encoding_buffer_mb():
+    return float(os.environ.get("SEGMENT_ENCODING_BUFFER_MB", 256))
+
+# .....................................................................................................................
+
+def get_snapshot_batch_size():
+    return int(os.environ.get("SNAPSHOT_BATCH_SIZE", 32))
+
+# .....................................................................................................................
+
+def get_max_concurrent_downloads():
+    return int(os.environ.get("MAX_CONCURRENT_DOWNLOADS", 8))
+
+# .....................................................................................................................
+
+def get_read_ahead_frames():
+    return int(os.environ.get("READ_AHEAD_FRAMES", 16))
+
+# .....................................................................................................................
+
+def get_read_ahead_mb():
+    return float(os.environ.get("READ_AHEAD_MB", 128))
+
+# .....................................................................................................................
+
+def get_frame_processing_workers():
+    default_workers = os.cpu_count() or 1
+    return int(os.environ.get("FRAME_PROCESSING_WORKERS", default_workers))
+
+# .....................................................................................................................
+
+def get_snapshot_cache_size_mb():
+    return float(os.environ.get("SNAPSHOT_CACHE_SIZE_MB", 256))
+
+# .....................................................................................................................
+
+def get_ems_list_cache_max_entries():
+    return int(os.environ.get("EMS_LIST_CACHE_MAX_ENTRIES", 500000))
+
+# .....................................................................................................................
+
+def get_ems_list_live_window_sec():
+    return float(os.environ.get("EMS_LIST_LIVE_WINDOW_SEC", 60))
+
+# .....................................................................................................................
+
+def get_ems_list_live_ttl_sec():
+    return float(os.environ.get("EMS_LIST_LIVE_TTL_SEC", 2))
+
+# .....................................................................................................................
+
+def get_frame_cache_size_mb():
+    return float(os.environ.get("FRAME_CACHE_SIZE_MB", 512))
+
+# .....................................................................................................................
+
+def get_background_cache_size_mb():
+    return float(os.environ.get("BACKGROUND_CACHE_SIZE_MB", 64))
+
+# .....................................................................................................................
+
+def get_background_cache_window_sec():
+    return float(os.environ.get("BACKGROUND_CACHE_WINDOW_SEC", 0))
+
+# .....................................................................................................................
+
+def get_render_cache_folder():
+    default_folder_path = os.path.join(gettempdir(), "gifwrapper_render_cache")
+    return os.environ.get("RENDER_CACHE_FOLDER", default_folder_path)
+
+# .....................................................................................................................
+
+def get_render_cache_size_mb():
+    return float(os.environ.get("RENDER_CACHE_SIZE_MB", 1024))
+
+# .....................................................................................................................
+
+def get_render_max_concurrent():
+    return int(os.environ.get("RENDER_MAX_CONCURRENT", 4))
+
+# .....................................................................................................................
+
+def get_render_max_per_camera():
+    return int(os.environ.get("RENDER_MAX_PER_CAMERA", 2))
+
+# .....................................................................................................................
+
+def get_render_cost_budget_mpx():
+    return float(os.environ.get("RENDER_COST_BUDGET_MPX", 2000))
+
+# .....................................................................................................................
+
+def get_render_max_queued():
+    return int(os.environ.get("RENDER_MAX_QUEUED", 8))
+
+# .....................................................................................................................
+
+def get_render_queue_timeout_sec():
+    return float(os.environ.get("RENDER_QUEUE_TIMEOUT_SEC", 15))
+
+# .....................................................................................................................
+
+def get_render_job_workers():
+    return int(os.environ.get("RENDER_JOB_WORKERS", 2))
+
+# .....................................................................................................................
+
+def get_render_job_folder():
+    default_folder_path = os.path.join(gettempdir(), "gifwrapper_render_jobs")
+    return os.environ.get("RENDER_JOB_FOLDER", default_folder_path)
+
+# .....................................................................................................................
+
+def get_render_job_retention_sec():
+    return float(os.environ.get("RENDER_JOB_RETENTION_SEC", 900))
+
+# .....................................................................................................................
+
+def get_render_job_max_queued():
+    return int(os.environ.get("RENDER_JOB_MAX_QUEUED", 16))
+
 # .....................................................................................................................
 # .....................................................................................................................
 
@@ -72,7 +238,7 @@ def get_default_fps():
 #%% Demo
 
 if __name__ == "__main__":
-    
+
     print("", "Environment variables:", sep = "\n")
     print("")
     print("GIFSERVER_PROTOCOL", get_gifserver_protocol())
@@ -82,9 +248,45 @@ if __name__ == "__main__":
     print("DBSERVER_PROTOCOL", get_dbserver_protocol())
     print("DBSERVER_HOST", get_dbserver_host())
     print("DBSERVER_PORT", get_dbserver_port())
+    print("DBSERVER_POOL_SIZE", get_dbserver_pool_size())
+    print("DBSERVER_TIMEOUT_SEC", get_dbserver_timeout_sec())
     print("")
     print("DEFAULT_FPS", get_default_fps())
-    
+    print("MAX_REPLAY_FRAMES", get_max_replay_frames())
+    print("GIF_PALETTE_MODE", get_gif_palette_mode())
+    print("ENCODER_PROFILE", get_default_encoder_profile())
+    print("ENCODER_THREADS", get_encoder_threads())
+    print("SEGMENT_ENCODING_WORKERS", get_segment_encoding_workers())
+    print("SEGMENT_ENCODING_SEC", get_segment_encoding_sec())
+    print("SEGMENT_ENCODING_BUFFER_MB", get_segment_encoding_buffer_mb())
+    print("")
+    print("SNAPSHOT_BATCH_SIZE", get_snapshot_batch_size())
+    print("MAX_CONCURRENT_DOWNLOADS", get_max_concurrent_downloads())
+    print("READ_AHEAD_FRAMES", get_read_ahead_frames())
+    print("READ_AHEAD_MB", get_read_ahead_mb())
+    print("FRAME_PROCESSING_WORKERS", get_frame_processing_workers())
+    print("")
+    print("SNAPSHOT_CACHE_SIZE_MB", get_snapshot_cache_size_mb())
+    print("EMS_LIST_CACHE_MAX_ENTRIES", get_ems_list_cache_max_entries())
+    print("EMS_LIST_LIVE_WINDOW_SEC", get_ems_list_live_window_sec())
+    print("EMS_LIST_LIVE_TTL_SEC", get_ems_list_live_ttl_sec())
+    print("FRAME_CACHE_SIZE_MB", get_frame_cache_size_mb())
+    print("BACKGROUND_CACHE_SIZE_MB", get_background_cache_size_mb())
+    print("BACKGROUND_CACHE_WINDOW_SEC", get_background_cache_window_sec())
+    print("RENDER_CACHE_FOLDER", get_render_cache_folder())
+    print("RENDER_CACHE_SIZE_MB", get_render_cache_size_mb())
+    print("")
+    print("RENDER_MAX_CONCURRENT", get_render_max_concurrent())
+    print("RENDER_MAX_PER_CAMERA", get_render_max_per_camera())
+    print("RENDER_COST_BUDGET_MPX", get_render_cost_budget_mpx())
+    print("RENDER_MAX_QUEUED", get_render_max_queued())
+    print("RENDER_QUEUE_TIMEOUT_SEC", get_render_queue_timeout_sec())
+    print("")
+    print("RENDER_JOB_WORKERS", get_render_job_workers())
+    print("RENDER_JOB_FOLDER", get_render_job_folder())
+    print("RENDER_JOB_RETENTION_SEC", get_render_job_retention_sec())
+    print("RENDER_JOB_MAX_QUEUED", get_render_job_max_queued())
+
 
 
 # ---------------------------------------------------------------------------------------------------------------------
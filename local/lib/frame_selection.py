@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 15:20:06 2026
+
+@author: eo
+"""
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Imports
+
+import numpy as np
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Selection functions
+
+# .....................................................................................................................
+
+def select_evenly_spaced_ems(snapshot_ems_list, max_frames, keep_gap_brackets = False, gap_factor = 10):
+    
+    '''
+    Function which picks a subset of snapshot times that are (roughly) evenly spread out in time,
+    so that long time ranges can be rendered with a limited number of frames.
+    The first & last snapshots are always kept. Input times are assumed to be sorted!
+    
+    If 'keep_gap_brackets' is True, the snapshots on either side of large gaps in time are kept as well,
+    so that the start/end of activity isn't skipped over. A gap is considered 'large' if it's longer than
+    'gap_factor' times the typical (median) spacing between snapshots. Bracketing snapshots use up
+    at most half of the frame budget, with the largest gaps being prioritized
+    
+    Returns:
+        selected_ems_list (sorted, never longer than max_frames)
+    '''
+    
+    # Don't do anything if we're already within the frame budget
+    num_snapshots = len(snapshot_ems_list)
+    max_frames = max(1, int(max_frames))
+    if num_snapshots <= max_frames:
+        return list(snapshot_ems_list)
+    
+    # Handle silly case where only a single frame is allowed
+    ems_array = np.int64(snapshot_ems_list)
+    if max_frames == 1:
+        return [int(ems_array[-1])]
+    
+    # Find snapshots on either side of large gaps, if needed
+    keep_idxs = np.int64([])
+    if keep_gap_brackets:
+        keep_idxs = _find_gap_bracket_indices(ems_array, max_frames // 2, gap_factor)
+    
+    # Fill the remaining frame budget with snapshots nearest to evenly spaced target times
+    num_even_frames = max(2, max_frames - len(keep_idxs))
+    target_ems_array = np.linspace(ems_array[0], ems_array[-1], num_even_frames)
+    even_idxs = _find_nearest_indices(ems_array, target_ems_array)
+    
+    # Combine selections (duplicates are removed, since targets within gaps will share the same nearest snapshot)
+    selected_idxs = np.union1d(even_idxs, keep_idxs)
+    
+    # Use up any leftover frame budget (due to duplicates) with snapshots evenly spread out by index
+    num_leftover = max_frames - len(selected_idxs)
+    if num_leftover > 0:
+        unused_idxs = np.setdiff1d(np.arange(num_snapshots), selected_idxs)
+        fill_idxs = unused_idxs[np.unique(np.linspace(0, len(unused_idxs) - 1, num_leftover).round().astype(np.int64))]
+        selected_idxs = np.union1d(selected_idxs, fill_idxs)
+    
+    return ems_array[selected_idxs].tolist()
+
+# .....................................................................................................................
+
+def _find_nearest_indices(sorted_ems_array, target_ems_array):
+    
+    ''' Helper used to find the index of the snapshot nearest to each target time (vectorized) '''
+    
+    # Find the insertion point of each target, then pick whichever neighbour is closest
+    right_idxs = np.clip(np.searchsorted(sorted_ems_array, target_ems_array), 1, len(sorted_ems_array) - 1)
+    left_idxs = right_idxs - 1
+    left_dist = np.abs(target_ems_array - sorted_ems_array[left_idxs])
+    right_dist = np.abs(sorted_ems_array[right_idxs] - target_ems_array)
+    
+    return np.where(left_dist <= right_dist, left_idxs, right_idxs)
+
+# .....................................................................................................................
+
+def _find_gap_bracket_indices(sorted_ems_array, max_indices, gap_factor):
+    
+    ''' Helper used to find the indices of snapshots on either side of (the largest) unusually long time gaps '''
+    
+    # Find gaps that are much larger than typical spacing
+    ems_gaps = np.diff(sorted_ems_array)
+    typical_gap = max(1, np.median(ems_gaps))
+    large_gap_idxs = np.flatnonzero(ems_gaps > (gap_factor * typical_gap))
+    
+    # Keep only the largest gaps, if there are too many to fit
+    max_gaps = max_indices // 2
+    if len(large_gap_idxs) > max_gaps:
+        largest_first_order = np.argsort(ems_gaps[large_gap_idxs])[::-1]
+        large_gap_idxs = large_gap_idxs[largest_first_order[:max_gaps]]
+    
+    # Each gap is bracketed by the snapshot before & after it
+    return np.union1d(large_gap_idxs, large_gap_idxs + 1)
+
+# .....................................................................................................................
+# .....................................................................................................................
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Demo
+
+if __name__ == "__main__":
+    
+    # Example of a time range with a long gap in the middle
+    example_ems_list = list(range(0, 100000, 1000)) + list(range(900000, 1000000, 1000))
+    print(select_evenly_spaced_ems(example_ems_list, 10))
+    print(select_evenly_spaced_ems(example_ems_list, 10, keep_gap_brackets = True))
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Scrap
+
+
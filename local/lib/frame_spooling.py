@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 17:48:05 2026
+
+@author: eo
+"""
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Imports
+
+import os
+import base64
+import binascii
+
+from threading import Lock
+from tempfile import TemporaryFile
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Define classes
+
+class Jpeg_Frame_Spool:
+    
+    '''
+    Class used to store (compressed) jpeg frames in a temporary file, so that large numbers of frames
+    don't need to be held in memory while waiting to be rendered.
+    Frames are read back (in order) by iterating over the spool. Each iterator reads independently,
+    so the spool can be iterated more than once, even from different threads.
+    The temporary file has no name on disk and is removed as soon as the spool is closed or deleted
+    '''
+    
+    # .................................................................................................................
+    
+    def __init__(self, folder_path = None):
+        
+        # Allocate storage for frame data
+        self._file = TemporaryFile(dir = folder_path)
+        self._lock = Lock()
+        self._frame_offsets_list = []
+        self._write_offset = 0
+    
+    # .................................................................................................................
+    
+    def __repr__(self):
+        return "Jpeg_Frame_Spool ({} frames, {:.1f} MB)".format(len(self), self._write_offset / 1_000_000)
+    
+    # .................................................................................................................
+    
+    def __len__(self):
+        return len(self._frame_offsets_list)
+    
+    # .................................................................................................................
+    
+    def __iter__(self):
+        
+        # Read frames directly by offset, so that iterating doesn't interfere with writing or other iterators
+        file_descriptor = self._file.fileno()
+        for frame_idx in range(len(self)):
+            frame_offset, frame_size_bytes = self._frame_offsets_list[frame_idx]
+            yield os.pread(file_descriptor, frame_size_bytes, frame_offset)
+        
+        return
+    
+    # .................................................................................................................
+    
+    def append(self, jpeg_bytes):
+        
+        ''' Function used to add a frame to the end of the spool '''
+        
+        with self._lock:
+            frame_size_bytes = len(jpeg_bytes)
+            os.pwrite(self._file.fileno(), jpeg_bytes, self._write_offset)
+            self._frame_offsets_list.append((self._write_offset, frame_size_bytes))
+            self._write_offset += frame_size_bytes
+    
+    # .................................................................................................................
+    
+    def close(self):
+        
+        ''' Function used to remove the spooled data. The spool can't be used after closing! '''
+        
+        self._file.close()
+    
+    # .................................................................................................................
+    # .................................................................................................................
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Functions
+
+# .....................................................................................................................
+
+def decode_b64_jpg(b64_jpg_data):
+    
+    '''
+    Function which converts a base64 encoded jpg (as a string or bytes) into (compressed) jpeg data
+    The data may include an encoding prefix (e.g. 'data:image/jpeg;base64,'), which is removed.
+    Raises a ValueError if the data isn't valid base64 (any non-base64 characters count as invalid).
+    Note that this doesn't check that the decoded data is a jpeg, see check_jpeg_bytes
+    '''
+    
+    # Non-ascii data can't be base64, so treat it as bad data
+    if isinstance(b64_jpg_data, str):
+        try:
+            b64_jpg_data = b64_jpg_data.encode("ascii")
+        except UnicodeEncodeError:
+            raise ValueError("Bad base64 data: found non-ascii characters")
+    
+    # Remove encoding prefix data
+    base64_data = b64_jpg_data.rpartition(b",")[2]
+    
+    try:
+        jpeg_bytes = base64.b64decode(base64_data, validate = True)
+    except binascii.Error as err:
+        raise ValueError("Bad base64 data: {}".format(err))
+    
+    return jpeg_bytes
+
+# .....................................................................................................................
+
+def spool_length_prefixed_jpegs(byte_stream, jpeg_frames_spool, max_frame_size_mb = 64):
+    
+    '''
+    Function which reads a sequence of jpegs from a (binary) stream into a spool, one frame at a time
+    Each frame is expected as a 4-byte (big-endian, unsigned) frame size, followed by the jpeg data itself
+    Raises a ValueError if the data doesn't follow this format. Returns the spool
+    '''
+    
+    max_frame_size_bytes = int(max_frame_size_mb * 1_000_000)
+    while True:
+        
+        # Stop when there are no more frames
+        frame_size_bytes = read_exact_bytes(byte_stream, 4, allow_end_of_stream = True)
+        if frame_size_bytes is None:
+            break
+        
+        # Make sure the frame size is sensible, since a bad size would otherwise mess up all following frames
+        frame_size = int.from_bytes(frame_size_bytes, "big")
+        if not (0 < frame_size <= max_frame_size_bytes):
+            raise ValueError("Bad frame size (index {}): {} bytes".format(len(jpeg_frames_spool), frame_size))
+        
+        jpeg_bytes = read_exact_bytes(byte_stream, frame_size)
+        jpeg_frames_spool.append(check_jpeg_bytes(jpeg_bytes, len(jpeg_frames_spool)))
+    
+    return jpeg_frames_spool
+
+# .....................................................................................................................
+
+def read_exact_bytes(byte_stream, num_bytes, allow_end_of_stream = False):
+    
+    '''
+    Helper used to read an exact number of bytes from a stream (which may return less data than requested)
+    If allowed, returns None if the stream has already ended, otherwise raises a ValueError on missing data
+    '''
+    
+    data_chunks_list = []
+    bytes_remaining = num_bytes
+    while bytes_remaining > 0:
+        data_chunk = byte_stream.read(bytes_remaining)
+        if not data_chunk:
+            if allow_end_of_stream and bytes_remaining == num_bytes:
+                return None
+            raise ValueError("Unexpected end of data (missing {} bytes)".format(bytes_remaining))
+        data_chunks_list.append(data_chunk)
+        bytes_remaining -= len(data_chunk)
+    
+    return b"".join(data_chunks_list)
+
+# .....................................................................................................................
+
+def check_jpeg_bytes(jpeg_bytes, frame_index):
+    
+    ''' Helper used to make sure frame data starts like a jpeg. Raises a ValueError if not, returns the data if ok '''
+    
+    if not jpeg_bytes.startswith(JPEG_START_BYTES):
+        raise ValueError("Frame data is not a jpeg (index {})".format(frame_index))
+    
+    return jpeg_bytes
+
+# .....................................................................................................................
+# .....................................................................................................................
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Set up globals
+
+# All jpegs start with a 'start of image' marker
+JPEG_START_BYTES = b"\xff\xd8"
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Demo
+
+if __name__ == "__main__":
+    
+    pass
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Scrap
+
+
@@ -11,6 +11,7 @@ Created on Mon Sep 21 14:12:34 2020
 #%% Imports
 
 import cv2
+import numpy as np
 
 # ---------------------------------------------------------------------------------------------------------------------
 # ---------------------------------------------------------------------------------------------------------------------
@@ -45,10 +46,12 @@ def apply_ghosting(background_image, frame_to_ghost,
     if not enable_ghosting:
         return frame_to_ghost
     
-    # Get frame sizing so we can scale the background image appropriately
+    # Get frame sizing so we can scale the background image appropriately (unless it's already been scaled)
     frame_height, frame_width = frame_to_ghost.shape[0:2]
     frame_wh = (frame_width, frame_height)
-    scaled_bg = cv2.resize(background_image, dsize = frame_wh, interpolation = cv2.INTER_AREA)
+    scaled_bg = background_image
+    if background_image.shape[0:2] != (frame_height, frame_width):
+        scaled_bg = cv2.resize(background_image, dsize = frame_wh, interpolation = cv2.INTER_AREA)
     
     # Get frame difference
     frame_difference_3ch = cv2.absdiff(scaled_bg, frame_to_ghost)
@@ -70,6 +73,72 @@ def apply_ghosting(background_image, frame_to_ghost,
     
     return ghosted_frame
 
+# .....................................................................................................................
+
+def apply_ghosting_batch(background_image, frame_stack,
+                         brightness_scaling = 1.5, blur_size = 2, pixelation_factor = 3,
+                         enable_ghosting = True, output_stack = None,
+                         **kwargs):
+    
+    '''
+    Function which applies ghosting to a stack of frames (shape: N x H x W x 3), all sharing the same background
+    Gives the same results as calling 'apply_ghosting' on each frame, but re-uses the same working memory
+    for every frame and writes directly into a single output stack, to avoid repeated allocations
+    An existing output stack (same shape as the frame stack) can be provided, otherwise a new one is created
+    '''
+    
+    # Bail if we're not actually ghosting
+    if not enable_ghosting:
+        return frame_stack
+    
+    # Get frame sizing so we can scale the background image appropriately (unless it's already been scaled)
+    frame_height, frame_width = frame_stack.shape[1:3]
+    frame_wh = (frame_width, frame_height)
+    scaled_bg = background_image
+    if background_image.shape[0:2] != (frame_height, frame_width):
+        scaled_bg = cv2.resize(background_image, dsize = frame_wh, interpolation = cv2.INTER_AREA)
+    
+    # Allocate the output, if needed
+    if output_stack is None:
+        output_stack = np.empty_like(frame_stack)
+    
+    # Set up working memory, which is re-used for every frame
+    # -> Pixelation buffer is left empty, since opencv figures out the shrunk sizing on the first frame
+    difference_3ch = np.empty((frame_height, frame_width, 3), dtype = np.uint8)
+    difference_1ch = np.empty((frame_height, frame_width), dtype = np.uint8)
+    processed_1ch = np.empty((frame_height, frame_width), dtype = np.uint8)
+    shrunk_1ch = None
+    
+    # Pre-calculate ghosting settings that don't change per frame
+    blur_kernel_size = (1 + (2 * blur_size), 1 + (2 * blur_size))
+    pixel_scale_factor = 1 / (1 + pixelation_factor) if pixelation_factor > 0 else None
+    
+    for frame_idx, each_frame in enumerate(frame_stack):
+        
+        # Get frame difference
+        cv2.absdiff(scaled_bg, each_frame, dst = difference_3ch)
+        cv2.cvtColor(difference_3ch, cv2.COLOR_BGR2GRAY, dst = difference_1ch)
+        ghost_1ch = difference_1ch
+        
+        # If needed, blur to further 'censor' the ghosted result
+        if blur_size > 0:
+            cv2.blur(ghost_1ch, blur_kernel_size, dst = processed_1ch)
+            ghost_1ch = processed_1ch
+        
+        # Pixelate the ghosted component if needed (shrink then scale back up, see 'pixelate' function)
+        if pixel_scale_factor is not None:
+            shrunk_1ch = cv2.resize(ghost_1ch, dsize = None, dst = shrunk_1ch,
+                                    fx = pixel_scale_factor, fy = pixel_scale_factor,
+                                    interpolation = cv2.INTER_AREA)
+            cv2.resize(shrunk_1ch, dsize = frame_wh, dst = difference_1ch, interpolation = cv2.INTER_NEAREST)
+            ghost_1ch = difference_1ch
+        
+        # Combine difference with background, writing directly into the output
+        cv2.cvtColor(ghost_1ch, cv2.COLOR_GRAY2BGR, dst = difference_3ch)
+        cv2.addWeighted(scaled_bg, 1.0, difference_3ch, brightness_scaling, 0.0, dst = output_stack[frame_idx])
+    
+    return output_stack
+
 # .....................................................................................................................
 # .....................................................................................................................
 
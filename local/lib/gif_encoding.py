@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 18:02:33 2026
+
+@author: eo
+"""
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Imports
+
+import os
+import cv2
+import numpy as np
+
+from PIL import Image
+from PIL.GifImagePlugin import getheader, getdata
+
+from local.lib.image_read_write import image_bytes_to_pixels, get_jpeg_dimensions, pick_jpeg_reduction_factor
+from local.lib.video_encoding import is_jpeg_data, get_frame_data_wh
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Define classes
+
+class Animated_GIF_Writer:
+    
+    '''
+    Class used to encode animated GIFs, one frame at a time, without holding every frame in memory
+    Has the same interface as the FFmpeg_Video_Writer, so the two can be used interchangeably
+    (though GIFs can't be streamed, they always need an output path)
+    
+    Frames are reduced to a (255 color) palette, which can either be shared by all frames ('global'),
+    built from the first few frames, or built separately for each frame ('per_frame'), which gives
+    better colors at the cost of a larger file.
+    
+    Only the parts of each frame that changed (compared to what is already displayed) are stored.
+    Unchanged pixels are marked as transparent & each frame is cropped to the region that changed,
+    so that static backgrounds are only stored once
+    '''
+    
+    # .................................................................................................................
+    
+    def __init__(self, output_path, frame_rate, output_wh = None, palette_mode = "global",
+                 palette_sample_frames = 8, delta_tolerance = 8):
+        
+        # Store encoding settings
+        self.output_path = output_path
+        self.frame_rate = frame_rate
+        self.output_wh = None if output_wh is None else tuple(output_wh)
+        self.palette_mode = palette_mode
+        self.palette_sample_frames = max(1, int(palette_sample_frames))
+        self.delta_tolerance = delta_tolerance
+        
+        # Allocate storage for encoding state, which is set up once we know the frame sizing
+        self.frame_wh = None
+        self.frame_count = 0
+        self._file = None
+        self._palette_rgb = None
+        self._code_to_index_lut = None
+        self._prev_shown_rgb = None
+        self._prev_shown_error = None
+        self._pending_frame = None
+        self._sample_frames_list = []
+        self._frames_written = 0
+    
+    # .................................................................................................................
+    
+    def __enter__(self):
+        return self
+    
+    # .................................................................................................................
+    
+    def __exit__(self, exception_type, exception_value, traceback):
+        
+        # Don't bother finishing the file if something went wrong while writing frames
+        if exception_type is not None:
+            self.kill()
+            return
+        
+        self.close()
+    
+    # .................................................................................................................
+    
+    def write_frame(self, frame_data):
+        
+        '''
+        Function used to add a frame to the output animation
+        Frame data can be a BGR uint8 image (i.e. opencv format) or jpeg data (bytes or a 1D uint8 array)
+        '''
+        
+        # Figure out the output sizing from the first frame
+        if self.frame_wh is None:
+            self.frame_wh = self.output_wh if self.output_wh is not None else get_frame_data_wh(frame_data)
+        
+        # Decode jpeg data (at reduced size if possible) and make sure all frames share the same sizing
+        if is_jpeg_data(frame_data):
+            reduction_factor = pick_jpeg_reduction_factor(get_jpeg_dimensions(frame_data), self.frame_wh)
+            frame_data = image_bytes_to_pixels(frame_data, reduction_factor)
+        frame_height, frame_width = frame_data.shape[0:2]
+        if (frame_width, frame_height) != self.frame_wh:
+            frame_data = cv2.resize(frame_data, dsize = self.frame_wh, interpolation = cv2.INTER_AREA)
+        self.frame_count += 1
+        
+        # Hold on to the first few frames when using a global palette, so the palette covers more than 1 frame
+        if self._palette_rgb is None and self.palette_mode == "global":
+            self._sample_frames_list.append(frame_data)
+            if len(self._sample_frames_list) >= self.palette_sample_frames:
+                self._flush_sample_frames()
+            return
+        
+        self._encode_frame(frame_data)
+    
+    # .................................................................................................................
+    
+    def close(self):
+        
+        ''' Function used to finish encoding. Returns the path to the output file '''
+        
+        # Bail if we never got any frames, since there won't be an animation!
+        if self.frame_count == 0:
+            raise ValueError("No frames were provided for encoding!")
+        
+        # Write out anything we were still holding on to, then end the file
+        self._flush_sample_frames()
+        self._write_pending_frame()
+        self._file.write(b";")
+        self._file.close()
+        
+        return self.output_path
+    
+    # .................................................................................................................
+    
+    def kill(self):
+        
+        ''' Function used to shut down the encoder without finishing the output '''
+        
+        if self._file is not None:
+            self._file.close()
+            try:
+                os.remove(self.output_path)
+            except FileNotFoundError:
+                pass
+    
+    # .................................................................................................................
+    
+    def _flush_sample_frames(self):
+        
+        ''' Helper used to build the global palette from the (held) sample frames, then encode them '''
+        
+        if len(self._sample_frames_list) == 0:
+            return
+        
+        self._palette_rgb = build_palette(self._sample_frames_list)
+        self._code_to_index_lut = np.full(32768, -1, dtype = np.int16)
+        sample_frames_list, self._sample_frames_list = self._sample_frames_list, []
+        for each_frame in sample_frames_list:
+            self._encode_frame(each_frame)
+    
+    # .................................................................................................................
+    
+    def _encode_frame(self, frame_bgr):
+        
+        ''' Helper used to reduce a frame to palette indices & figure out which parts need to be stored '''
+        
+        # Set up storage for what is being displayed on the first frame (where everything is new)
+        frame_rgb = frame_bgr[:, :, ::-1].astype(np.int16)
+        is_first_frame = (self._prev_shown_rgb is None)
+        if is_first_frame:
+            self._prev_shown_rgb = np.zeros_like(frame_rgb)
+            self._prev_shown_error = np.full(frame_rgb.shape[0:2], -1 - self.delta_tolerance, dtype = np.int16)
+        
+        # Find pixels that differ from what is being displayed by more than they did when they were drawn
+        # -> Comparing against the original (palette) error means that pixels which can't be represented well
+        #    by the palette aren't considered to be changing on every frame
+        display_error = np.max(np.abs(frame_rgb - self._prev_shown_rgb), axis = 2)
+        changed_mask = display_error > (self._prev_shown_error + self.delta_tolerance)
+        if not np.any(changed_mask):
+            self._pending_frame[-1] += 1
+            return
+        
+        # Convert the region that changed to palette indices (using a palette built just for it, if needed)
+        y1, y2, x1, x2 = get_mask_bounds(changed_mask)
+        crop_bgr = frame_bgr[y1:y2, x1:x2]
+        if self.palette_mode == "global":
+            palette_rgb = self._palette_rgb
+            crop_idxs = map_to_palette(crop_bgr, palette_rgb, self._code_to_index_lut)
+        else:
+            palette_rgb = build_palette([crop_bgr])
+            crop_idxs = map_to_palette(crop_bgr, palette_rgb)
+        crop_shown_rgb = np.int16(palette_rgb[crop_idxs])
+        
+        # Pixels that end up with the same color as before don't need to be stored either
+        crop_changed_mask = changed_mask[y1:y2, x1:x2]
+        if not is_first_frame:
+            crop_changed_mask &= np.any(crop_shown_rgb != self._prev_shown_rgb[y1:y2, x1:x2], axis = 2)
+        
+        # If nothing changed, just show the previous frame for longer
+        if not np.any(crop_changed_mask):
+            self._pending_frame[-1] += 1
+            return
+        
+        # Keep track of what is being displayed (and how far off it is), for comparing to later frames
+        crop_error = np.max(np.abs(frame_rgb[y1:y2, x1:x2] - crop_shown_rgb), axis = 2)
+        self._prev_shown_rgb[y1:y2, x1:x2][crop_changed_mask] = crop_shown_rgb[crop_changed_mask]
+        self._prev_shown_error[y1:y2, x1:x2][crop_changed_mask] = crop_error[crop_changed_mask]
+        
+        # Trim down to the pixels that are actually stored, with unchanged pixels marked as transparent
+        ty1, ty2, tx1, tx2 = get_mask_bounds(crop_changed_mask)
+        crop_idxs[~crop_changed_mask] = TRANSPARENT_INDEX
+        crop_idxs = crop_idxs[ty1:ty2, tx1:tx2]
+        offset_xy = (int(x1 + tx1), int(y1 + ty1))
+        
+        # Write out the previous frame (now that we know how long it's displayed for) and hold on to this one
+        self._write_pending_frame()
+        self._pending_frame = [crop_idxs, palette_rgb, offset_xy, 1]
+    
+    # .................................................................................................................
+    
+    def _write_pending_frame(self):
+        
+        ''' Helper used to write out the (held) frame data, once we know how long it will be displayed for '''
+        
+        if self._pending_frame is None:
+            return
+        palette_idxs, palette_rgb, offset_xy, num_frames = self._pending_frame
+        self._pending_frame = None
+        
+        # Convert to a palette image for writing
+        frame_height, frame_width = palette_idxs.shape
+        frame_image = Image.frombytes("P", (frame_width, frame_height), np.ascontiguousarray(palette_idxs).tobytes())
+        frame_image.putpalette(get_palette_bytes(palette_rgb))
+        
+        # Write the file header on the first frame (GIFs need a 'global' palette, even when using local palettes)
+        if self._file is None:
+            self._file = open(self.output_path, "wb")
+            header_image = Image.new("P", self.frame_wh)
+            header_image.putpalette(get_palette_bytes(palette_rgb))
+            header_fragments, _ = getheader(header_image, info = {"loop": 0, "transparency": TRANSPARENT_INDEX})
+            self._file.write(b"".join(header_fragments))
+        
+        # GIF timing is in 1/100ths of a second, so figure out timing by rounding the start/end time of the frame
+        # -> This avoids drift from rounding every frame the same way
+        start_cs = int(round(100 * self._frames_written / self.frame_rate))
+        end_cs = int(round(100 * (self._frames_written + num_frames) / self.frame_rate))
+        self._frames_written += num_frames
+        
+        # Write frame data (pixels are left in place, so later frames are drawn on top of earlier frames)
+        frame_fragments = getdata(frame_image, offset_xy,
+                                  duration = 10 * max(1, end_cs - start_cs),
+                                  disposal = 1,
+                                  transparency = TRANSPARENT_INDEX,
+                                  include_color_table = (self.palette_mode != "global"))
+        self._file.write(b"".join(frame_fragments))
+    
+    # .................................................................................................................
+    # .................................................................................................................
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Palette functions
+
+# .....................................................................................................................
+
+def get_color_codes(frame_bgr):
+    
+    ''' Helper function which reduces colors to 5-bits per channel, packed into a single integer code per pixel '''
+    
+    frame_5bit = (frame_bgr >> 3).astype(np.int32)
+    
+    return (frame_5bit[:, :, 2] << 10) | (frame_5bit[:, :, 1] << 5) | frame_5bit[:, :, 0]
+
+# .....................................................................................................................
+
+def color_codes_to_rgb(color_codes):
+    
+    ''' Helper function which converts packed color codes back to (the center of each bin in) rgb values '''
+    
+    red = (color_codes >> 10) & 31
+    green = (color_codes >> 5) & 31
+    blue = color_codes & 31
+    
+    return (np.stack((red, green, blue), axis = -1) << 3) + 4
+
+# .....................................................................................................................
+
+def find_nearest_colors(colors_rgb, palette_rgb, chunk_size = 8192):
+    
+    '''
+    Function which finds the index of the nearest palette entry for every given color (vectorized)
+    Uses the expanded form of the squared distance: |c|^2 - 2*c.p + |p|^2, so the bulk of the work is
+    a single matrix multiply. The |c|^2 term is left out, since it doesn't change which entry is nearest
+    '''
+    
+    palette_float = np.float32(palette_rgb)
+    palette_sq_norms = np.sum(np.square(palette_float), axis = 1)
+    nearest_idxs = np.empty(len(colors_rgb), dtype = np.int64)
+    for chunk_start in range(0, len(colors_rgb), chunk_size):
+        chunk_float = np.float32(colors_rgb[chunk_start:(chunk_start + chunk_size)])
+        partial_sq_distances = palette_sq_norms[None, :] - 2 * (chunk_float @ palette_float.T)
+        nearest_idxs[chunk_start:(chunk_start + chunk_size)] = np.argmin(partial_sq_distances, axis = 1)
+    
+    return nearest_idxs
+
+# .....................................................................................................................
+
+def build_palette(frames_bgr_list, max_colors = 255, num_iterations = 4):
+    
+    '''
+    Function which builds a color palette that best represents the given frames
+    Colors are binned (5-bits per channel) into a histogram, the most common colors are used
+    as a starting palette, which is then refined with a few rounds of (histogram-weighted) k-means
+    Returns:
+        palette_rgb (N x 3 uint8 array, with N <= max_colors)
+    '''
+    
+    # Count how often each (reduced) color appears across all frames
+    color_counts = np.zeros(32768, dtype = np.int64)
+    for each_frame in frames_bgr_list:
+        color_counts += np.bincount(get_color_codes(each_frame).ravel(), minlength = 32768)
+    used_codes = np.flatnonzero(color_counts)
+    used_weights = np.float32(color_counts[used_codes])
+    used_colors_rgb = np.float32(color_codes_to_rgb(used_codes))
+    
+    # No need to do anything fancy if there are only a few colors
+    if len(used_codes) <= max_colors:
+        return np.uint8(used_colors_rgb)
+    
+    # Start with the most common colors, then move each palette color to the (weighted) center of its members
+    palette_rgb = used_colors_rgb[np.argsort(used_weights)[::-1][:max_colors]]
+    for _ in range(num_iterations):
+        nearest_idxs = find_nearest_colors(used_colors_rgb, palette_rgb)
+        member_weights = np.bincount(nearest_idxs, weights = used_weights, minlength = max_colors)
+        has_members = (member_weights > 0)
+        for ch_idx in range(3):
+            channel_sums = np.bincount(nearest_idxs, weights = used_weights * used_colors_rgb[:, ch_idx],
+                                       minlength = max_colors)
+            palette_rgb[has_members, ch_idx] = channel_sums[has_members] / member_weights[has_members]
+    
+    return np.uint8(np.clip(np.round(palette_rgb), 0, 255))
+
+# .....................................................................................................................
+
+def map_to_palette(frame_bgr, palette_rgb, code_to_index_lut = None):
+    
+    '''
+    Function which converts a frame to palette indices (using the nearest palette color for each pixel)
+    Only the colors that are actually used in the frame are matched to the palette, using a lookup table
+    
+    If a lookup table is given (int16, with -1 for unknown entries), it is filled in & re-used,
+    so that repeated calls with the same palette only need to match colors that haven't been seen before
+    '''
+    
+    # Start a new lookup table if we weren't given one
+    if code_to_index_lut is None:
+        code_to_index_lut = np.full(32768, -1, dtype = np.int16)
+    
+    # Find the nearest palette entry for each (reduced) color in the frame that isn't already in the table
+    color_codes = get_color_codes(frame_bgr)
+    used_codes = np.flatnonzero(np.bincount(color_codes.ravel(), minlength = 32768))
+    new_codes = used_codes[code_to_index_lut[used_codes] < 0]
+    if len(new_codes) > 0:
+        code_to_index_lut[new_codes] = find_nearest_colors(color_codes_to_rgb(new_codes), palette_rgb)
+    
+    return code_to_index_lut[color_codes].astype(np.uint8)
+
+# .....................................................................................................................
+
+def get_mask_bounds(mask):
+    
+    '''
+    Helper function which finds the bounding box of the 'True' region of a mask
+    Returns:
+        y1, y2, x1, x2 (or the full mask bounds, if nothing is 'True')
+    '''
+    
+    row_idxs = np.flatnonzero(np.any(mask, axis = 1))
+    col_idxs = np.flatnonzero(np.any(mask, axis = 0))
+    if len(row_idxs) == 0:
+        mask_height, mask_width = mask.shape
+        return 0, mask_height, 0, mask_width
+    
+    return row_idxs[0], row_idxs[-1] + 1, col_idxs[0], col_idxs[-1] + 1
+
+# .....................................................................................................................
+
+def get_palette_bytes(palette_rgb):
+    
+    ''' Helper function which converts a palette into the (full, 256 color) format needed for writing GIFs '''
+    
+    full_palette_rgb = np.zeros((256, 3), dtype = np.uint8)
+    full_palette_rgb[0:len(palette_rgb)] = palette_rgb
+    
+    return full_palette_rgb.tobytes()
+
+# .....................................................................................................................
+# .....................................................................................................................
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Set up globals
+
+# Palette index reserved for marking unchanged (i.e. transparent) pixels. Palettes never use more than 255 colors
+TRANSPARENT_INDEX = 255
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Demo
+
+if __name__ == "__main__":
+    
+    pass
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Scrap
+
+
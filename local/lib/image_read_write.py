@@ -20,12 +20,17 @@ import numpy as np
 
 # .....................................................................................................................
 
-def image_bytes_to_pixels(image_bytes):
+def image_bytes_to_pixels(image_bytes, reduction_factor = 1):
     
-    ''' Helper function which convert raw image byte data to an actual image (represented as pixels) '''
+    '''
+    Helper function which convert raw image byte data to an actual image (represented as pixels)
+    A reduction factor of 2, 4 or 8 can be given to decode the image at a reduced size, which is
+    much faster than decoding at full size and then scaling down (jpegs can skip most of the decoding work)
+    '''
     
+    decode_flag = JPEG_REDUCTION_FLAGS_LUT.get(reduction_factor, cv2.IMREAD_COLOR)
     image_array = np.frombuffer(image_bytes, dtype = np.uint8)
-    image_pixel_data = cv2.imdecode(image_array, cv2.IMREAD_COLOR)
+    image_pixel_data = cv2.imdecode(image_array, decode_flag)
     
     return image_pixel_data
 
@@ -42,6 +47,73 @@ def image_pixels_to_bytes(image_pixel_data, jpg_quality_0_to_100 = 50):
 
 # .....................................................................................................................
 
+def pick_jpeg_reduction_factor(source_wh, target_wh):
+    
+    '''
+    Helper function which picks the largest reduction factor (1, 2, 4 or 8) that can be used when
+    decoding an image of the given source size, while still being at least as large as the target size
+    '''
+    
+    # No reduction if we don't know the sizing
+    if (source_wh is None) or (target_wh is None):
+        return 1
+    
+    source_width, source_height = source_wh
+    target_width, target_height = target_wh
+    for each_factor in (8, 4, 2):
+        reduced_is_big_enough = (source_width // each_factor >= target_width) \
+                                and (source_height // each_factor >= target_height)
+        if reduced_is_big_enough:
+            return each_factor
+    
+    return 1
+
+# .....................................................................................................................
+
+def get_jpeg_dimensions(image_bytes):
+    
+    '''
+    Helper function which reads the (width, height) of a jpeg image from its header, without decoding the image
+    Returns None if the data doesn't look like a (readable) jpeg
+    '''
+    
+    # Only the header is needed (also converts numpy data to bytes, for easier parsing)
+    image_bytes = bytes(image_bytes[0:262144])
+    
+    # Bail if the data doesn't start with a jpeg start-of-image marker
+    if image_bytes[0:2] != b"\xff\xd8":
+        return None
+    
+    # Skip over header segments until we find the start-of-frame segment, which holds the image sizing
+    # -> Start-of-frame markers are 0xC0 to 0xCF, except for 0xC4 (huffman), 0xC8 (reserved) and 0xCC (arithmetic)
+    sof_markers = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+    byte_idx = 2
+    while (byte_idx + 9) < len(image_bytes):
+        
+        # Bail if we're not at a marker, since the data is probably corrupt
+        if image_bytes[byte_idx] != 0xFF:
+            return None
+        
+        # Skip padding bytes between markers
+        marker_type = image_bytes[byte_idx + 1]
+        if marker_type == 0xFF:
+            byte_idx += 1
+            continue
+        
+        # Read sizing from start-of-frame segments: [length (2), precision (1), height (2), width (2)]
+        if marker_type in sof_markers:
+            image_height = int.from_bytes(image_bytes[(byte_idx + 5):(byte_idx + 7)], "big")
+            image_width = int.from_bytes(image_bytes[(byte_idx + 7):(byte_idx + 9)], "big")
+            return (image_width, image_height)
+        
+        # Move to the next segment
+        segment_length = int.from_bytes(image_bytes[(byte_idx + 2):(byte_idx + 4)], "big")
+        byte_idx += 2 + segment_length
+    
+    return None
+
+# .....................................................................................................................
+
 def save_one_jpg(save_folder_path, save_name, image_data):
     
     # Build the file name with the right extension and enough (left-sided) zero padding to avoid ordering errors
@@ -58,6 +130,15 @@ def save_one_jpg(save_folder_path, save_name, image_data):
 # .....................................................................................................................
 
 
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Set up globals
+
+# Lookup table for decoding jpegs at reduced sizes
+JPEG_REDUCTION_FLAGS_LUT = {2: cv2.IMREAD_REDUCED_COLOR_2,
+                            4: cv2.IMREAD_REDUCED_COLOR_4,
+                            8: cv2.IMREAD_REDUCED_COLOR_8}
+
+
 # ---------------------------------------------------------------------------------------------------------------------
 #%% Demo
 
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 17:12:31 2026
+
+@author: eo
+"""
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Imports
+
+import json
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Define classes
+
+class Buffered_Byte_Reader:
+    
+    '''
+    Helper class used to read JSON syntax from a (binary) stream, a chunk at a time
+    Only data that hasn't been parsed yet is held in memory
+    '''
+    
+    # .................................................................................................................
+    
+    def __init__(self, byte_stream, chunk_size_bytes = 262144):
+        
+        # Store inputs
+        self._byte_stream = byte_stream
+        self._chunk_size_bytes = chunk_size_bytes
+        
+        # Allocate storage for (unparsed) data
+        self._buffer = b""
+        self._pos = 0
+        self._end_of_stream = False
+    
+    # .................................................................................................................
+    
+    def read_more(self):
+        
+        ''' Function used to add more data to the buffer. Returns False if the stream has ended '''
+        
+        if self._end_of_stream:
+            return False
+        
+        # Drop already-parsed data while adding new data, so the buffer doesn't grow forever
+        new_data = self._byte_stream.read(self._chunk_size_bytes)
+        if not new_data:
+            self._end_of_stream = True
+            return False
+        self._buffer = self._buffer[self._pos:] + new_data
+        self._pos = 0
+        
+        return True
+    
+    # .................................................................................................................
+    
+    def peek_token(self):
+        
+        ''' Function which skips whitespace and returns the next character (as bytes), or None at the end of data '''
+        
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in JSON_WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos:(self._pos + 1)]
+            if not self.read_more():
+                return None
+    
+    # .................................................................................................................
+    
+    def read_token(self, expected_tokens = None):
+        
+        ''' Function which reads the next (non-whitespace) character, with an error if it's not what was expected '''
+        
+        next_token = self.peek_token()
+        if next_token is None:
+            raise ValueError("Unexpected end of JSON data")
+        if expected_tokens is not None and next_token not in expected_tokens:
+            raise ValueError("Bad JSON data, expecting {} but got: {}".format(expected_tokens, next_token))
+        self._pos += 1
+        
+        return next_token
+    
+    # .................................................................................................................
+    
+    def read_string_literal(self):
+        
+        ''' Function which reads a (quoted) JSON string, returned as raw bytes, including quotes & escapes '''
+        
+        # Make sure we're at the start of a string
+        # -> The read position stays on the opening quote until the string is done, so it isn't dropped
+        #    from the buffer when more data is read in
+        next_token = self.peek_token()
+        if next_token != b'"':
+            raise ValueError("Bad JSON data, expecting a string but got: {}".format(next_token))
+        
+        # Find the closing quote, skipping over escaped quotes & reading more data as needed
+        search_offset = 1
+        while True:
+            quote_idx = self._buffer.find(b'"', self._pos + search_offset)
+            if quote_idx < 0:
+                search_offset = len(self._buffer) - self._pos
+                if not self.read_more():
+                    raise ValueError("Unexpected end of JSON data (unterminated string)")
+                continue
+            
+            # Quotes with an odd number of backslashes before them are escaped, so keep searching
+            num_backslashes = 0
+            while self._buffer[quote_idx - 1 - num_backslashes] == BACKSLASH_BYTE:
+                num_backslashes += 1
+            if num_backslashes % 2 == 1:
+                search_offset = quote_idx + 1 - self._pos
+                continue
+            break
+        
+        string_literal = self._buffer[self._pos:(quote_idx + 1)]
+        self._pos = quote_idx + 1
+        
+        return string_literal
+    
+    # .................................................................................................................
+    
+    def read_value_literal(self):
+        
+        ''' Function which reads any JSON value as raw bytes (meant for small values only!) '''
+        
+        # Strings are handled separately, since they can contain any characters
+        first_token = self.peek_token()
+        if first_token == b'"':
+            return self.read_string_literal()
+        
+        # Read objects & arrays until all brackets are closed (skipping over strings inside)
+        if first_token in (b"{", b"["):
+            value_parts_list = []
+            bracket_depth = 0
+            while True:
+                next_byte = self._read_raw_byte()
+                if next_byte is None:
+                    raise ValueError("Unexpected end of JSON data")
+                if next_byte == b'"':
+                    self._pos -= 1
+                    value_parts_list.append(self.read_string_literal())
+                    continue
+                value_parts_list.append(next_byte)
+                bracket_depth += 1 if next_byte in (b"{", b"[") else (-1 if next_byte in (b"}", b"]") else 0)
+                if bracket_depth == 0:
+                    return b"".join(value_parts_list)
+        
+        # Anything else is a number/boolean/null, which ends at the next separator (or whitespace)
+        value_parts_list = []
+        while True:
+            next_byte = self._read_raw_byte()
+            if next_byte is None:
+                break
+            if next_byte in (b",", b"}", b"]") or next_byte[0] in JSON_WHITESPACE:
+                self._pos -= 1
+                break
+            value_parts_list.append(next_byte)
+        
+        return b"".join(value_parts_list)
+    
+    # .................................................................................................................
+    
+    def _read_raw_byte(self):
+        
+        ''' Helper used to read a single byte (including whitespace). Returns None at the end of data '''
+        
+        if self._pos >= len(self._buffer) and not self.read_more():
+            return None
+        next_byte = self._buffer[self._pos:(self._pos + 1)]
+        self._pos += 1
+        
+        return next_byte
+    
+    # .................................................................................................................
+    # .................................................................................................................
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Functions
+
+# .....................................................................................................................
+
+def parse_streamed_json_object(byte_stream, streamed_array_callbacks_lut, chunk_size_bytes = 262144):
+    
+    '''
+    Function which parses a JSON object from a (binary) stream, without needing to hold all of the data in memory
+    Arrays of strings stored under the keys of the given callback lookup-table aren't stored in the result,
+    instead each string is handed (as bytes, without quotes) to the matching callback as soon as it's read.
+    Everything else is parsed as usual and returned as a dictionary.
+    
+    Raises a ValueError if the data isn't valid JSON (or the streamed arrays don't hold strings)
+    '''
+    
+    reader = Buffered_Byte_Reader(byte_stream, chunk_size_bytes)
+    
+    # Bail on empty data, which is a common enough mistake to deserve a clear error
+    if reader.peek_token() is None:
+        raise ValueError("No JSON data")
+    
+    # Read every key/value pair of the (top-level) object
+    result_dict = {}
+    reader.read_token([b"{"])
+    next_token = reader.peek_token()
+    if next_token == b"}":
+        reader.read_token([b"}"])
+    while next_token != b"}":
+        
+        # Read the key
+        key_str = json.loads(reader.read_string_literal())
+        reader.read_token([b":"])
+        
+        # Store regular values as-is
+        item_callback = streamed_array_callbacks_lut.get(key_str, None)
+        if item_callback is None:
+            result_dict[key_str] = json.loads(reader.read_value_literal())
+        
+        # Hand streamed array entries over to the callback one-by-one
+        else:
+            reader.read_token([b"["])
+            while reader.peek_token() != b"]":
+                item_callback(get_string_bytes(reader.read_string_literal()))
+                if reader.peek_token() != b"]":
+                    reader.read_token([b","])
+            reader.read_token([b"]"])
+        
+        # Move on to the next key
+        next_token = reader.read_token([b",", b"}"])
+    
+    # Make sure there isn't anything after the object
+    if reader.peek_token() is not None:
+        raise ValueError("Bad JSON data, found extra data after the end of the object")
+    
+    return result_dict
+
+# .....................................................................................................................
+
+def get_string_bytes(string_literal):
+    
+    ''' Helper used to remove the quotes from a JSON string literal, handling escape sequences if needed '''
+    
+    if b"\\" in string_literal:
+        return json.loads(string_literal).encode("utf-8")
+    
+    return string_literal[1:-1]
+
+# .....................................................................................................................
+# .....................................................................................................................
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Set up globals
+
+# Byte values used when scanning through JSON data
+JSON_WHITESPACE = b" \t\r\n"
+BACKSLASH_BYTE = ord("\\")
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Demo
+
+if __name__ == "__main__":
+    
+    from io import BytesIO
+    
+    example_json = b'{"frame_rate": 5, "b64_jpgs": ["abc", "de\\"f"], "ghosting": {"enable": [true, "]"]}}'
+    example_result = parse_streamed_json_object(BytesIO(example_json), {"b64_jpgs": print}, chunk_size_bytes = 4)
+    print(example_result)
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Scrap
+
+
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Wed Oct 14 15:26:09 2026
+
+@author: eo
+"""
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Imports
+
+from threading import Lock
+from collections import OrderedDict
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Define classes
+
+class LRU_Memory_Cache:
+    
+    '''
+    Class used to hold data in memory for re-use, up to a maximum (total) size in bytes
+    When the cache is full, the least-recently used entries are removed to make room for new ones
+    Safe to use from multiple threads
+    '''
+    
+    # .................................................................................................................
+    
+    def __init__(self, max_size_mb):
+        
+        # Store cache settings
+        self.max_size_bytes = int(max_size_mb * 1E6)
+        self.enabled = (self.max_size_bytes > 0)
+        
+        # Allocate storage for cached data, in least-to-most recently used order
+        self._lock = Lock()
+        self._data_lut = OrderedDict()
+        self._total_size_bytes = 0
+        
+        # Keep track of cache usage, for reporting
+        self.hit_count = 0
+        self.miss_count = 0
+    
+    # .................................................................................................................
+    
+    def __repr__(self):
+        return "LRU_Memory_Cache ({} entries, {:.1f} / {:.1f} MB)".format(len(self._data_lut),
+                                                                          self._total_size_bytes / 1E6,
+                                                                          self.max_size_bytes / 1E6)
+    
+    # .................................................................................................................
+    
+    def __contains__(self, key):
+        
+        ''' Check whether data is cached, without counting as a cache hit/miss or marking the entry as used '''
+        
+        with self._lock:
+            return (key in self._data_lut)
+    
+    # .................................................................................................................
+    
+    def get(self, key, default = None):
+        
+        ''' Function used to retrieve cached data. Returns the given default if the data isn't in the cache '''
+        
+        with self._lock:
+            
+            # Record misses
+            if key not in self._data_lut:
+                self.miss_count += 1
+                return default
+            
+            # Mark the entry as the most recently used
+            self.hit_count += 1
+            self._data_lut.move_to_end(key)
+            value, _ = self._data_lut[key]
+        
+        return value
+    
+    # .................................................................................................................
+    
+    def store(self, key, value, size_bytes):
+        
+        ''' Function used to add data to the cache. Older entries will be removed to make room if needed '''
+        
+        # Don't store anything if the cache is disabled or if the data would take up the entire cache
+        if (not self.enabled) or (size_bytes > self.max_size_bytes):
+            return
+        
+        with self._lock:
+            
+            # Replace any existing copy of the data
+            _, old_size_bytes = self._data_lut.pop(key, (None, 0))
+            self._total_size_bytes -= old_size_bytes
+            self._data_lut[key] = (value, size_bytes)
+            self._total_size_bytes += size_bytes
+            
+            # Remove the least recently used entries until we're back under the size limit
+            while self._total_size_bytes > self.max_size_bytes:
+                _, (_, removed_size_bytes) = self._data_lut.popitem(last = False)
+                self._total_size_bytes -= removed_size_bytes
+        
+        return
+    
+    # .................................................................................................................
+    
+    def clear(self):
+        
+        ''' Function used to remove all cached data '''
+        
+        with self._lock:
+            self._data_lut = OrderedDict()
+            self._total_size_bytes = 0
+    
+    # .................................................................................................................
+    
+    def get_stats(self):
+        
+        ''' Function which returns a dictionary describing the cache usage '''
+        
+        with self._lock:
+            stats_dict = {"entries": len(self._data_lut),
+                          "size_bytes": self._total_size_bytes,
+                          "max_size_bytes": self.max_size_bytes,
+                          "hits": self.hit_count,
+                          "misses": self.miss_count}
+        
+        return stats_dict
+    
+    # .................................................................................................................
+    # .................................................................................................................
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Demo
+
+if __name__ == "__main__":
+    
+    pass
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Scrap
+
+
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Wed Oct 14 10:05:31 2026
+
+@author: eo
+"""
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Imports
+
+import os
+import json
+import shutil
+import atexit
+import hashlib
+
+from uuid import uuid4
+from tempfile import mkdtemp
+from threading import Lock
+from collections import OrderedDict
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Define classes
+
+class Render_Cache:
+    
+    '''
+    Class used to store finished animation files on disk, so that repeated requests can be served without
+    re-downloading or re-encoding anything. Files are stored using a hash of the rendering settings
+    (see 'make_render_key') and the least-recently used files are removed when the cache grows too large.
+    Files are kept inside a (uniquely named) folder created by this cache within the given cache folder path,
+    so that other processes sharing the path are never affected. The folder is removed when shutting down
+    '''
+    
+    # .................................................................................................................
+    
+    def __init__(self, cache_folder_path, max_size_mb = 1024):
+        
+        # Store cache settings
+        self.cache_folder_path = None
+        self.max_size_bytes = int(max_size_mb * 1E6)
+        self.enabled = (self.max_size_bytes > 0)
+        
+        # Allocate storage for keeping track of cached files in least-to-most recently used order
+        self._lock = Lock()
+        self._file_lut = OrderedDict()
+        self._total_size_bytes = 0
+        
+        # Create a folder that only this cache uses, and clean it up when shutting down
+        if self.enabled:
+            os.makedirs(cache_folder_path, exist_ok = True)
+            self.cache_folder_path = mkdtemp(prefix = "render_cache_", dir = cache_folder_path)
+            atexit.register(self._remove_all_files)
+    
+    # .................................................................................................................
+    
+    def __repr__(self):
+        return "Render_Cache ({} files, {:.1f} / {:.1f} MB) @ {}".format(len(self._file_lut),
+                                                                          self._total_size_bytes / 1E6,
+                                                                          self.max_size_bytes / 1E6,
+                                                                          self.cache_folder_path)
+    
+    # .................................................................................................................
+    
+    def open_cached_file(self, render_key):
+        
+        '''
+        Function which returns an (opened, binary) file object for a cached render, or None if it isn't cached
+        The file is opened while locked, so it can safely be sent back even if it gets evicted afterwards
+        '''
+        
+        # Don't bother looking for files if the cache is disabled
+        if not self.enabled:
+            return None
+        
+        with self._lock:
+            
+            # Bail if we don't have the file
+            file_path, _ = self._file_lut.get(render_key, (None, None))
+            if file_path is None:
+                return None
+            
+            # Try to open the file. If it's been removed outside of the cache, forget about it
+            try:
+                file_handle = open(file_path, "rb")
+            except FileNotFoundError:
+                self._remove_entry(render_key, delete_file = False)
+                return None
+            
+            # Mark the file as the most recently used
+            self._file_lut.move_to_end(render_key)
+        
+        return file_handle
+    
+    # .................................................................................................................
+    
+    def store(self, render_key, file_path, keep_original = False):
+        
+        '''
+        Function which moves a rendered file into the cache. Returns the path to the file after storing,
+        which will be the original path if the file couldn't be cached (e.g. the cache is disabled)
+        If 'keep_original' is True, the file is copied into the cache instead, leaving the original in place
+        '''
+        
+        # Don't store anything if the cache is disabled or if the file would take up the entire cache
+        file_size_bytes = os.path.getsize(file_path)
+        if (not self.enabled) or (file_size_bytes > self.max_size_bytes):
+            return file_path
+        
+        # Build pathing to the cached copy, keeping the original file extension
+        _, file_ext = os.path.splitext(file_path)
+        cached_file_path = os.path.join(self.cache_folder_path, "{}{}".format(render_key, file_ext))
+        
+        # Move the file into the cache folder before locking, so lookups aren't held up by disk access
+        # -> A (unique) temporary name is used, so the file only appears under its cached name once it is complete
+        partial_file_path = "{}.{}.partial".format(cached_file_path, uuid4().hex)
+        move_or_copy = shutil.copyfile if keep_original else shutil.move
+        try:
+            move_or_copy(file_path, partial_file_path)
+        except OSError:
+            self._delete_file(partial_file_path)
+            raise
+        
+        with self._lock:
+            
+            # Rename the file to its cached name (no data is moved), so it's replaced along with the cache entry
+            os.replace(partial_file_path, cached_file_path)
+            
+            # Record the new entry then make room for it if needed
+            self._remove_entry(render_key, delete_file = False)
+            self._file_lut[render_key] = (cached_file_path, file_size_bytes)
+            self._total_size_bytes += file_size_bytes
+            self._evict_to_size(self.max_size_bytes)
+        
+        return cached_file_path
+    
+    # .................................................................................................................
+    
+    def _evict_to_size(self, target_size_bytes):
+        
+        ''' Helper used to remove the least recently used files, until the cache is below the target size '''
+        
+        while (self._total_size_bytes > target_size_bytes) and (len(self._file_lut) > 0):
+            oldest_render_key = next(iter(self._file_lut))
+            self._remove_entry(oldest_render_key, delete_file = True)
+    
+    # .................................................................................................................
+    
+    def _remove_entry(self, render_key, delete_file = True):
+        
+        ''' Helper used to remove a single entry from the cache. Assumes the lock is already held! '''
+        
+        file_path, file_size_bytes = self._file_lut.pop(render_key, (None, 0))
+        self._total_size_bytes -= file_size_bytes
+        if delete_file and (file_path is not None):
+            self._delete_file(file_path)
+    
+    # .................................................................................................................
+    
+    def _delete_file(self, file_path):
+        
+        ''' Helper used to delete a file, ignoring files that are already gone '''
+        
+        try:
+            os.remove(file_path)
+        except FileNotFoundError:
+            pass
+    
+    # .................................................................................................................
+    
+    def _remove_all_files(self):
+        
+        ''' Helper used (on shutdown) to delete every cached file, along with the folder used by this cache '''
+        
+        # Only delete the files we know about, in case something else ended up in the cache folder
+        with self._lock:
+            for each_render_key in list(self._file_lut.keys()):
+                self._remove_entry(each_render_key, delete_file = True)
+        try:
+            os.rmdir(self.cache_folder_path)
+        except OSError:
+            pass
+        
+        return
+    
+    # .................................................................................................................
+    # .................................................................................................................
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Functions
+
+# .....................................................................................................................
+
+def make_render_key(render_config_dict):
+    
+    '''
+    Function which creates a (content-addressed) key for identifying renders.
+    The key is a hash of the (canonical) json representation of the provided config,
+    so any renders using identical settings (including dictionary key ordering) will share the same key
+    '''
+    
+    canonical_json_str = json.dumps(render_config_dict, sort_keys = True, separators = (",", ":"), default = str)
+    
+    return hashlib.sha256(canonical_json_str.encode("utf-8")).hexdigest()
+
+# .....................................................................................................................
+# .....................................................................................................................
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Demo
+
+if __name__ == "__main__":
+    
+    pass
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Scrap
+
+
@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 09:12:40 2026
+
+@author: eo
+"""
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Imports
+
+import os
+import time
+import shutil
+import atexit
+
+from math import ceil
+from uuid import uuid4
+from tempfile import mkdtemp
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
+
+from local.lib.timekeeper_utils import get_utc_datetime, datetime_to_isoformat_string
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Define classes
+
+class Render_Job:
+    
+    '''
+    Class used to keep track of a single (background) render, from being queued up to having a finished file
+    Status is one of: 'queued', 'running', 'complete' or 'failed'
+    '''
+    
+    # .................................................................................................................
+    
+    def __init__(self, run_func, frames_total, file_name, mimetype, job_key = None):
+        
+        # Store job settings
+        self.job_id = uuid4().hex
+        self.job_key = job_key
+        self.run_func = run_func
+        self.frames_total = frames_total
+        self.file_name = file_name
+        self.mimetype = mimetype
+        
+        # Allocate storage for job progress
+        self._lock = Lock()
+        self.status = "queued"
+        self.frames_done = 0
+        self.error_message = None
+        self.result_path = None
+        
+        # Keep track of job timing, for reporting & cleanup
+        self.created_dt = get_utc_datetime()
+        self.started_dt = None
+        self.finished_dt = None
+        self.finished_monotonic = None
+    
+    # .................................................................................................................
+    
+    def __repr__(self):
+        return "Render_Job ({}, {}, {} / {} frames)".format(self.job_id, self.status,
+                                                            self.frames_done, self.frames_total)
+    
+    # .................................................................................................................
+    
+    def report_progress(self, frames_done):
+        
+        ''' Function used (by the render itself) to report how many frames have been rendered so far '''
+        
+        with self._lock:
+            self.frames_done = frames_done
+    
+    # .................................................................................................................
+    
+    def mark_running(self):
+        
+        with self._lock:
+            self.status = "running"
+            self.started_dt = get_utc_datetime()
+    
+    # .................................................................................................................
+    
+    def mark_finished(self, result_path = None, error_message = None):
+        
+        ''' Function used to record the result of a render. Jobs without a result path are considered failed '''
+        
+        with self._lock:
+            self.status = "failed" if result_path is None else "complete"
+            self.result_path = result_path
+            self.error_message = error_message
+            self.finished_dt = get_utc_datetime()
+            self.finished_monotonic = time.monotonic()
+    
+    # .................................................................................................................
+    
+    def get_status_dict(self):
+        
+        ''' Function which returns a (json-friendly) dictionary describing the state of the job '''
+        
+        # For convenience
+        dt_to_str = lambda datetime_obj: None if datetime_obj is None else datetime_to_isoformat_string(datetime_obj)
+        
+        with self._lock:
+            progress = 1.0 if self.status == "complete" else self.frames_done / max(1, self.frames_total)
+            status_dict = {"job_id": self.job_id,
+                           "status": self.status,
+                           "frames_done": self.frames_done,
+                           "frames_total": self.frames_total,
+                           "progress": round(min(1.0, progress), 3),
+                           "error": self.error_message,
+                           "created_datetime_isoformat": dt_to_str(self.created_dt),
+                           "started_datetime_isoformat": dt_to_str(self.started_dt),
+                           "finished_datetime_isoformat": dt_to_str(self.finished_dt)}
+        
+        return status_dict
+    
+    # .................................................................................................................
+    # .................................................................................................................
+
+
+class Render_Job_Queue:
+    
+    '''
+    Class used to run renders in the background, using a fixed number of worker threads
+    This allows requests to return immediately (with a job id), instead of holding onto a server thread
+    for the entire download & encoding time. Each job renders into its own folder, which is removed
+    once the job has been finished for longer than the retention time.
+    Job folders are kept inside a (uniquely named) folder created by this queue within the given
+    jobs folder path, so that nothing else stored at the given path is ever deleted.
+    Jobs submitted with the same key as an unfinished job are merged into the existing job.
+    New jobs are refused once there are already 'max_queued' jobs waiting for a worker
+    '''
+    
+    # .................................................................................................................
+    
+    def __init__(self, jobs_folder_path, max_workers = 2, retention_sec = 900, max_queued = 16):
+        
+        # Store queue settings
+        self.max_workers = max(1, int(max_workers))
+        self.retention_sec = retention_sec
+        self.max_queued = max(0, int(max_queued))
+        
+        # Allocate storage for keeping track of jobs
+        self._lock = Lock()
+        self._job_lut = {}
+        self._unfinished_job_by_key_lut = {}
+        self._queued_count = 0
+        self._executor = ThreadPoolExecutor(max_workers = self.max_workers, thread_name_prefix = "render_job")
+        
+        # Keep track of how long jobs take, for suggesting retry timing
+        self._avg_job_sec = None
+        self.rejected_count = 0
+        
+        # Create a folder that only this queue uses, and clean it up when shutting down
+        os.makedirs(jobs_folder_path, exist_ok = True)
+        self.jobs_folder_path = mkdtemp(prefix = "render_jobs_", dir = jobs_folder_path)
+        atexit.register(self._remove_all_jobs)
+    
+    # .................................................................................................................
+    
+    def __repr__(self):
+        return "Render_Job_Queue ({} jobs, {} workers) @ {}".format(len(self._job_lut),
+                                                                     self.max_workers,
+                                                                     self.jobs_folder_path)
+    
+    # .................................................................................................................
+    
+    def submit(self, run_func, frames_total, file_name, mimetype, job_key = None):
+        
+        '''
+        Function used to queue up a new render. Returns the (queued) job
+        If a key is given and an unfinished job has the same key, the existing job is returned instead
+        Returns None if the job was refused, because too many jobs are already waiting to run
+        The run function should have the signature:
+            run_func(save_folder_path, progress_callback) -> path_to_finished_file
+        '''
+        
+        # Clean up old jobs whenever new ones come in, so storage doesn't grow forever
+        self._remove_expired_jobs()
+        
+        with self._lock:
+            
+            # Hand back the existing job if the same render is already queued up
+            existing_job = self._unfinished_job_by_key_lut.get(job_key, None)
+            if existing_job is not None:
+                return existing_job
+            
+            # Refuse the job if there are already too many jobs waiting to run
+            queue_is_full = (self._queued_count >= self.max_queued)
+            if queue_is_full:
+                self.rejected_count += 1
+                return None
+            
+            # Record the new job so it can be looked up later
+            new_job = Render_Job(run_func, frames_total, file_name, mimetype, job_key)
+            self._job_lut[new_job.job_id] = new_job
+            self._queued_count += 1
+            if job_key is not None:
+                self._unfinished_job_by_key_lut[job_key] = new_job
+        
+        self._executor.submit(self._run_job, new_job)
+        
+        return new_job
+    
+    # .................................................................................................................
+    
+    def get_job(self, job_id):
+        
+        ''' Function used to look up a job by id. Returns None if the job doesn't exist (or has expired) '''
+        
+        self._remove_expired_jobs()
+        with self._lock:
+            job_ref = self._job_lut.get(job_id, None)
+        
+        return job_ref
+    
+    # .................................................................................................................
+    
+    def open_result_file(self, job_id):
+        
+        '''
+        Function which returns an (opened, binary) file object for the result of a finished job, or None if
+        the result isn't available. The file is opened while locked, so it can't be cleaned up before sending
+        '''
+        
+        with self._lock:
+            
+            # Bail if the job doesn't have a result
+            job_ref = self._job_lut.get(job_id, None)
+            if job_ref is None or job_ref.result_path is None:
+                return None
+            
+            try:
+                file_handle = open(job_ref.result_path, "rb")
+            except FileNotFoundError:
+                return None
+        
+        return file_handle
+    
+    # .................................................................................................................
+    
+    def get_retry_after_sec(self):
+        
+        ''' Function which suggests how long a client should wait before re-submitting a refused job '''
+        
+        with self._lock:
+            
+            # Use a fixed guess until we have some timing info
+            if self._avg_job_sec is None:
+                return 5
+            
+            return int(min(60, max(1, ceil(self._avg_job_sec))))
+    
+    # .................................................................................................................
+    
+    def get_stats(self):
+        
+        ''' Function which returns a dictionary describing the number of jobs in each state '''
+        
+        with self._lock:
+            status_list = [each_job.status for each_job in self._job_lut.values()]
+            rejected_count = self.rejected_count
+            avg_job_sec = None if self._avg_job_sec is None else round(self._avg_job_sec, 2)
+        
+        stats_dict = {"max_workers": self.max_workers, "max_queued": self.max_queued, "total": len(status_list),
+                      "rejected": rejected_count, "avg_job_sec": avg_job_sec}
+        for each_status in ["queued", "running", "complete", "failed"]:
+            stats_dict[each_status] = status_list.count(each_status)
+        
+        return stats_dict
+    
+    # .................................................................................................................
+    
+    def _run_job(self, job_ref):
+        
+        ''' Helper used to run a single job (on one of the worker threads) and record the result '''
+        
+        with self._lock:
+            self._queued_count -= 1
+        job_ref.mark_running()
+        start_monotonic = time.monotonic()
+        result_path = None
+        error_message = None
+        try:
+            save_folder_path = os.path.join(self.jobs_folder_path, job_ref.job_id)
+            os.makedirs(save_folder_path, exist_ok = True)
+            result_path = job_ref.run_func(save_folder_path, job_ref.report_progress)
+        
+        except Exception as err:
+            # If anything goes wrong, record the error so it can be reported back when checking the job status
+            error_type = err.__class__.__name__
+            print("", "{} (render job: {}):".format(error_type, job_ref.job_id), str(err), sep = "\n")
+            error_message = "({}) {}".format(error_type, str(err))
+        
+        # Stop merging new submissions into this job, since it's done
+        with self._lock:
+            self._unfinished_job_by_key_lut.pop(job_ref.job_key, None)
+            
+            # Keep a running average of job times
+            job_duration_sec = time.monotonic() - start_monotonic
+            prev_avg_sec = job_duration_sec if self._avg_job_sec is None else self._avg_job_sec
+            self._avg_job_sec = (0.8 * prev_avg_sec) + (0.2 * job_duration_sec)
+        job_ref.mark_finished(result_path, error_message)
+        
+        return
+    
+    # .................................................................................................................
+    
+    def _remove_expired_jobs(self):
+        
+        ''' Helper used to forget about (and delete the files of) jobs that finished a long time ago '''
+        
+        # Find all jobs which have been finished for longer than the retention time
+        oldest_allowed_monotonic = time.monotonic() - self.retention_sec
+        with self._lock:
+            expired_job_ids = [each_id for each_id, each_job in self._job_lut.items()
+                               if each_job.finished_monotonic is not None
+                               and each_job.finished_monotonic < oldest_allowed_monotonic]
+            for each_id in expired_job_ids:
+                del self._job_lut[each_id]
+        
+        # Delete job files outside of the lock, since this could take a while
+        for each_id in expired_job_ids:
+            shutil.rmtree(os.path.join(self.jobs_folder_path, each_id), ignore_errors = True)
+        
+        return
+    
+    # .................................................................................................................
+    
+    def _remove_all_jobs(self):
+        
+        ''' Helper used (on shutdown) to delete the files of every job, along with the folder used by this queue '''
+        
+        with self._lock:
+            job_ids_list = list(self._job_lut.keys())
+            self._job_lut = {}
+        
+        # Only delete the folders of jobs we know about, in case something else ended up in the queue folder
+        for each_id in job_ids_list:
+            shutil.rmtree(os.path.join(self.jobs_folder_path, each_id), ignore_errors = True)
+        try:
+            os.rmdir(self.jobs_folder_path)
+        except OSError:
+            pass
+        
+        return
+    
+    # .................................................................................................................
+    # .................................................................................................................
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Demo
+
+if __name__ == "__main__":
+    
+    pass
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Scrap
+
+
@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 11:04:52 2026
+
+@author: eo
+"""
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Imports
+
+import time
+
+from math import ceil
+from threading import Lock, Condition
+from collections import deque, defaultdict
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Define classes
+
+class Render_Ticket:
+    
+    '''
+    Class representing permission (or refusal!) to run a single render, handed out by the Render_Scheduler
+    If admitted, the ticket must be released once the render is done, so that other renders can run.
+    Can be used as a context manager, which will release the ticket on exit
+    If not admitted, the ticket holds the response status code and a suggested retry time (in seconds)
+    '''
+    
+    # .................................................................................................................
+    
+    def __init__(self, scheduler_ref, camera_select, cost_mpx):
+        
+        # Store render info
+        self._scheduler_ref = scheduler_ref
+        self.camera_select = camera_select
+        self.cost_mpx = cost_mpx
+        
+        # Allocate storage for the admission result
+        self.admitted = False
+        self.status_code = 200
+        self.error_message = None
+        self.retry_after_sec = None
+        
+        # Allocate storage for timing/release info
+        self.admitted_monotonic = None
+        self._released = False
+    
+    # .................................................................................................................
+    
+    def __repr__(self):
+        admit_str = "admitted" if self.admitted else "rejected ({})".format(self.status_code)
+        return "Render_Ticket ({}, {}, {:.1f} mpx)".format(admit_str, self.camera_select, self.cost_mpx)
+    
+    # .................................................................................................................
+    
+    def __enter__(self):
+        return self
+    
+    # .................................................................................................................
+    
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.release()
+    
+    # .................................................................................................................
+    
+    def reject(self, status_code, error_message, retry_after_sec):
+        
+        ''' Function used (by the scheduler) to mark a ticket as rejected '''
+        
+        self.admitted = False
+        self.status_code = status_code
+        self.error_message = error_message
+        self.retry_after_sec = retry_after_sec
+    
+    # .................................................................................................................
+    
+    def release(self):
+        
+        ''' Function used to give back an admitted ticket. Safe to call more than once '''
+        
+        if self._released or (not self.admitted):
+            return
+        self._released = True
+        
+        if self._scheduler_ref is not None:
+            self._scheduler_ref.release(self)
+    
+    # .................................................................................................................
+    # .................................................................................................................
+
+
+class Render_Scheduler:
+    
+    '''
+    Class used to limit how many renders can run at the same time, so that heavy load leads to
+    (predictable) waiting or rejections, rather than everything slowing to a crawl together.
+    
+    Renders are limited by:
+        - The total number of renders running at once
+        - The number of renders running at once for a single camera
+        - The total (estimated) cost of all running renders, in megapixels (frame count x frame area)
+    
+    Renders that don't fit are queued (in arrival order) for a limited time, or rejected if the queue is full.
+    A render which costs more than the entire budget is still allowed to run, but only on its own
+    '''
+    
+    # .................................................................................................................
+    
+    def __init__(self, max_concurrent_renders = 4, max_renders_per_camera = 2, cost_budget_mpx = 2000,
+                 max_queued_renders = 8, queue_timeout_sec = 15):
+        
+        # Store scheduling limits
+        self.max_concurrent_renders = max(1, int(max_concurrent_renders))
+        self.max_renders_per_camera = max(1, int(max_renders_per_camera))
+        self.cost_budget_mpx = cost_budget_mpx
+        self.max_queued_renders = max(0, int(max_queued_renders))
+        self.queue_timeout_sec = queue_timeout_sec
+        
+        # Allocate storage for keeping track of running & waiting renders
+        self._condition = Condition(Lock())
+        self._active_count = 0
+        self._active_cost_mpx = 0
+        self._active_per_camera_dict = defaultdict(int)
+        self._waiting_tickets = deque()
+        
+        # Keep track of how long renders take, for suggesting retry timing
+        self._avg_render_sec = None
+        self.admitted_count = 0
+        self.rejected_count = 0
+    
+    # .................................................................................................................
+    
+    def __repr__(self):
+        return "Render_Scheduler ({} running, {} waiting, {:.0f} / {:.0f} mpx)".format(self._active_count,
+                                                                                    len(self._waiting_tickets),
+                                                                                    self._active_cost_mpx,
+                                                                                    self.cost_budget_mpx)
+    
+    # .................................................................................................................
+    
+    def request_ticket(self, camera_select, cost_mpx, wait_forever = False):
+        
+        '''
+        Function used to request permission to run a render. Waits (up to the queue timeout)
+        if the render can't run right away. Always returns a ticket, which may or may not be admitted
+        If 'wait_forever' is True, the render will wait as long as needed and ignores the queue size limit
+        (intended for renders that are already queued elsewhere, like background jobs)
+        '''
+        
+        new_ticket = Render_Ticket(self, camera_select, cost_mpx)
+        with self._condition:
+            
+            # Reject immediately if there are already too many renders waiting
+            queue_is_full = (len(self._waiting_tickets) >= self.max_queued_renders)
+            if queue_is_full and (not wait_forever) and (not self._can_admit(new_ticket)):
+                self.rejected_count += 1
+                new_ticket.reject(503, "Server is busy, too many renders are queued", self._get_retry_after_sec())
+                return new_ticket
+            
+            # Wait in line until the render can run (or we run out of time)
+            self._waiting_tickets.append(new_ticket)
+            end_monotonic = time.monotonic() + self.queue_timeout_sec
+            try:
+                while not self._can_admit(new_ticket):
+                    time_remaining_sec = None if wait_forever else (end_monotonic - time.monotonic())
+                    if time_remaining_sec is not None and time_remaining_sec <= 0:
+                        self.rejected_count += 1
+                        new_ticket.reject(*self._get_rejection_reason(new_ticket), self._get_retry_after_sec())
+                        return new_ticket
+                    self._condition.wait(time_remaining_sec)
+            
+            finally:
+                # Other waiting renders may be able to go now that this one is out of line
+                self._waiting_tickets.remove(new_ticket)
+                self._condition.notify_all()
+            
+            # If we get here, the render can run, so record it as active
+            new_ticket.admitted = True
+            new_ticket.admitted_monotonic = time.monotonic()
+            self._active_count += 1
+            self._active_cost_mpx += cost_mpx
+            self._active_per_camera_dict[camera_select] += 1
+            self.admitted_count += 1
+        
+        return new_ticket
+    
+    # .................................................................................................................
+    
+    def release(self, ticket):
+        
+        ''' Function used to record that an admitted render has finished. Should be called through the ticket! '''
+        
+        render_duration_sec = time.monotonic() - ticket.admitted_monotonic
+        with self._condition:
+            
+            # Remove the render from the active listing
+            self._active_count -= 1
+            self._active_cost_mpx -= ticket.cost_mpx
+            self._active_per_camera_dict[ticket.camera_select] -= 1
+            if self._active_per_camera_dict[ticket.camera_select] <= 0:
+                del self._active_per_camera_dict[ticket.camera_select]
+            
+            # Keep a running average of render times
+            prev_avg_sec = render_duration_sec if self._avg_render_sec is None else self._avg_render_sec
+            self._avg_render_sec = (0.8 * prev_avg_sec) + (0.2 * render_duration_sec)
+            
+            # Let waiting renders check if they can run
+            self._condition.notify_all()
+        
+        return
+    
+    # .................................................................................................................
+    
+    def get_stats(self):
+        
+        ''' Function which returns a dictionary describing the current scheduling state '''
+        
+        with self._condition:
+            stats_dict = {"running": self._active_count,
+                          "waiting": len(self._waiting_tickets),
+                          "running_per_camera": dict(self._active_per_camera_dict),
+                          "running_cost_mpx": round(self._active_cost_mpx, 1),
+                          "cost_budget_mpx": self.cost_budget_mpx,
+                          "max_concurrent_renders": self.max_concurrent_renders,
+                          "max_renders_per_camera": self.max_renders_per_camera,
+                          "admitted": self.admitted_count,
+                          "rejected": self.rejected_count,
+                          "avg_render_sec": None if self._avg_render_sec is None else round(self._avg_render_sec, 2)}
+        
+        return stats_dict
+    
+    # .................................................................................................................
+    
+    def _fits(self, ticket):
+        
+        '''
+        Helper used to check if a render could run, given the renders that are already running
+        Assumes the lock is already held!
+        Returns:
+            fits_globally, fits_camera
+        '''
+        
+        # Check global limits, always allowing a single render to run (even if it's over budget)
+        under_count_limit = (self._active_count < self.max_concurrent_renders)
+        under_budget = (self._active_cost_mpx + ticket.cost_mpx) <= self.cost_budget_mpx
+        fits_globally = under_count_limit and (under_budget or self._active_count == 0)
+        
+        # Check per-camera limits
+        fits_camera = (self._active_per_camera_dict.get(ticket.camera_select, 0) < self.max_renders_per_camera)
+        
+        return fits_globally, fits_camera
+    
+    # .................................................................................................................
+    
+    def _can_admit(self, ticket):
+        
+        '''
+        Helper used to decide if a render can start. Renders are admitted in arrival order, except that renders
+        waiting on a busy camera don't hold up renders for other cameras. Assumes the lock is already held!
+        '''
+        
+        # Don't allow the render to run if it doesn't fit
+        fits_globally, fits_camera = self._fits(ticket)
+        if not (fits_globally and fits_camera):
+            return False
+        
+        # Don't let renders skip ahead of earlier renders that are waiting for (global) resources to free up
+        for each_ticket in self._waiting_tickets:
+            if each_ticket is ticket:
+                break
+            earlier_fits_globally, earlier_fits_camera = self._fits(each_ticket)
+            if earlier_fits_camera:
+                return False
+        
+        return True
+    
+    # .................................................................................................................
+    
+    def _get_rejection_reason(self, ticket):
+        
+        '''
+        Helper used to decide how to report a render that couldn't be admitted. Assumes the lock is already held!
+        Returns:
+            status_code, error_message
+        '''
+        
+        # Report camera-specific overload as 'too many requests', since other cameras may still be available
+        fits_globally, fits_camera = self._fits(ticket)
+        if fits_globally and (not fits_camera):
+            return 429, "Too many renders in progress for camera: {}".format(ticket.camera_select)
+        
+        return 503, "Server is busy, timed out waiting for other renders to finish"
+    
+    # .................................................................................................................
+    
+    def _get_retry_after_sec(self):
+        
+        ''' Helper used to suggest how long a client should wait before retrying. Assumes the lock is already held! '''
+        
+        # Use a fixed guess until we have some timing info
+        if self._avg_render_sec is None:
+            return 5
+        
+        return int(min(60, max(1, ceil(self._avg_render_sec))))
+    
+    # .................................................................................................................
+    # .................................................................................................................
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Functions
+
+# .....................................................................................................................
+
+def estimate_render_cost_mpx(frame_count, frame_wh = None):
+    
+    '''
+    Function which estimates the cost of a render in megapixels (i.e. frame count x frame area)
+    If the frame size isn't known, frames are assumed to be 1 megapixel
+    '''
+    
+    frame_mpx = 1.0
+    if frame_wh is not None:
+        frame_width, frame_height = frame_wh
+        frame_mpx = (frame_width * frame_height) / 1E6
+    
+    return frame_count * frame_mpx
+
+# .....................................................................................................................
+
+def request_render_ticket(render_scheduler, camera_select, cost_mpx, wait_forever = False):
+    
+    ''' Helper function which requests a render ticket, or hands back an (always admitted) ticket if not scheduling '''
+    
+    # Admit everything if we don't have a scheduler
+    if render_scheduler is None:
+        unscheduled_ticket = Render_Ticket(None, camera_select, cost_mpx)
+        unscheduled_ticket.admitted = True
+        return unscheduled_ticket
+    
+    return render_scheduler.request_ticket(camera_select, cost_mpx, wait_forever)
+
+# .....................................................................................................................
+# .....................................................................................................................
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Demo
+
+if __name__ == "__main__":
+    
+    pass
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Scrap
+
+
@@ -51,9 +51,149 @@ find_path_to_local()
 
 import requests
 
-from time import sleep
+from time import sleep, monotonic, time
+from threading import Lock
 
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import EmptyPoolError
+
+from local.lib.environment import get_dbserver_pool_size, get_dbserver_timeout_sec, get_snapshot_cache_size_mb
+from local.lib.environment import get_snapshot_batch_size
+from local.lib.environment import get_ems_list_cache_max_entries, get_ems_list_live_window_sec
+from local.lib.environment import get_ems_list_live_ttl_sec
+from local.lib.memory_cache import LRU_Memory_Cache
+from local.lib.ems_list_cache import Ems_List_Cache
 from local.lib.url_helpers import build_snap_ems_list_url, build_snap_image_url, build_bg_image_url
+from local.lib.url_helpers import build_snap_image_batch_url
+from local.lib.threading_helpers import ordered_threaded_map
+from local.lib.frame_spooling import read_exact_bytes
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Define classes
+
+class Bounded_Wait_Adapter(HTTPAdapter):
+    
+    '''
+    Class used to pool connections to the dbserver, without creating more connections than the pool size
+    Requests beyond the pool size wait for a free connection, but only for up to 'pool_timeout_sec',
+    after which a (requests) ConnectionError is raised, instead of waiting forever
+    '''
+    
+    # .................................................................................................................
+    
+    def __init__(self, pool_size, pool_timeout_sec):
+        
+        # Store timeout before setting up the adapter, since it's needed when the connection pools are set up
+        self.pool_timeout_sec = pool_timeout_sec
+        super().__init__(pool_connections = 1, pool_maxsize = pool_size, pool_block = True)
+    
+    # .................................................................................................................
+    
+    def init_poolmanager(self, *args, **kwargs):
+        
+        super().init_poolmanager(*args, **kwargs)
+        
+        # Swap in connection pools that only wait (for a free connection) up to the pool timeout
+        # -> Requests doesn't provide a way to set the pool timeout, so it's added to every request to the pool
+        pool_timeout_sec = self.pool_timeout_sec
+        def make_bounded_wait_pool_class(pool_class):
+            class Bounded_Wait_Pool(pool_class):
+                def urlopen(self, *args, **kwargs):
+                    if kwargs.get("pool_timeout", None) is None:
+                        kwargs["pool_timeout"] = pool_timeout_sec
+                    return super().urlopen(*args, **kwargs)
+            return Bounded_Wait_Pool
+        
+        pool_classes_lut = self.poolmanager.pool_classes_by_scheme
+        self.poolmanager.pool_classes_by_scheme = {each_scheme: make_bounded_wait_pool_class(each_pool_class)
+                                                   for each_scheme, each_pool_class in pool_classes_lut.items()}
+    
+    # .................................................................................................................
+    
+    def send(self, request, *args, **kwargs):
+        
+        # Report running out of time while waiting for a connection the same as other connection errors
+        try:
+            return super().send(request, *args, **kwargs)
+        except EmptyPoolError as err:
+            raise requests.exceptions.ConnectionError(err, request = request)
+    
+    # .................................................................................................................
+    # .................................................................................................................
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Session functions
+
+# .....................................................................................................................
+
+def create_dbserver_session(pool_size = None):
+    
+    '''
+    Function which creates a (thread-safe) requests session for talking to the dbserver
+    The session keeps connections alive & pools them, so that repeated requests
+    (e.g. downloading every snapshot of a replay) don't need to set up a new connection each time
+    '''
+    
+    # Use environment settings by default
+    if pool_size is None:
+        pool_size = get_dbserver_pool_size()
+    pool_size = max(1, int(pool_size))
+    
+    # Set up connection pooling for both http & https access
+    # -> Extra requests wait for a free connection (up to the request timeout), rather than adding connections
+    new_session = requests.Session()
+    pooled_adapter = Bounded_Wait_Adapter(pool_size, get_dbserver_timeout_sec())
+    new_session.mount("http://", pooled_adapter)
+    new_session.mount("https://", pooled_adapter)
+    
+    return new_session
+
+# .....................................................................................................................
+
+def get_dbserver_session():
+    
+    ''' Helper function which returns the (shared) dbserver session, which is created on first use '''
+    
+    global DBSERVER_SESSION
+    
+    # Create the shared session if we don't already have one
+    with DBSERVER_SESSION_LOCK:
+        if DBSERVER_SESSION is None:
+            DBSERVER_SESSION = create_dbserver_session()
+    
+    return DBSERVER_SESSION
+
+# .....................................................................................................................
+
+def dbserver_get(request_url, timeout_sec = None):
+    
+    ''' Helper function used to make GET requests to the dbserver, using the shared (pooled) session '''
+    
+    # Use environment timeout by default
+    if timeout_sec is None:
+        timeout_sec = get_dbserver_timeout_sec()
+    
+    return get_dbserver_session().get(request_url, timeout = timeout_sec)
+
+# .....................................................................................................................
+
+def dbserver_post(request_url, json_data, timeout_sec = None, stream = False):
+    
+    '''
+    Helper function used to make POST requests (with json data) to the dbserver, using the shared (pooled) session
+    If streaming, the response should be closed after use, so the connection can be re-used
+    '''
+    
+    # Use environment timeout by default
+    if timeout_sec is None:
+        timeout_sec = get_dbserver_timeout_sec()
+    
+    return get_dbserver_session().post(request_url, json = json_data, timeout = timeout_sec, stream = stream)
+
+# .....................................................................................................................
+# .....................................................................................................................
 
 
 # ---------------------------------------------------------------------------------------------------------------------
@@ -72,7 +212,7 @@ def check_server_connection(dbserver_url, feedback_on_error = True):
     # Request status check from the server
     server_is_alive = False
     try:
-        server_response = requests.get(status_check_url, timeout = 10)
+        server_response = dbserver_get(status_check_url, timeout_sec = 10)
         response_code = (server_response.status_code)
         server_is_alive = (response_code == 200)
         if not server_is_alive:
@@ -82,14 +222,14 @@ def check_server_connection(dbserver_url, feedback_on_error = True):
                   "",
                   "Status code: {}".format(response_code),
                   sep = "\n")
-        
+    
     except requests.ConnectionError:
         if feedback_on_error:
             print("",
                   "Error connecting to server:",
                   connection_str_for_errors,
                   sep = "\n")
-        
+    
     except requests.exceptions.ReadTimeout:
         if feedback_on_error:
             print("",
@@ -134,32 +274,218 @@ def connect_to_dbserver(dbserver_url, max_connection_attempts = 10, connection_r
 
 # .....................................................................................................................
 
-def get_snapshot_ems_list(dbserver_url, camera_select, start_ems, end_ems):
+def get_snapshot_ems_list(dbserver_url, camera_select, start_ems, end_ems, timeout_sec = None):
+    
+    '''
+    Function which gets a listing of all snapshot epoch ms values in a time range (end points included)
+    Previously listed time ranges are re-used, so that only the parts of the range that haven't been
+    listed before (or which may have gained new snapshots since) are requested from the dbserver
+    Raises a requests exception if the dbserver can't be reached or responds with an error
+    '''
+    
+    # Skip caching if it's disabled
+    if not SNAPSHOT_EMS_LIST_CACHE.enabled:
+        _, snapshot_ems_list = _get_snapshot_ems_list(dbserver_url, camera_select, start_ems, end_ems, timeout_sec)
+        return snapshot_ems_list
+    
+    # Use whatever is already cached, and request listings for any parts of the time range that aren't
+    # -> The listing is put together from the cached & requested parts, so that nothing is requested twice,
+    #    even if the full listing is too large to be cached
+    start_ems, end_ems = int(start_ems), int(end_ems)
+    snapshot_ems_list, gaps_list = SNAPSHOT_EMS_LIST_CACHE.get_covered(camera_select, start_ems, end_ems)
+    for gap_start_ems, gap_end_ems in gaps_list:
+        request_time = time()
+        response_success, gap_ems_list = \
+        _get_snapshot_ems_list(dbserver_url, camera_select, gap_start_ems, gap_end_ems, timeout_sec)
+        if not response_success:
+            return []
+        SNAPSHOT_EMS_LIST_CACHE.store(camera_select, gap_start_ems, gap_end_ems, gap_ems_list, request_time)
+        snapshot_ems_list += [each_ems for each_ems in gap_ems_list if gap_start_ems <= each_ems <= gap_end_ems]
+    
+    # Make sure the listing is in order, since it may have been put together from several parts
+    snapshot_ems_list = sorted(snapshot_ems_list)
+    
+    return snapshot_ems_list
+
+# .....................................................................................................................
+
+def get_snapshot_image_bytes(dbserver_url, camera_select, snapshot_epoch_ms, timeout_sec = None):
+    
+    # Use a cached copy of the image data if possible (snapshots never change once they're saved)
+    cache_key = (camera_select, str(snapshot_epoch_ms))
+    image_bytes = SNAPSHOT_BYTES_CACHE.get(cache_key)
+    if image_bytes is not None:
+        return True, image_bytes
+    
+    # Build the request url & make the request
+    image_request_url = build_snap_image_url(dbserver_url, camera_select, snapshot_epoch_ms)
+    response_success, image_bytes = _get_image_bytes(image_request_url, timeout_sec)
+    
+    # Hang on to the image data for re-use
+    if response_success:
+        SNAPSHOT_BYTES_CACHE.store(cache_key, image_bytes, len(image_bytes))
+    
+    return response_success, image_bytes
+
+# .....................................................................................................................
+
+def get_many_snapshot_image_bytes(dbserver_url, camera_select, snapshot_ems_list, max_in_flight = 8,
+                                  timeout_sec = None):
+    
+    '''
+    Function which downloads image data for many snapshots using a single (batch) request to the dbserver
+    Cached image data is re-used and missing epoch ms values (None) are skipped, so only the remaining
+    snapshots are requested. If the dbserver doesn't support batch requests (or the batch request fails),
+    the snapshots are downloaded one-by-one instead, using several requests in parallel (up to 'max_in_flight')
+    Snapshots that the dbserver doesn't have are reported as unsuccessful, while other errors are raised
+    Returns:
+        list of (response_success, image_bytes), in the same order as the input list
+    '''
+    
+    # Initialize output, using cached image data where possible
+    results_list = [(False, None)] * len(snapshot_ems_list)
+    request_indices_list = []
+    for each_idx, each_snap_ems in enumerate(snapshot_ems_list):
+        if each_snap_ems is None:
+            continue
+        image_bytes = SNAPSHOT_BYTES_CACHE.get((camera_select, str(each_snap_ems)))
+        if image_bytes is not None:
+            results_list[each_idx] = (True, image_bytes)
+            continue
+        request_indices_list.append(each_idx)
+    
+    # Bail if we don't need to request anything
+    if len(request_indices_list) == 0:
+        return results_list
+    
+    # Request all remaining snapshots at once, if possible
+    request_ems_list = [snapshot_ems_list[each_idx] for each_idx in request_indices_list]
+    batch_success, batch_results_list = \
+    _get_snapshot_image_batch(dbserver_url, camera_select, request_ems_list, timeout_sec)
+    
+    # Hang on to batched image data for re-use
+    if batch_success:
+        for each_snap_ems, (response_success, image_bytes) in zip(request_ems_list, batch_results_list):
+            if response_success:
+                SNAPSHOT_BYTES_CACHE.store((camera_select, str(each_snap_ems)), image_bytes, len(image_bytes))
+    
+    # Fall back to requesting snapshots one-by-one if the batch request didn't work out
+    else:
+        download_one_snapshot = \
+        lambda snapshot_epoch_ms: get_snapshot_image_bytes(dbserver_url, camera_select, snapshot_epoch_ms, timeout_sec)
+        batch_results_list = list(ordered_threaded_map(download_one_snapshot, request_ems_list, max_in_flight))
+    
+    # Fill in the requested results
+    for each_idx, each_result in zip(request_indices_list, batch_results_list):
+        results_list[each_idx] = each_result
+    
+    return results_list
+
+# .....................................................................................................................
+
+def iter_snapshot_image_bytes(dbserver_url, camera_select, snapshot_ems_iter, max_in_flight = 8, batch_size = None):
+    
+    '''
+    Generator which downloads snapshot image data for a sequence of epoch ms values, using several
+    requests in parallel (up to 'max_in_flight'). Results are always returned in the order of the input sequence
+    Snapshots are requested in batches (of up to 'batch_size' snapshots) when the dbserver supports it,
+    with the next batch downloading while the current one is being used. A batch size of 1 disables batching
+    Snapshots that the dbserver doesn't have are reported as unsuccessful, while other errors are raised
+    Returns:
+        (response_success, image_bytes) for each entry in the input sequence
+    '''
+    
+    # Use environment settings by default
+    if batch_size is None:
+        batch_size = get_snapshot_batch_size()
+    
+    # Download every snapshot with a separate request if we're not batching
+    if batch_size <= 1:
+        
+        def download_one_snapshot(snapshot_epoch_ms):
+    
+            # Don't bother requesting missing snapshot timing
+            if snapshot_epoch_ms is None:
+                return False, None
+            
+            return get_snapshot_image_bytes(dbserver_url, camera_select, snapshot_epoch_ms)
+        
+        yield from ordered_threaded_map(download_one_snapshot, snapshot_ems_iter, max_in_flight)
+        return
+    
+    # Split the in-flight limit across batches, which matters if we end up falling back to one-by-one requests
+    max_batches_in_flight = 2
+    max_in_flight_per_batch = max(1, max_in_flight // max_batches_in_flight)
+    download_one_batch = \
+    lambda ems_batch: get_many_snapshot_image_bytes(dbserver_url, camera_select, ems_batch, max_in_flight_per_batch)
+    
+    ems_batch_iter = iter_batches(snapshot_ems_iter, batch_size)
+    for each_results_list in ordered_threaded_map(download_one_batch, ems_batch_iter, max_batches_in_flight):
+        yield from each_results_list
+    
+    return
+
+# .....................................................................................................................
+
+def get_background_image_bytes(dbserver_url, camera_select, target_epoch_ms, timeout_sec = None):
+    
+    # Build the request url & make the request
+    image_request_url = build_bg_image_url(dbserver_url, camera_select, target_epoch_ms)
+    
+    return _get_image_bytes(image_request_url, timeout_sec)
+
+# .....................................................................................................................
+
+def _get_snapshot_ems_list(dbserver_url, camera_select, start_ems, end_ems, timeout_sec = None):
+    
+    '''
+    Helper function which requests a snapshot listing from the dbserver, without using any cached data
+    Only a 'not found' response is treated as an (unsuccessful) empty listing. Connection errors, timeouts
+    and other error responses are raised (as requests exceptions), so they aren't mistaken for missing snapshots
+    '''
     
     # Initialize output
     snapshot_ems_list = []
     
-    # Build the request url & make the request
+    # Build the request url & make the request, and bail on anything other than a missing listing
     snapshot_ems_list_request_url = build_snap_ems_list_url(dbserver_url, camera_select, start_ems, end_ems)
-    dbserver_response = requests.get(snapshot_ems_list_request_url)
+    try:
+        dbserver_response = dbserver_get(snapshot_ems_list_request_url, timeout_sec)
+        if dbserver_response.status_code != 404:
+            dbserver_response.raise_for_status()
+    except requests.exceptions.RequestException as err:
+        print("", "Error requesting snapshot listing:", "@ {}".format(snapshot_ems_list_request_url), str(err),
+              sep = "\n")
+        raise
     
     # Only return the response data if the response was ok
     response_success = (dbserver_response.status_code == 200)
     if response_success:
         snapshot_ems_list = dbserver_response.json()
     
-    return snapshot_ems_list
+    return response_success, snapshot_ems_list
 
 # .....................................................................................................................
 
-def get_snapshot_image_bytes(dbserver_url, camera_select, snapshot_epoch_ms):
+def _get_image_bytes(image_request_url, timeout_sec = None):
+    
+    '''
+    Helper function which handles image data requests, shared by snapshot & background requests
+    Only a 'not found' response is treated as a missing image. Connection errors, timeouts and other
+    error responses are raised (as requests exceptions), so that renders fail instead of silently dropping frames
+    '''
     
     # Initialize output
     image_bytes = None
     
-    # Build the request url & make the request
-    image_request_url = build_snap_image_url(dbserver_url, camera_select, snapshot_epoch_ms)
-    dbserver_response = requests.get(image_request_url)
+    # Make the request, and bail on anything other than a missing image
+    try:
+        dbserver_response = dbserver_get(image_request_url, timeout_sec)
+        if dbserver_response.status_code != 404:
+            dbserver_response.raise_for_status()
+    except requests.exceptions.RequestException as err:
+        print("", "Error requesting image data:", "@ {}".format(image_request_url), str(err), sep = "\n")
+        raise
     
     # Only return the response data if the response was ok
     response_success = (dbserver_response.status_code == 200)
@@ -170,26 +496,107 @@ def get_snapshot_image_bytes(dbserver_url, camera_select, snapshot_epoch_ms):
 
 # .....................................................................................................................
 
-def get_background_image_bytes(dbserver_url, camera_select, target_epoch_ms):
+def _get_snapshot_image_batch(dbserver_url, camera_select, snapshot_ems_list, timeout_sec = None):
     
-    # Initialize output
-    image_bytes = None
+    '''
+    Helper function which requests image data for many snapshots (with a single request) from the dbserver
+    The response is read as it streams in. It's expected to contain every requested snapshot in order,
+    each given as a 4-byte (big-endian, unsigned) image size, followed by the image data itself.
+    A size of zero indicates a missing snapshot
+    Returns:
+        batch_success, results_list (of (response_success, image_bytes) for each requested snapshot)
+    '''
     
-    # Build the request url & make the request
-    image_request_url = build_bg_image_url(dbserver_url, camera_select, target_epoch_ms)
-    dbserver_response = requests.get(image_request_url)
+    # Skip the request if the dbserver recently told us it doesn't handle batches
+    if not check_batch_support(dbserver_url):
+        return False, None
     
-    # Only return the response data if the response was ok
-    response_success = (dbserver_response.status_code == 200)
-    if response_success:
-        image_bytes = dbserver_response.content
+    batch_request_url = build_snap_image_batch_url(dbserver_url, camera_select)
+    try:
+        request_ems_list = [int(each_snap_ems) for each_snap_ems in snapshot_ems_list]
+        with dbserver_post(batch_request_url, request_ems_list, timeout_sec, stream = True) as dbserver_response:
+            
+            # Remember if the dbserver doesn't support batch requests, so we don't keep trying
+            response_code = dbserver_response.status_code
+            if response_code in BATCH_UNSUPPORTED_STATUS_CODES:
+                BATCH_UNSUPPORTED_TIME_LUT[dbserver_url] = monotonic()
+                return False, None
+            if response_code != 200:
+                return False, None
+            
+            # Read each snapshot as it comes in
+            results_list = []
+            dbserver_response.raw.decode_content = True
+            for _ in request_ems_list:
+                image_size_bytes = int.from_bytes(read_exact_bytes(dbserver_response.raw, 4), "big")
+                if image_size_bytes == 0:
+                    results_list.append((False, None))
+                    continue
+                results_list.append((True, read_exact_bytes(dbserver_response.raw, image_size_bytes)))
     
-    return response_success, image_bytes
+    except (requests.exceptions.RequestException, ValueError) as err:
+        print("", "Error requesting batch of image data:", "@ {}".format(batch_request_url), str(err), sep = "\n")
+        return False, None
+    
+    return True, results_list
+
+# .....................................................................................................................
+
+def check_batch_support(dbserver_url):
+    
+    ''' Helper function which checks whether batch requests should be tried (support is re-checked periodically) '''
+    
+    unsupported_time = BATCH_UNSUPPORTED_TIME_LUT.get(dbserver_url, None)
+    if unsupported_time is None:
+        return True
+    
+    return (monotonic() - unsupported_time) > BATCH_SUPPORT_RECHECK_SEC
+
+# .....................................................................................................................
+
+def iter_batches(input_iterable, batch_size):
+    
+    ''' Helper generator which groups the entries of an iterable into lists of (up to) 'batch_size' entries '''
+    
+    batch_list = []
+    for each_input in input_iterable:
+        batch_list.append(each_input)
+        if len(batch_list) >= batch_size:
+            yield batch_list
+            batch_list = []
+    
+    # Hand back any left over entries
+    if len(batch_list) > 0:
+        yield batch_list
+    
+    return
 
 # .....................................................................................................................
 # .....................................................................................................................
 
 
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Set up globals
+
+# Shared dbserver session (created on first use) so that all routes can re-use pooled connections
+DBSERVER_SESSION = None
+DBSERVER_SESSION_LOCK = Lock()
+
+# Shared storage for re-using snapshot image data across requests
+SNAPSHOT_BYTES_CACHE = LRU_Memory_Cache(get_snapshot_cache_size_mb())
+
+# Shared storage for re-using snapshot listings, so repeated/overlapping time ranges aren't re-listed
+SNAPSHOT_EMS_LIST_CACHE = Ems_List_Cache(get_ems_list_cache_max_entries(),
+                                         get_ems_list_live_window_sec(),
+                                         get_ems_list_live_ttl_sec())
+
+# Record of dbservers that don't handle batched snapshot requests (by time), so we only check occasionally
+# -> An older dbserver will respond as if the route doesn't exist
+BATCH_UNSUPPORTED_TIME_LUT = {}
+BATCH_UNSUPPORTED_STATUS_CODES = {404, 405, 501}
+BATCH_SUPPORT_RECHECK_SEC = 300
+
+
 # ---------------------------------------------------------------------------------------------------------------------
 #%% Demo
 
@@ -18,19 +18,30 @@ from flask import jsonify
 
 # .....................................................................................................................
 
-def json_response(response_dict, status_code = 200):
+def json_response(response_dict, status_code = 200, headers = None):
     
     ''' Helper function for handling the return of arbitrary json messages '''
     
+    if headers is not None:
+        return jsonify(response_dict), status_code, headers
+    
     return jsonify(response_dict), status_code
 
 # .....................................................................................................................
 
-def error_response(error_message, status_code = 500):
+def error_response(error_message, status_code = 500, headers = None):
     
     ''' Helper function for handling the return of error messages '''
     
-    return json_response({"error": error_message}, status_code)
+    return json_response({"error": error_message}, status_code, headers)
+
+# .....................................................................................................................
+
+def busy_response(error_message, status_code = 503, retry_after_sec = 5):
+    
+    ''' Helper function for handling responses to requests that can't be served right now, due to load '''
+    
+    return error_response(error_message, status_code, headers = {"Retry-After": str(int(retry_after_sec))})
 
 # .....................................................................................................................
 # .....................................................................................................................
@@ -0,0 +1,395 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 16:05:52 2026
+
+@author: eo
+"""
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Imports
+
+import os
+import subprocess
+import numpy as np
+
+from queue import Queue
+from threading import Thread, Condition, Semaphore
+
+from imageio_ffmpeg import get_ffmpeg_exe
+
+from local.lib.video_encoding import FFmpeg_Video_Writer, get_encoder_profile_settings, get_frame_data_wh
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Define classes
+
+class Segmented_Video_Writer:
+    
+    '''
+    Class used to encode long (mp4) videos using several ffmpeg processes running in parallel
+    Frames are split into fixed-length segments, each of which is encoded (as a separate mp4) by its own
+    ffmpeg process, so that a single encoder doesn't limit how fast frames can be handled.
+    Once all frames are written, the segments are joined together by copying (not re-encoding) the
+    encoded data into a single output file. Each segment starts on a keyframe and segment lengths are a
+    multiple of the keyframe interval (if the encoder profile has one), so keyframe spacing stays regular
+    
+    Frames are queued up in memory while waiting to be encoded, with the total amount of queued
+    frame data limited by the buffer size. At most 'max_workers' segments are encoded at the same time.
+    The encoder threads are split evenly between workers (every segment, including the first, gets an
+    equal share), so the total number of encoder threads never exceeds the given thread count.
+    If a thread count is given, the number of workers is limited to the number of threads
+    
+    Has the same interface as the FFmpeg_Video_Writer (without streaming support)
+    '''
+    
+    # .................................................................................................................
+    
+    def __init__(self, output_path, frame_rate, output_wh = None, encoder_profile = "default",
+                 encoder_threads = None, max_workers = 2, segment_frames = 240, buffer_size_mb = 256):
+        
+        # Store encoding settings
+        self.output_path = output_path
+        self.frame_rate = frame_rate
+        self.output_wh = None if output_wh is None else tuple(output_wh)
+        self.encoder_profile = encoder_profile
+        self.encoder_threads = encoder_threads
+        self.max_workers = max(1, int(max_workers))
+        if encoder_threads is not None:
+            self.max_workers = min(self.max_workers, max(1, int(encoder_threads)))
+        self.segment_frames = get_keyframe_aligned_segment_frames(segment_frames, frame_rate, encoder_profile)
+        self.buffer_size_bytes = max(1, int(buffer_size_mb * 1_000_000))
+        
+        # Allocate storage for segment encoders, which are started as frames come in
+        self.frame_wh = None
+        self.frame_count = 0
+        self._segments_list = []
+        self._worker_slots = Semaphore(self.max_workers)
+        self._buffer_condition = Condition()
+        self._buffered_bytes = 0
+    
+    # .................................................................................................................
+    
+    def __enter__(self):
+        return self
+    
+    # .................................................................................................................
+    
+    def __exit__(self, exception_type, exception_value, traceback):
+        
+        # Don't bother finishing the video if something went wrong while writing frames
+        if exception_type is not None:
+            self.kill()
+            return
+        
+        self.close()
+    
+    # .................................................................................................................
+    
+    def write_frame(self, frame_data):
+        
+        ''' Function used to add a frame to the output video. Frame data can be pixel or jpeg data '''
+        
+        # Bail if any of the segments failed, since the output can't be completed
+        self._raise_segment_errors()
+        
+        # Start a new segment when the current one is full
+        # -> All segments are forced to the same sizing, otherwise they can't be joined together!
+        if self.frame_wh is None:
+            self.frame_wh = get_frame_data_wh(frame_data) if self.output_wh is None else self.output_wh
+        is_new_segment = (self.frame_count % self.segment_frames) == 0
+        if is_new_segment:
+            self._start_next_segment()
+        
+        # Wait for the encoders to catch up if too much frame data is queued up
+        frame_size_bytes = frame_data.nbytes if isinstance(frame_data, np.ndarray) else len(frame_data)
+        self._reserve_buffer_space(frame_size_bytes)
+        self._segments_list[-1].queue_frame(frame_data, frame_size_bytes)
+        self.frame_count += 1
+    
+    # .................................................................................................................
+    
+    def close(self):
+        
+        ''' Function used to finish encoding. Returns the path to the output file '''
+        
+        # Bail if we never got any frames, since there won't be a video!
+        if len(self._segments_list) == 0:
+            raise ValueError("No frames were provided for encoding!")
+        
+        # Wait for all segments to finish encoding
+        self._segments_list[-1].close_input()
+        for each_segment in self._segments_list:
+            each_segment.join()
+        self._raise_segment_errors()
+        
+        # Join segments into the final output, unless there's only 1 segment, which can be used as-is
+        segment_paths_list = [each_segment.output_path for each_segment in self._segments_list]
+        try:
+            if len(segment_paths_list) == 1:
+                os.replace(segment_paths_list[0], self.output_path)
+            else:
+                concatenate_video_files(segment_paths_list, self.output_path)
+        finally:
+            remove_files(segment_paths_list)
+        
+        return self.output_path
+    
+    # .................................................................................................................
+    
+    def kill(self):
+        
+        ''' Function used to shut down all encoders without finishing the output '''
+        
+        for each_segment in self._segments_list:
+            each_segment.kill()
+        for each_segment in self._segments_list:
+            each_segment.join()
+        remove_files([each_segment.output_path for each_segment in self._segments_list])
+    
+    # .................................................................................................................
+    
+    def _start_next_segment(self):
+        
+        ''' Helper used to finish queueing frames for the current segment & start encoding a new one '''
+        
+        # Signal that the current segment won't be getting any more frames
+        segment_index = len(self._segments_list)
+        if segment_index > 0:
+            self._segments_list[-1].close_input()
+        
+        # Wait until there's a free worker, so we don't run too many encoders at once
+        self._worker_slots.acquire()
+        
+        # Split encoder threads evenly between workers, so all segments together stay within the thread limit
+        encoder_threads = self.encoder_threads
+        if encoder_threads is not None:
+            encoder_threads = max(1, encoder_threads // self.max_workers)
+        
+        # Set up the segment encoder, which writes frames to a separate file as they're queued up
+        output_name, output_ext = os.path.splitext(self.output_path)
+        segment_path = "{}_segment_{:03}{}".format(output_name, segment_index, output_ext)
+        segment_writer = FFmpeg_Video_Writer(segment_path, self.frame_rate, output_wh = self.frame_wh,
+                                             encoder_profile = self.encoder_profile,
+                                             encoder_threads = encoder_threads)
+        new_segment = Video_Segment_Encoder(segment_writer, self._release_buffer_space, self._worker_slots.release)
+        self._segments_list.append(new_segment)
+        new_segment.start()
+    
+    # .................................................................................................................
+    
+    def _reserve_buffer_space(self, size_bytes):
+        
+        ''' Helper used to block until there is space for more frame data (at least 1 frame is always allowed) '''
+        
+        with self._buffer_condition:
+            self._buffer_condition.wait_for(lambda: (self._buffered_bytes == 0)
+                                            or (self._buffered_bytes + size_bytes <= self.buffer_size_bytes))
+            self._buffered_bytes += size_bytes
+    
+    # .................................................................................................................
+    
+    def _release_buffer_space(self, size_bytes):
+        
+        ''' Helper used (by segment encoders) to indicate that queued frame data has been handed over to ffmpeg '''
+        
+        with self._buffer_condition:
+            self._buffered_bytes -= size_bytes
+            self._buffer_condition.notify_all()
+    
+    # .................................................................................................................
+    
+    def _raise_segment_errors(self):
+        
+        ''' Helper used to pass errors from segment encoders back to the thread writing frames '''
+        
+        for each_segment in self._segments_list:
+            if each_segment.error is not None:
+                self.kill()
+                raise each_segment.error
+    
+    # .................................................................................................................
+    # .................................................................................................................
+
+
+class Video_Segment_Encoder:
+    
+    '''
+    Helper class used to encode a single segment of a larger video, on its own thread
+    Frames are queued up and handed over to the (ffmpeg) writer as fast as it can take them
+    Queued frames are always removed, even if the encoder fails, so that buffer space is never held onto
+    '''
+    
+    # .................................................................................................................
+    
+    def __init__(self, video_writer, release_buffer_func, on_finished_func):
+        
+        # Store inputs
+        self.video_writer = video_writer
+        self.output_path = video_writer.output_path
+        self._release_buffer_func = release_buffer_func
+        self._on_finished_func = on_finished_func
+        
+        # Allocate storage for handing frames over to the encoding thread
+        self.error = None
+        self._is_killed = False
+        self._frame_queue = Queue()
+        self._thread = Thread(target = self._run_encoder, daemon = True)
+    
+    # .................................................................................................................
+    
+    def start(self):
+        self._thread.start()
+    
+    # .................................................................................................................
+    
+    def queue_frame(self, frame_data, frame_size_bytes):
+        self._frame_queue.put((frame_data, frame_size_bytes))
+    
+    # .................................................................................................................
+    
+    def close_input(self):
+        self._frame_queue.put(None)
+    
+    # .................................................................................................................
+    
+    def join(self):
+        self._thread.join()
+    
+    # .................................................................................................................
+    
+    def kill(self):
+        
+        ''' Function used to stop encoding, without finishing the segment file '''
+        
+        self._is_killed = True
+        self.video_writer.kill()
+        self.close_input()
+    
+    # .................................................................................................................
+    
+    def _run_encoder(self):
+        
+        ''' Helper which runs (on a separate thread) to pass queued frames to the encoder '''
+        
+        try:
+            while True:
+                
+                # Stop once we get the signal that there are no more frames
+                queue_item = self._frame_queue.get()
+                if queue_item is None:
+                    break
+                
+                # Free up buffer space as soon as the frame is handed to the encoder (or skipped on errors)
+                frame_data, frame_size_bytes = queue_item
+                try:
+                    if not (self._is_killed or self.error is not None):
+                        self.video_writer.write_frame(frame_data)
+                except Exception as err:
+                    self.error = err
+                finally:
+                    self._release_buffer_func(frame_size_bytes)
+            
+            # Finish up the segment file, as long as nothing went wrong
+            if not (self._is_killed or self.error is not None):
+                self.video_writer.close()
+        
+        except Exception as err:
+            self.error = err
+        
+        finally:
+            if self.error is not None or self._is_killed:
+                self.video_writer.kill()
+            self._on_finished_func()
+        
+        return
+    
+    # .................................................................................................................
+    # .................................................................................................................
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Functions
+
+# .....................................................................................................................
+
+def get_keyframe_aligned_segment_frames(segment_frames, frame_rate, encoder_profile = "default"):
+    
+    '''
+    Helper function which rounds the segment length (in frames) up to a multiple of the keyframe interval
+    of the given encoder profile. Profiles without a fixed keyframe interval don't need rounding
+    '''
+    
+    segment_frames = max(1, int(segment_frames))
+    keyframe_interval_sec = get_encoder_profile_settings(encoder_profile)["keyframe_interval_sec"]
+    if keyframe_interval_sec is None:
+        return segment_frames
+    
+    keyframe_interval = max(1, int(round(keyframe_interval_sec * frame_rate)))
+    num_keyframes = int(np.ceil(segment_frames / keyframe_interval))
+    
+    return num_keyframes * keyframe_interval
+
+# .....................................................................................................................
+
+def concatenate_video_files(input_paths_list, output_path):
+    
+    '''
+    Function which joins videos (encoded with the same settings) into a single file without re-encoding
+    Uses ffmpeg's 'concat' demuxer, which offsets the timing of each video to follow the previous one
+    '''
+    
+    # Build the listing of files to join, with quotes escaped as needed by ffmpeg
+    list_file_path = "{}_segments.txt".format(os.path.splitext(output_path)[0])
+    escape_path = lambda path: os.path.abspath(path).replace("'", "'\\''")
+    with open(list_file_path, "w") as out_file:
+        for each_path in input_paths_list:
+            out_file.write("file '{}'\n".format(escape_path(each_path)))
+    
+    # Copy the encoded data from each file into the output
+    ffmpeg_command = [get_ffmpeg_exe(), "-y", "-loglevel", "error",
+                      "-f", "concat", "-safe", "0", "-i", list_file_path,
+                      "-c", "copy", output_path]
+    try:
+        ffmpeg_result = subprocess.run(ffmpeg_command, stdin = subprocess.DEVNULL,
+                                       stdout = subprocess.DEVNULL, stderr = subprocess.PIPE)
+    finally:
+        remove_files([list_file_path])
+    
+    if ffmpeg_result.returncode != 0:
+        error_output = ffmpeg_result.stderr.decode("utf-8", errors = "replace").strip()
+        raise RuntimeError("Error joining video segments (ffmpeg): {}".format(error_output))
+    
+    return output_path
+
+# .....................................................................................................................
+
+def remove_files(file_paths_list):
+    
+    ''' Helper function used to clean up (temporary) files, ignoring files that don't exist '''
+    
+    for each_path in file_paths_list:
+        try:
+            os.remove(each_path)
+        except FileNotFoundError:
+            pass
+    
+    return
+
+# .....................................................................................................................
+# .....................................................................................................................
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Demo
+
+if __name__ == "__main__":
+    
+    pass
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Scrap
+
+
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 13:37:21 2026
+
+@author: eo
+"""
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Imports
+
+from threading import Lock, Event
+from contextlib import contextmanager
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Define classes
+
+class Single_Flight_Group:
+    
+    '''
+    Class used to share the result of (slow) work between callers that ask for the same thing at the same time
+    The first caller for a given key does the work, while any other callers using the same key
+    (while the work is still in progress) wait for, and then share, the same result (or error).
+    
+    Results are reference counted, so that a cleanup function can be run once every caller is done with
+    the result (e.g. to delete a shared file). Usage:
+        
+        with flight_group.join(key, work_func, cleanup_func) as result:
+            ... use result ...
+    '''
+    
+    # .................................................................................................................
+    
+    def __init__(self):
+        
+        # Allocate storage for keeping track of work in progress
+        self._lock = Lock()
+        self._flight_lut = {}
+        
+        # Keep track of how often work is shared, for reporting
+        self.leader_count = 0
+        self.follower_count = 0
+    
+    # .................................................................................................................
+    
+    def __repr__(self):
+        return "Single_Flight_Group ({} in progress)".format(len(self._flight_lut))
+    
+    # .................................................................................................................
+    
+    @contextmanager
+    def join(self, key, work_func, cleanup_func = None):
+        
+        '''
+        Function used to get the result of some work, either by doing the work or waiting on someone else
+        Must be used as a context manager. The result should not be used after exiting the context!
+        '''
+        
+        # Attach to work already in progress if possible, otherwise we become responsible for doing the work
+        with self._lock:
+            flight_ref = self._flight_lut.get(key, None)
+            is_leader = (flight_ref is None)
+            if is_leader:
+                flight_ref = _Flight(cleanup_func)
+                self._flight_lut[key] = flight_ref
+                self.leader_count += 1
+            else:
+                self.follower_count += 1
+            flight_ref.ref_count += 1
+        
+        try:
+            # Either do the work or wait for it to finish
+            if is_leader:
+                try:
+                    flight_ref.run(work_func)
+                finally:
+                    # Make sure waiting callers are always let go. Later callers will start new work
+                    with self._lock:
+                        del self._flight_lut[key]
+                    flight_ref.done_event.set()
+            else:
+                flight_ref.done_event.wait()
+            
+            # Share errors as well as results
+            if flight_ref.error is not None:
+                raise flight_ref.error
+            yield flight_ref.result
+        
+        finally:
+            self._release(flight_ref)
+        
+        return
+    
+    # .................................................................................................................
+    
+    def get_stats(self):
+        
+        ''' Function which returns a dictionary describing how often work has been shared '''
+        
+        with self._lock:
+            stats_dict = {"in_progress": len(self._flight_lut),
+                          "leaders": self.leader_count,
+                          "followers": self.follower_count}
+        
+        return stats_dict
+    
+    # .................................................................................................................
+    
+    def _release(self, flight_ref):
+        
+        ''' Helper used to drop a reference to a shared result, cleaning up after the last reference is gone '''
+        
+        with self._lock:
+            flight_ref.ref_count -= 1
+            is_last_ref = (flight_ref.ref_count == 0)
+        
+        if is_last_ref:
+            flight_ref.cleanup()
+        
+        return
+    
+    # .................................................................................................................
+    # .................................................................................................................
+
+
+class _Flight:
+    
+    ''' Helper class used to hold the (shared) state of a single piece of work, for the Single_Flight_Group '''
+    
+    # .................................................................................................................
+    
+    def __init__(self, cleanup_func = None):
+        
+        self.cleanup_func = cleanup_func
+        self.done_event = Event()
+        self.ref_count = 0
+        self.result = None
+        self.error = None
+    
+    # .................................................................................................................
+    
+    def run(self, work_func):
+        
+        ''' Function used to do the work, recording errors instead of raising them so they can be shared '''
+        
+        try:
+            self.result = work_func()
+        except Exception as err:
+            self.error = err
+        
+        return
+    
+    # .................................................................................................................
+    
+    def cleanup(self):
+        
+        ''' Function used to clean up a result, once no one is using it anymore '''
+        
+        if self.cleanup_func is not None and self.error is None:
+            self.cleanup_func(self.result)
+        
+        return
+    
+    # .................................................................................................................
+    # .................................................................................................................
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Demo
+
+if __name__ == "__main__":
+    
+    pass
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Scrap
+
+
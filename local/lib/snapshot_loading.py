@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Wed Oct 14 16:02:48 2026
+
+@author: eo
+"""
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Imports
+
+import cv2
+
+from local.lib.environment import get_frame_cache_size_mb
+from local.lib.environment import get_background_cache_size_mb, get_background_cache_window_sec
+from local.lib.memory_cache import LRU_Memory_Cache
+from local.lib.threading_helpers import ordered_threaded_map
+from local.lib.request_helpers import get_snapshot_image_bytes, get_background_image_bytes, SNAPSHOT_BYTES_CACHE
+from local.lib.request_helpers import iter_snapshot_image_bytes, SNAPSHOT_EMS_LIST_CACHE
+from local.lib.image_read_write import image_bytes_to_pixels, get_jpeg_dimensions, pick_jpeg_reduction_factor
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Loading functions
+
+# .....................................................................................................................
+
+def load_snapshot_frame(dbserver_url, camera_select, snapshot_epoch_ms, frame_wh = None):
+    
+    '''
+    Function which retrieves a (decoded) snapshot image, re-using previously decoded copies where possible
+    If a frame size is given, the image is scaled to that size (using a reduced-size decode where possible)
+    Note that the returned frame is read-only (since it may be shared), it must be copied before drawing on it!
+    Returns:
+        got_snapshot, snapshot_frame
+    '''
+    
+    # Don't bother requesting missing snapshot timing
+    if snapshot_epoch_ms is None:
+        return False, None
+    
+    # Use a cached copy of the decoded image if possible
+    frame_wh = None if frame_wh is None else tuple(frame_wh)
+    cache_key = (camera_select, str(snapshot_epoch_ms), frame_wh)
+    snapshot_frame = SNAPSHOT_FRAME_CACHE.get(cache_key)
+    if snapshot_frame is not None:
+        return True, snapshot_frame
+    
+    # Request image data from dbserver
+    got_snapshot, snap_bytes = get_snapshot_image_bytes(dbserver_url, camera_select, snapshot_epoch_ms)
+    if not got_snapshot:
+        return False, None
+    
+    return decode_snapshot_frame(camera_select, snapshot_epoch_ms, snap_bytes, frame_wh)
+
+# .....................................................................................................................
+
+def decode_snapshot_frame(camera_select, snapshot_epoch_ms, snap_bytes, frame_wh = None):
+    
+    '''
+    Function which decodes (already downloaded) snapshot image data, scaled to the given frame size if needed
+    The decoded image is stored for re-use (see load_snapshot_frame) and is read-only!
+    Returns:
+        got_snapshot, snapshot_frame
+    '''
+    
+    # Decode the image data (at reduced size if possible), treating bad data the same as a missing snapshot
+    frame_wh = None if frame_wh is None else tuple(frame_wh)
+    reduction_factor = pick_jpeg_reduction_factor(get_jpeg_dimensions(snap_bytes), frame_wh)
+    snapshot_frame = image_bytes_to_pixels(snap_bytes, reduction_factor)
+    if snapshot_frame is None:
+        return False, None
+    
+    # Scale to the exact target size if needed
+    snap_height, snap_width = snapshot_frame.shape[0:2]
+    if (frame_wh is not None) and ((snap_width, snap_height) != frame_wh):
+        snapshot_frame = cv2.resize(snapshot_frame, dsize = frame_wh, interpolation = cv2.INTER_AREA)
+    
+    # Hang on to the decoded image for re-use, making sure it can't be modified since it's shared
+    cache_key = (camera_select, str(snapshot_epoch_ms), frame_wh)
+    snapshot_frame.flags.writeable = False
+    SNAPSHOT_FRAME_CACHE.store(cache_key, snapshot_frame, snapshot_frame.nbytes)
+    
+    return True, snapshot_frame
+
+# .....................................................................................................................
+
+def iter_snapshot_frames(dbserver_url, camera_select, snapshot_ems_iter, max_in_flight = 8, frame_wh = None,
+                         keep_jpeg_list = None):
+    
+    '''
+    Generator which loads (decoded) snapshot images for a sequence of epoch ms values, using several
+    threads in parallel (up to 'max_in_flight'). Results are always returned in the order of the input sequence
+    Image data is downloaded in batches (see iter_snapshot_image_bytes), skipping snapshots that are already decoded
+    If a frame size is given, all images are scaled to that size
+    If a 'keep jpeg' list is given, snapshots flagged as True are returned as (undecoded) jpeg data instead
+    Returns:
+        (got_snapshot, snapshot_frame) for each entry in the input sequence
+    '''
+    
+    # For convenience
+    frame_wh = None if frame_wh is None else tuple(frame_wh)
+    snapshot_ems_list = list(snapshot_ems_iter)
+    if keep_jpeg_list is None:
+        keep_jpeg_list = [False] * len(snapshot_ems_list)
+    
+    # Figure out which snapshots need to be downloaded, since decoded copies may already be available
+    # -> Snapshots that aren't downloaded are loaded when needed, in case they're no longer available by then
+    needs_download_list = [keep_jpeg or ((snap_ems is not None) and
+                                         ((camera_select, str(snap_ems), frame_wh) not in SNAPSHOT_FRAME_CACHE))
+                           for snap_ems, keep_jpeg in zip(snapshot_ems_list, keep_jpeg_list)]
+    download_ems_iter = (snap_ems for snap_ems, needs_download in zip(snapshot_ems_list, needs_download_list)
+                         if needs_download)
+    snap_bytes_iter = iter_snapshot_image_bytes(dbserver_url, camera_select, download_ems_iter, max_in_flight)
+    
+    # Pair up each snapshot with its downloaded data (if any)
+    snapshot_data_iter = ((snap_ems, keep_jpeg, next(snap_bytes_iter) if needs_download else None)
+                          for snap_ems, keep_jpeg, needs_download
+                          in zip(snapshot_ems_list, keep_jpeg_list, needs_download_list))
+    
+    def load_one_snapshot(snapshot_data):
+        
+        # Load snapshots that weren't downloaded as usual (these should already be decoded)
+        snapshot_epoch_ms, keep_jpeg, snap_bytes_result = snapshot_data
+        if snap_bytes_result is None:
+            return load_snapshot_frame(dbserver_url, camera_select, snapshot_epoch_ms, frame_wh)
+        
+        # Hand back jpeg data as-is if needed, otherwise decode it
+        got_snapshot, snap_bytes = snap_bytes_result
+        if keep_jpeg or (not got_snapshot):
+            return got_snapshot, snap_bytes
+        
+        return decode_snapshot_frame(camera_select, snapshot_epoch_ms, snap_bytes, frame_wh)
+    
+    # Decode in parallel, making sure to stop downloading if we finish early
+    try:
+        yield from ordered_threaded_map(load_one_snapshot, snapshot_data_iter, max_in_flight)
+    finally:
+        snap_bytes_iter.close()
+    
+    return
+
+# .....................................................................................................................
+
+def load_ghosting_background(dbserver_url, camera_select, target_epoch_ms, frame_wh):
+    
+    '''
+    Function which retrieves the (decoded) background image used for ghosting, already scaled to the frame size
+    Backgrounds are re-used for any request targeting the same camera & time, which avoids re-downloading
+    & re-scaling the same background. If a time window is set (see BACKGROUND_CACHE_WINDOW_SEC), requests
+    targeting the same window share a background, even if the dbserver would have returned a different one!
+    Note that the returned frame is read-only (since it may be shared)!
+    '''
+    
+    # Bail if we don't have a target time
+    if target_epoch_ms is None:
+        raise FileNotFoundError("Couldn't retrieve background image for ghosting! (no target time)")
+    
+    # Figure out which time window the target falls into, for re-using backgrounds
+    # -> Without a window, backgrounds are only re-used for the exact same target time
+    window_ms = max(1, int(1000 * get_background_cache_window_sec()))
+    window_index = int(target_epoch_ms) // window_ms
+    scaled_cache_key = (camera_select, window_index, tuple(frame_wh))
+    full_cache_key = (camera_select, window_index, None)
+    
+    # Use a cached copy of the background, already scaled to the frame size, if possible
+    scaled_bg_frame = BACKGROUND_CACHE.get(scaled_cache_key)
+    if scaled_bg_frame is not None:
+        return scaled_bg_frame
+    
+    # Use a cached copy of the full-sized background if possible, otherwise request it from the dbserver
+    bg_frame = BACKGROUND_CACHE.get(full_cache_key)
+    if bg_frame is None:
+        got_background, bg_bytes = get_background_image_bytes(dbserver_url, camera_select, target_epoch_ms)
+        bg_frame = image_bytes_to_pixels(bg_bytes) if got_background else None
+        if bg_frame is None:
+            raise FileNotFoundError("Couldn't retrieve background image for ghosting!")
+        bg_frame.flags.writeable = False
+        BACKGROUND_CACHE.store(full_cache_key, bg_frame, bg_frame.nbytes)
+    
+    # Scale the background to the frame size, so ghosting doesn't need to re-scale it on every frame
+    scaled_bg_frame = bg_frame
+    bg_height, bg_width = bg_frame.shape[0:2]
+    if (bg_width, bg_height) != tuple(frame_wh):
+        scaled_bg_frame = cv2.resize(bg_frame, dsize = tuple(frame_wh), interpolation = cv2.INTER_AREA)
+        scaled_bg_frame.flags.writeable = False
+        BACKGROUND_CACHE.store(scaled_cache_key, scaled_bg_frame, scaled_bg_frame.nbytes)
+    
+    return scaled_bg_frame
+
+# .....................................................................................................................
+
+def get_snapshot_cache_stats():
+    
+    ''' Helper function which reports the usage of the (shared) snapshot caches '''
+    
+    return {"snapshot_bytes": SNAPSHOT_BYTES_CACHE.get_stats(),
+            "snapshot_frames": SNAPSHOT_FRAME_CACHE.get_stats(),
+            "snapshot_ems_lists": SNAPSHOT_EMS_LIST_CACHE.get_stats(),
+            "backgrounds": BACKGROUND_CACHE.get_stats()}
+
+# .....................................................................................................................
+# .....................................................................................................................
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Set up globals
+
+# Shared storage for re-using decoded snapshots across requests
+SNAPSHOT_FRAME_CACHE = LRU_Memory_Cache(get_frame_cache_size_mb())
+
+# Shared storage for re-using decoded (& scaled) backgrounds across requests
+BACKGROUND_CACHE = LRU_Memory_Cache(get_background_cache_size_mb())
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Demo
+
+if __name__ == "__main__":
+    
+    pass
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Scrap
+
+
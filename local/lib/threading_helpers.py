@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 12 10:21:44 2026
+
+@author: eo
+"""
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Imports
+
+from collections import deque
+from threading import Thread, Condition
+from concurrent.futures import ThreadPoolExecutor
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Threading functions
+
+# .....................................................................................................................
+
+def ordered_threaded_map(map_func, input_iterable, max_in_flight = 8):
+    
+    '''
+    Generator which applies a function to every entry of an iterable using a pool of threads,
+    while still yielding results in the same order as the inputs.
+    At most 'max_in_flight' entries are being processed (or waiting to be consumed) at any one time,
+    which bounds both the load placed on other services and the amount of data held in memory
+    '''
+    
+    # Don't bother with threading if we're only allowed to work on one entry at a time
+    max_in_flight = max(1, int(max_in_flight))
+    if max_in_flight == 1:
+        for each_input in input_iterable:
+            yield map_func(each_input)
+        return
+    
+    # Keep submitting work until we hit the in-flight limit, then hand back the oldest result before continuing
+    pending_futures = deque()
+    executor = ThreadPoolExecutor(max_workers = max_in_flight)
+    try:
+        for each_input in input_iterable:
+            pending_futures.append(executor.submit(map_func, each_input))
+            if len(pending_futures) >= max_in_flight:
+                yield pending_futures.popleft().result()
+        
+        # Hand back whatever is left over once we run out of inputs
+        while pending_futures:
+            yield pending_futures.popleft().result()
+    
+    finally:
+        # If the consumer stops early (or an error occurs), don't bother finishing queued work
+        for each_future in pending_futures:
+            each_future.cancel()
+        executor.shutdown(wait = True)
+    
+    return
+
+# .....................................................................................................................
+
+def iter_read_ahead(input_iterable, max_items = 16, max_bytes = None, size_func = len):
+    
+    '''
+    Generator which pulls entries from an iterable using a separate thread, ahead of when they're needed,
+    so that producing the next entries overlaps with whatever the consumer is doing with the current one.
+    The read-ahead stops once 'max_items' entries are waiting, or once the waiting entries add up to
+    'max_bytes' (as measured by 'size_func'), and resumes as entries are consumed, so memory use stays bounded.
+    Errors raised by the iterable are re-raised for the consumer (after any entries read before the error)
+    A limit of zero items disables read-ahead
+    '''
+    
+    # Don't bother with threading if we're not reading ahead
+    max_items = int(max_items)
+    if max_items < 1:
+        yield from input_iterable
+        return
+    
+    # Allocate storage for entries that are waiting to be consumed
+    waiting_entries = deque()
+    buffer_condition = Condition()
+    state_lut = {"waiting_bytes": 0, "finished": False, "stop": False, "error": None}
+    
+    def is_buffer_full():
+        too_many_items = (len(waiting_entries) >= max_items)
+        too_many_bytes = (max_bytes is not None) and (state_lut["waiting_bytes"] >= max_bytes)
+        return too_many_items or too_many_bytes
+    
+    def read_ahead():
+        
+        # Wait until there is room before reading each entry, so at most one entry beyond the limits is held
+        input_iter = iter(input_iterable)
+        try:
+            while True:
+                with buffer_condition:
+                    while is_buffer_full() and not state_lut["stop"]:
+                        buffer_condition.wait()
+                    if state_lut["stop"]:
+                        break
+                
+                next_entry = next(input_iter, StopIteration)
+                if next_entry is StopIteration:
+                    break
+                entry_size = size_func(next_entry) if max_bytes is not None else 0
+                
+                with buffer_condition:
+                    waiting_entries.append((next_entry, entry_size))
+                    state_lut["waiting_bytes"] += entry_size
+                    buffer_condition.notify_all()
+        
+        except Exception as err:
+            state_lut["error"] = err
+        
+        finally:
+            # Close generators from this thread, so they stop any work of their own (e.g. thread pools)
+            if hasattr(input_iter, "close"):
+                input_iter.close()
+            with buffer_condition:
+                state_lut["finished"] = True
+                buffer_condition.notify_all()
+        
+        return
+    
+    read_ahead_thread = Thread(target = read_ahead, daemon = True)
+    read_ahead_thread.start()
+    try:
+        while True:
+            
+            # Wait for the next entry, or for the read-ahead to finish
+            with buffer_condition:
+                while (len(waiting_entries) == 0) and (not state_lut["finished"]):
+                    buffer_condition.wait()
+                if len(waiting_entries) == 0:
+                    break
+                next_entry, entry_size = waiting_entries.popleft()
+                state_lut["waiting_bytes"] -= entry_size
+                buffer_condition.notify_all()
+            
+            yield next_entry
+        
+        # Pass along errors from the iterable, once all good entries have been handed back
+        if state_lut["error"] is not None:
+            raise state_lut["error"]
+    
+    finally:
+        # If the consumer stops early (or an error occurs), stop reading ahead
+        with buffer_condition:
+            state_lut["stop"] = True
+            waiting_entries.clear()
+            buffer_condition.notify_all()
+        read_ahead_thread.join()
+    
+    return
+
+# .....................................................................................................................
+# .....................................................................................................................
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Demo
+
+if __name__ == "__main__":
+    
+    pass
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Scrap
+
+
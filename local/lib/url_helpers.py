@@ -44,6 +44,15 @@ def build_snap_image_url(dbserver_url, camera_select, snapshot_epoch_ms):
 
 # .....................................................................................................................
 
+def build_snap_image_batch_url(dbserver_url, camera_select):
+    
+    ''' Helper function for generating the url to download many snapshots at once (epoch ms values are POSTed) '''
+    
+    return build_dbserver_url(dbserver_url, camera_select,
+                              "snapshots", "get-many-images", "by-ems-list")
+
+# .....................................................................................................................
+
 def build_bg_image_url(dbserver_url, camera_select, target_epoch_ms):
     
     ''' Helper function for generating urls to download background image data '''
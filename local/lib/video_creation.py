@@ -49,23 +49,33 @@ find_path_to_local()
 # ---------------------------------------------------------------------------------------------------------------------
 #%% Imports
 
-import cv2
-import base64
+import shutil
 import datetime as dt
 import numpy as np
 
-from tempfile import TemporaryDirectory
+from itertools import chain
+from threading import Thread
+from tempfile import TemporaryDirectory, mkdtemp
 
-from moviepy.editor import ImageSequenceClip
+from flask import send_file, Response
 
-from flask import send_file
-
-from local.lib.environment import get_default_fps
-from local.lib.request_helpers import get_snapshot_image_bytes, get_background_image_bytes
-from local.lib.response_helpers import error_response
-from local.lib.image_read_write import image_bytes_to_pixels, image_pixels_to_bytes, save_one_jpg
-from local.lib.ghosting_functions import apply_ghosting
-from local.lib.drawing_functions import interpret_drawing_call
+from local.lib.environment import get_default_fps, get_max_concurrent_downloads, get_frame_processing_workers
+from local.lib.environment import get_gif_palette_mode, get_encoder_threads
+from local.lib.environment import get_segment_encoding_workers, get_segment_encoding_sec
+from local.lib.environment import get_segment_encoding_buffer_mb, get_read_ahead_frames, get_read_ahead_mb
+from local.lib.threading_helpers import ordered_threaded_map, iter_read_ahead
+from local.lib.request_helpers import iter_snapshot_image_bytes, get_snapshot_image_bytes
+from local.lib.snapshot_loading import iter_snapshot_frames, load_ghosting_background
+from local.lib.response_helpers import error_response, busy_response
+from local.lib.image_read_write import image_pixels_to_bytes, get_jpeg_dimensions
+from local.lib.ghosting_functions import apply_ghosting, apply_ghosting_batch
+from local.lib.drawing_functions import Drawing_Plan
+from local.lib.video_encoding import FFmpeg_Video_Writer, is_jpeg_data, get_frame_data_wh
+from local.lib.gif_encoding import Animated_GIF_Writer
+from local.lib.segmented_encoding import Segmented_Video_Writer
+from local.lib.render_cache import make_render_key
+from local.lib.render_scheduler import estimate_render_cost_mpx, request_render_ticket
+from local.lib.single_flight import Single_Flight_Group
 
 
 # ---------------------------------------------------------------------------------------------------------------------
@@ -73,31 +83,585 @@ from local.lib.drawing_functions import interpret_drawing_call
 
 # .....................................................................................................................
 
-def create_video(save_folder_path, frame_rate, print_message = "Creating video"):
+def make_animation_writer(output_path, frame_rate, output_format = "mp4", output_wh = None,
+                          encoder_profile = "default"):
+    
+    '''
+    Helper function which creates the writer used to encode frames into the given output format
+    Supports 'mp4', 'webp' (both encoded by ffmpeg) and 'gif' (encoded in python)
+    The encoder profile only applies to mp4 outputs
+    Mp4s are encoded in (parallel) segments if more than 1 segment encoding worker is available
+    (workers share the encoder threads, so there can't be more workers than threads)
+    '''
+    
+    if output_format == "gif":
+        return Animated_GIF_Writer(output_path, frame_rate, output_wh, palette_mode = get_gif_palette_mode())
+    
+    if output_format == "webp":
+        return FFmpeg_Video_Writer(output_path, frame_rate, codec = "libwebp_anim", output_wh = output_wh,
+                                   encoder_threads = get_encoder_threads())
+    
+    segment_workers = min(get_segment_encoding_workers(), get_encoder_threads())
+    if segment_workers > 1:
+        segment_frames = max(1, int(round(get_segment_encoding_sec() * frame_rate)))
+        return Segmented_Video_Writer(output_path, frame_rate, output_wh, encoder_profile, get_encoder_threads(),
+                                      segment_workers, segment_frames, get_segment_encoding_buffer_mb())
+    
+    return FFmpeg_Video_Writer(output_path, frame_rate, output_wh = output_wh,
+                               encoder_profile = encoder_profile, encoder_threads = get_encoder_threads())
+
+# .....................................................................................................................
+
+def get_output_mimetype(output_format):
+    
+    ''' Helper function which returns the mimetype for a given output format '''
+    
+    return OUTPUT_FORMAT_MIMETYPES_LUT[output_format]
+
+# .....................................................................................................................
+
+def create_video(save_folder_path, frame_iter, frame_rate, print_message = "Creating video",
+                 progress_callback = None, output_wh = None, output_format = "mp4", encoder_profile = "default"):
+    
+    '''
+    Function which encodes frames (as they're generated) into a video file. Returns the path to the video
+    If a progress callback is given, it is called with the number of frames written, after every frame
+    If an output size is given, frames are scaled to that size, otherwise the size of the first frame is used
+    The output format can be 'mp4', 'webp' or 'gif', with the encoder profile controlling mp4 encoding settings
+    '''
     
     # Make sure the frame rate isn't silly
     frame_rate = min(30, max(0.5, frame_rate))
     
     # Build output name & pathing
-    path_to_output = os.path.join(save_folder_path, "temp.mp4")
+    path_to_output = os.path.join(save_folder_path, "temp.{}".format(output_format))
     
     # Print message to indicate video creation in logs
     dt_now = dt.datetime.now()
     timestamp_str = dt_now.strftime("%Y/%m/%d %H:%M:%S")
     print("", "{}  |  {}".format(timestamp_str, print_message), sep = "\n")
     
-    # Build video output, with resizing if needed
-    video_frames = ImageSequenceClip(save_folder_path, fps = frame_rate,)
-    video_frames.write_videofile(path_to_output,
-                                 audio = False,
-                                 write_logfile = False,
-                                 logger = None)
+    # Pipe each frame straight into the encoder, so we don't need to save/re-load frames along the way
+    # -> Upcoming frames are prepared while the encoder works, so downloading/processing doesn't stall encoding
+    frame_iter = read_ahead_frames(frame_iter)
+    try:
+        with make_animation_writer(path_to_output, frame_rate, output_format, output_wh,
+                                   encoder_profile) as video_writer:
+            for each_frame in frame_iter:
+                video_writer.write_frame(each_frame)
+                if progress_callback is not None:
+                    progress_callback(video_writer.frame_count)
+    finally:
+        frame_iter.close()
     
     return path_to_output
 
 # .....................................................................................................................
 
-def create_video_simple_replay(dbserver_url, camera_select, snapshot_ems_list, enable_ghosting):
+def stream_video_response(frame_iter, frame_rate, print_message = "Streaming video", on_close = None,
+                          output_wh = None, encoder_profile = "default"):
+    
+    '''
+    Function which creates a (chunked) streaming response, which sends video data while frames are still being
+    generated, instead of waiting for the whole video to be encoded. Uses fragmented mp4 for streaming
+    Note that errors that occur after the first frame can't be reported, the stream will just end early!
+    If given, the 'on_close' function is called once the stream is finished (or if it fails to start)
+    '''
+    
+    # Make sure the frame rate isn't silly
+    frame_rate = min(30, max(0.5, frame_rate))
+    
+    # Print message to indicate video creation in logs
+    dt_now = dt.datetime.now()
+    timestamp_str = dt_now.strftime("%Y/%m/%d %H:%M:%S")
+    print("", "{}  |  {} (streaming)".format(timestamp_str, print_message), sep = "\n")
+    
+    # Prepare upcoming frames while the encoder works (see create_video)
+    frame_iter = read_ahead_frames(frame_iter)
+    
+    try:
+        # Get the first frame before responding, so that setup errors can still be reported normally
+        first_frame = next(frame_iter, None)
+        if first_frame is None:
+            raise ValueError("No frames were provided for encoding!")
+    
+        # Start up the encoder, which will write its output to a pipe that we can read from
+        video_writer = FFmpeg_Video_Writer(None, frame_rate, output_wh = output_wh,
+                                           encoder_profile = encoder_profile, encoder_threads = get_encoder_threads())
+        video_writer.start(get_frame_data_wh(first_frame), is_jpeg_data(first_frame))
+    
+    except Exception:
+        # The stream won't be closed if it never starts, so clean up here instead
+        frame_iter.close()
+        if on_close is not None:
+            on_close()
+        raise
+    
+    def feed_frames_to_encoder():
+        
+        # Write all frames (from a separate thread), while the response reads back the encoded data
+        try:
+            video_writer.write_frame(first_frame)
+            for each_frame in frame_iter:
+                video_writer.write_frame(each_frame)
+        
+        except Exception as err:
+            error_type = err.__class__.__name__
+            print("", "{} (stream_video_response):".format(error_type), str(err), sep = "\n")
+            video_writer.kill()
+        
+        finally:
+            frame_iter.close()
+            video_writer.close_input()
+        
+        return
+    
+    def generate_video_chunks():
+        
+        # Hand back encoded data as soon as it's available
+        feeder_thread = Thread(target = feed_frames_to_encoder, daemon = True)
+        feeder_thread.start()
+        try:
+            for each_chunk in video_writer.iter_output_chunks():
+                yield each_chunk
+        
+        finally:
+            # Shut down encoding early if the client disconnects before the video is done
+            if feeder_thread.is_alive():
+                video_writer.kill()
+            feeder_thread.join()
+            
+            # Make sure the encoder process is always cleaned up
+            video_writer.kill()
+        
+        return
+    
+    # Make sure we clean up when the stream finishes, even if the client disconnects early
+    video_response = Response(generate_video_chunks(), mimetype = "video/mp4")
+    if on_close is not None:
+        video_response.call_on_close(on_close)
+    
+    return video_response
+
+# .....................................................................................................................
+
+def open_cached_render(render_cache, render_key):
+    
+    ''' Helper function which returns an (opened) cached copy of a render, or None if there isn't one '''
+    
+    # Don't do anything if we don't have a cache
+    if render_cache is None:
+        return None
+    
+    return render_cache.open_cached_file(render_key)
+
+# .....................................................................................................................
+
+def render_shared_video(render_key, render_func, render_cache = None):
+    
+    '''
+    Function which renders a video file, or if an identical render (i.e. same render key) is already in progress,
+    waits for that render to finish and shares the result. Once everyone sharing the render is done with it,
+    the video is saved into the render cache (if available) for re-use.
+    
+    The render function is called with a (temporary) folder path, and should have the signature:
+        render_func(save_folder_path) -> (render_ticket, path_to_video)
+    
+    Returns:
+        render_ticket, video_file
+    -> The video file is opened for reading, and remains valid even if the file is moved or removed
+    -> If the render ticket wasn't admitted, the video file will be None
+    '''
+    
+    def run_render():
+    
+        # Render into a folder of our own, since the folder needs to outlive any single request
+        save_folder_path = mkdtemp(prefix = "gifwrapper_")
+        try:
+            render_ticket, path_to_video = render_func(save_folder_path)
+        except Exception:
+            shutil.rmtree(save_folder_path, ignore_errors = True)
+            raise
+        
+        return save_folder_path, render_ticket, path_to_video
+    
+    def store_and_clean_up(render_result):
+        
+        # Save the video for re-use, once no one needs it anymore, then clear out the render folder
+        save_folder_path, _, path_to_video = render_result
+        if (render_cache is not None) and (path_to_video is not None):
+            render_cache.store(render_key, path_to_video)
+        shutil.rmtree(save_folder_path, ignore_errors = True)
+        
+        return
+    
+    # Render (or share the result of an identical render) and open the video while it's guaranteed to exist
+    with RENDER_FLIGHTS.join(render_key, run_render, store_and_clean_up) as render_result:
+        _, render_ticket, path_to_video = render_result
+        video_file = None if path_to_video is None else open(path_to_video, "rb")
+    
+    return render_ticket, video_file
+
+# .....................................................................................................................
+
+def make_scheduled_render_func(frame_iter_func, frame_rate, print_message,
+                               render_scheduler = None, camera_select = None, render_cost_mpx = 0,
+                               output_wh = None, output_format = "mp4", encoder_profile = "default"):
+    
+    '''
+    Helper function which bundles up a render into a function that only runs once the scheduler allows it
+    Intended for use with 'render_shared_video'. The frame iterator function isn't called unless
+    the render is allowed to run, so that nothing is downloaded for rejected renders
+    '''
+    
+    def render_video(save_folder_path):
+        
+        # Wait for our turn to render, or bail if the server is too busy
+        render_ticket = request_render_ticket(render_scheduler, camera_select, render_cost_mpx)
+        if not render_ticket.admitted:
+            return render_ticket, None
+        
+        with render_ticket:
+            path_to_video = create_video(save_folder_path, frame_iter_func(), frame_rate, print_message,
+                                         output_wh = output_wh, output_format = output_format,
+                                         encoder_profile = encoder_profile)
+        
+        return render_ticket, path_to_video
+    
+    return render_video
+
+# .....................................................................................................................
+
+def get_shared_render_stats():
+    
+    ''' Helper function which reports how often renders have been shared between identical requests '''
+    
+    return RENDER_FLIGHTS.get_stats()
+
+# .....................................................................................................................
+
+def make_video_job_func(frame_iter_func, frame_rate, print_message, render_cache = None, render_key = None,
+                        render_scheduler = None, camera_select = None, render_cost_mpx = 0, output_wh = None,
+                        output_format = "mp4", encoder_profile = "default"):
+    
+    '''
+    Helper function which bundles up a render into a function that can be run as a background job
+    (see Render_Job_Queue). The frame iterator function isn't called until the job runs,
+    so that nothing is downloaded while the job is waiting in the queue.
+    Jobs wait (as long as needed) for the scheduler to allow them to run, rather than being rejected
+    '''
+    
+    def run_video_job(save_folder_path, progress_callback):
+        
+        # Copy an existing render if possible, instead of rendering again
+        path_to_video = os.path.join(save_folder_path, "temp.{}".format(output_format))
+        cached_video_file = open_cached_render(render_cache, render_key)
+        if cached_video_file is not None:
+            with cached_video_file, open(path_to_video, "wb") as out_file:
+                shutil.copyfileobj(cached_video_file, out_file)
+            return path_to_video
+        
+        # Render the video once the scheduler allows it, then save a copy for re-use
+        # -> The job keeps its own copy of the video for downloading
+        with request_render_ticket(render_scheduler, camera_select, render_cost_mpx, wait_forever = True):
+            path_to_video = create_video(save_folder_path, frame_iter_func(), frame_rate, print_message,
+                                         progress_callback, output_wh, output_format, encoder_profile)
+        if render_cache is not None:
+            render_cache.store(render_key, path_to_video, keep_original = True)
+        
+        return path_to_video
+    
+    return run_video_job
+
+# .....................................................................................................................
+
+def get_snapshot_frame_wh(dbserver_url, camera_select, snapshot_ems_list):
+    
+    '''
+    Helper function which gets the (width, height) of the snapshots in a list, or None if it can't be found
+    The frame size is read from the first snapshot, which is cached, so it won't need to be downloaded again
+    '''
+    
+    # Get the frame sizing from the first (valid) snapshot, if possible
+    frame_wh = None
+    valid_ems_list = [each_ems for each_ems in snapshot_ems_list if each_ems is not None]
+    if len(valid_ems_list) > 0:
+        got_snapshot, snap_bytes = get_snapshot_image_bytes(dbserver_url, camera_select, valid_ems_list[0])
+        frame_wh = get_jpeg_dimensions(snap_bytes) if got_snapshot else None
+    
+    return frame_wh
+
+# .....................................................................................................................
+
+def get_jpeg_frames_wh(jpeg_frames):
+    
+    ''' Helper function which gets the (width, height) of the first frame of some jpeg data, or None if unknown '''
+    
+    # Get the frame sizing from the first image, if possible
+    first_image_bytes = next(iter(jpeg_frames), None)
+    frame_wh = None if first_image_bytes is None else get_jpeg_dimensions(first_image_bytes)
+    
+    return frame_wh
+
+# .....................................................................................................................
+
+def get_output_wh(source_wh, output_size_dict = None):
+    
+    '''
+    Helper function which figures out the (width, height) to use for output videos
+    The output size dictionary can contain any of the keys: 'output_width', 'output_height' or 'output_scale'
+    If only one of the width or height is given, the other is picked to preserve the aspect ratio.
+    Videos are never scaled up, so sizes are limited to the source size
+    Returns:
+        output_wh (or None if no scaling is needed, or if the source size isn't known)
+    '''
+    
+    # Don't scale if we weren't asked to (or can't figure out how to)
+    if (source_wh is None) or (not output_size_dict):
+        return None
+    
+    # Figure out the target sizing, starting from the scaling factor (if any)
+    source_width, source_height = source_wh
+    output_scale = output_size_dict.get("output_scale", 1.0)
+    output_width = output_size_dict.get("output_width", None)
+    output_height = output_size_dict.get("output_height", None)
+    if output_width is None and output_height is None:
+        output_width = source_width * output_scale
+        output_height = source_height * output_scale
+    elif output_height is None:
+        output_height = output_width * source_height / source_width
+    elif output_width is None:
+        output_width = output_height * source_width / source_height
+    
+    # Never scale up, and make sure the frame size isn't silly
+    output_width = min(source_width, max(2, int(round(output_width))))
+    output_height = min(source_height, max(2, int(round(output_height))))
+    output_wh = (output_width, output_height)
+    
+    return None if output_wh == tuple(source_wh) else output_wh
+
+# .....................................................................................................................
+
+def rejected_render_response(render_ticket):
+    
+    ''' Helper function which builds the response for renders that weren't allowed to run, due to load '''
+    
+    # Print message to indicate rejections in logs
+    dt_now = dt.datetime.now()
+    timestamp_str = dt_now.strftime("%Y/%m/%d %H:%M:%S")
+    print("", "{}  |  Render rejected: {}".format(timestamp_str, render_ticket.error_message), sep = "\n")
+    
+    return busy_response(render_ticket.error_message, render_ticket.status_code, render_ticket.retry_after_sec)
+
+# .....................................................................................................................
+
+def read_ahead_frames(frame_iter, max_frames = None, max_mb = None):
+    
+    '''
+    Helper function which prepares frames ahead of when they're needed, using a separate thread (see iter_read_ahead)
+    Read-ahead is limited by both a number of frames and a total size (in MB), using environment settings by default
+    '''
+    
+    # Use environment settings by default
+    if max_frames is None:
+        max_frames = get_read_ahead_frames()
+    if max_mb is None:
+        max_mb = get_read_ahead_mb()
+    
+    return iter_read_ahead(frame_iter, max_frames, int(max_mb * 1_000_000), get_frame_data_size_bytes)
+
+# .....................................................................................................................
+
+def get_frame_data_size_bytes(frame_data):
+    
+    ''' Helper function which returns the (in-memory) size of a frame, which can be pixel or jpeg data '''
+    
+    if isinstance(frame_data, np.ndarray):
+        return frame_data.nbytes
+    
+    return len(frame_data)
+
+# .....................................................................................................................
+
+def get_frame_wh(frame):
+    
+    ''' Helper function which returns the (width, height) of a frame '''
+    
+    frame_height, frame_width = frame.shape[0:2]
+    
+    return (frame_width, frame_height)
+
+# .....................................................................................................................
+
+def generate_simple_replay_frames(dbserver_url, camera_select, snapshot_ems_list, ghost_config_dict,
+                                  output_wh = None, ghosting_batch_size = 8):
+    
+    '''
+    Generator which downloads & (optionally) ghosts each snapshot of a simple replay
+    If ghosting is disabled, this generates (compressed) jpeg data, which can be encoded without decoding
+    (any scaling is left to the encoder), otherwise frames are decoded at the output size, if given
+    '''
+    
+    # Use the background of the last snapshot if we're ghosting (loaded once we know the frame sizing)
+    enable_ghosting = ghost_config_dict.get("enable", False)
+    last_snap_ems = snapshot_ems_list[-1]
+    max_downloads = get_max_concurrent_downloads()
+    
+    # If we aren't ghosting, there's no need to decode the snapshots, just pass the jpeg data along
+    if not enable_ghosting:
+        snapshot_data_iter = iter_snapshot_image_bytes(dbserver_url, camera_select, snapshot_ems_list, max_downloads)
+        yield from (snap_bytes for got_snapshot, snap_bytes in snapshot_data_iter if got_snapshot)
+        return
+    
+    # Load snapshot images (in parallel), which will be handed back in frame order
+    snapshot_data_iter = \
+    iter_snapshot_frames(dbserver_url, camera_select, snapshot_ems_list, max_downloads, output_wh)
+    
+    # Skip snapshots that are missing (download errors are raised, so that incomplete videos aren't created)
+    valid_frames_iter = (snap_frame for got_snapshot, snap_frame in snapshot_data_iter if got_snapshot)
+    
+    # Group frames into batches, so that ghosting can share working memory for all frames of a batch
+    frame_stack_iter = iter_frame_stacks(valid_frames_iter, ghosting_batch_size)
+    
+    # Grab the first batch early, so we can load the (frame-sized) background before ghosting in parallel
+    first_frame_stack = next(frame_stack_iter, None)
+    if first_frame_stack is None:
+        return
+    frame_height, frame_width = first_frame_stack.shape[1:3]
+    bg_frame = load_ghosting_background(dbserver_url, camera_select, last_snap_ems, (frame_width, frame_height))
+    
+    # Ghost batches in parallel (opencv releases the GIL, so threads can make use of multiple cores)
+    num_workers = get_frame_processing_workers()
+    ghost_one_batch = lambda frame_stack: apply_ghosting_batch(bg_frame, frame_stack, **ghost_config_dict)
+    all_frame_stacks_iter = chain([first_frame_stack], frame_stack_iter)
+    for each_ghosted_stack in ordered_threaded_map(ghost_one_batch, all_frame_stacks_iter, num_workers):
+        yield from each_ghosted_stack
+    
+    return
+
+# .....................................................................................................................
+
+def iter_frame_stacks(frame_iter, max_stack_size):
+    
+    '''
+    Generator which groups frames into stacks (i.e. N x H x W x 3 arrays) for batch processing
+    Stacks are ended early if the frame sizing changes, since all frames in a stack must share the same size
+    '''
+    
+    frame_batch = []
+    for each_frame in frame_iter:
+        
+        # Hand back the current batch early if the next frame doesn't match the sizing
+        size_changed = (len(frame_batch) > 0) and (each_frame.shape != frame_batch[0].shape)
+        if size_changed:
+            yield np.stack(frame_batch)
+            frame_batch = []
+        
+        # Hand back batches once they're full
+        frame_batch.append(each_frame)
+        if len(frame_batch) >= max_stack_size:
+            yield np.stack(frame_batch)
+            frame_batch = []
+    
+    # Hand back any left over frames
+    if len(frame_batch) > 0:
+        yield np.stack(frame_batch)
+    
+    return
+
+# .....................................................................................................................
+
+def generate_instruction_frames(dbserver_url, camera_select, instructions_list, ghost_config_dict,
+                                output_wh = None, drawing_plan = None):
+    
+    '''
+    Generator which downloads each snapshot listed in a set of instructions and draws on it as needed
+    Ghosting & drawing is handled by several worker threads in parallel, but frames are still returned in order
+    If ghosting is disabled (and frames aren't being scaled), this generates (compressed) jpeg data, so that
+    snapshots without any drawing instructions can be passed along as-is, without having to be decoded & re-encoded
+    If an output size is given, frames are decoded at that size, so drawing happens on the smaller frames
+    If a drawing plan isn't given, one is created from the instructions (which raises a ValueError if invalid)
+    '''
+    
+    # Interpret drawing instructions up front, so that frames don't need to re-interpret them while drawing
+    if drawing_plan is None:
+        drawing_plan = Drawing_Plan(instructions_list)
+    
+    # Use the background of the last snapshot if we're ghosting (loaded once we know the frame sizing)
+    bg_frame = None
+    enable_ghosting = ghost_config_dict.get("enable", False)
+    pass_through_jpegs = (not enable_ghosting) and (output_wh is None)
+    last_snapshot_instruction = instructions_list[-1]
+    last_snap_ems = last_snapshot_instruction.get("snapshot_ems", None)
+    
+    # Get (undecoded) jpeg data for frames that won't be modified, otherwise get the decoded image
+    frame_indices = range(len(instructions_list))
+    snapshot_ems_list = [each_instruction.get("snapshot_ems", None) for each_instruction in instructions_list]
+    keep_jpeg_list = [pass_through_jpegs and (not drawing_plan.has_drawing(each_idx)) for each_idx in frame_indices]
+    
+    # Load snapshot data (in parallel), which will be handed back in frame order
+    max_downloads = get_max_concurrent_downloads()
+    snapshot_data_iter = iter_snapshot_frames(dbserver_url, camera_select, snapshot_ems_list, max_downloads,
+                                              output_wh, keep_jpeg_list)
+    
+    # Pair up frame indices with their snapshots, skipping snapshots that are missing
+    frame_data_iter = ((each_frame_index, each_frame)
+                       for each_frame_index, (got_snapshot, each_frame) in zip(frame_indices, snapshot_data_iter)
+                       if got_snapshot)
+    
+    # Grab the first frame early, so we can load the (frame-sized) background before processing frames in parallel
+    first_frame_data = next(frame_data_iter, None)
+    if first_frame_data is None:
+        return
+    if enable_ghosting:
+        _, first_frame = first_frame_data
+        bg_frame = load_ghosting_background(dbserver_url, camera_select, last_snap_ems, get_frame_wh(first_frame))
+    
+    def process_one_frame(frame_data):
+        
+        # For clarity
+        frame_index, display_frame = frame_data
+        frame_has_drawing = drawing_plan.has_drawing(frame_index)
+        
+        # Pass along untouched (jpeg) frames as-is
+        if is_jpeg_data(display_frame):
+            return display_frame
+        
+        # Apply ghosting if needed
+        if enable_ghosting:
+            display_frame = apply_ghosting(bg_frame, display_frame, **ghost_config_dict)
+        
+        # Make a copy of (shared) snapshot data before drawing, so we don't modify the original
+        elif frame_has_drawing:
+            display_frame = display_frame.copy()
+        
+        # Draw everything for this frame (pixel co-ordinates are worked out once per frame size by the plan)
+        if frame_has_drawing:
+            display_frame = drawing_plan.draw(frame_index, display_frame)
+        
+        # Convert back to jpeg data if we're passing jpegs through, to match the untouched frames
+        if pass_through_jpegs:
+            display_frame = image_pixels_to_bytes(display_frame, jpg_quality_0_to_100 = 95)
+        
+        return display_frame
+    
+    # Process frames in parallel (opencv releases the GIL, so threads can make use of multiple cores)
+    num_workers = get_frame_processing_workers()
+    all_frame_data_iter = chain([first_frame_data], frame_data_iter)
+    yield from ordered_threaded_map(process_one_frame, all_frame_data_iter, num_workers)
+    
+    return
+
+# .....................................................................................................................
+
+def get_simple_replay_settings(camera_select, snapshot_ems_list, enable_ghosting, output_size_dict = None,
+                               output_format = "mp4", encoder_profile = "default"):
+    
+    '''
+    Helper function which sets up the (hard-coded) parameters for simple replays
+    Returns:
+        frame_rate, ghost_config_dict, render_key
+    '''
     
     # Hard-code 'simple' video parameters
     frame_rate = get_default_fps()
@@ -106,46 +670,99 @@ def create_video_simple_replay(dbserver_url, camera_select, snapshot_ems_list, e
                          "blur_size": 2,
                          "pixelation_factor": 3}
     
+    # Build a key describing the render, so we can re-use previous results
+    render_key = make_render_key({"route": "simple-replay",
+                                  "camera_select": camera_select,
+                                  "snapshot_ems_list": snapshot_ems_list,
+                                  "ghosting": ghost_config_dict,
+                                  "frame_rate": frame_rate,
+                                  "output_size": output_size_dict,
+                                  "output_format": get_output_format_key(output_format, encoder_profile)})
+    
+    return frame_rate, ghost_config_dict, render_key
+
+# .....................................................................................................................
+
+def get_instructions_render_key(camera_select, instructions_list, frames_per_second, ghost_config_dict,
+                                output_size_dict = None, output_format = "mp4", encoder_profile = "default"):
+    
+    ''' Helper function which builds a key describing a render from instructions, for re-using previous results '''
+    
+    return make_render_key({"route": "from-instructions",
+                            "camera_select": camera_select,
+                            "instructions": instructions_list,
+                            "ghosting": ghost_config_dict,
+                            "frame_rate": frames_per_second,
+                            "output_size": output_size_dict,
+                            "output_format": get_output_format_key(output_format, encoder_profile)})
+
+# .....................................................................................................................
+
+def get_output_format_key(output_format, encoder_profile = "default"):
+    
+    '''
+    Helper function which describes the output format for render keys,
+    including the settings that only apply to some formats (gif palette & mp4 encoder profile)
+    '''
+    
+    if output_format == "gif":
+        return "gif ({} palette)".format(get_gif_palette_mode())
+    
+    if output_format == "mp4":
+        return "mp4 ({} profile)".format(encoder_profile)
+    
+    return output_format
+
+# .....................................................................................................................
+
+def create_video_simple_replay(dbserver_url, camera_select, snapshot_ems_list, enable_ghosting,
+                               stream_output = False, render_cache = None, render_scheduler = None,
+                               output_size_dict = None, output_format = "mp4", encoder_profile = "default"):
+    
+    # Get simple replay settings
+    user_file_name = "simple_replay.{}".format(output_format)
+    output_mimetype = get_output_mimetype(output_format)
+    frame_rate, ghost_config_dict, render_key = \
+    get_simple_replay_settings(camera_select, snapshot_ems_list, enable_ghosting,
+                               output_size_dict, output_format, encoder_profile)
+    
     try:
         
-        # Grab a background image if we're ghosting
-        bg_frame = None
-        enable_ghosting = ghost_config_dict.get("enable", False)
-        if enable_ghosting:
-            last_snap_ems = snapshot_ems_list[-1]
-            got_background, bg_bytes = get_background_image_bytes(dbserver_url, camera_select, last_snap_ems)
-            if not got_background:
-                raise FileNotFoundError("Couldn't retrieve background image for ghosting!")
-            bg_frame = image_bytes_to_pixels(bg_bytes)
-    
-        # Download each of the snapshot images to a temporary folder
-        with TemporaryDirectory() as temp_dir:
-            
-            # Save a jpg for each of the provided epoch ms values
-            for each_idx, each_snap_ems in enumerate(snapshot_ems_list):
-                
-                # Request image data from dbserver
-                got_snapshot, snap_bytes = get_snapshot_image_bytes(dbserver_url, camera_select, each_snap_ems)
-                if not got_snapshot:
-                    continue
-                
-                # Apply ghosting if needed
-                if enable_ghosting:
-                    snap_frame = image_bytes_to_pixels(snap_bytes)
-                    ghost_frame = apply_ghosting(bg_frame, snap_frame, **ghost_config_dict)
-                    snap_bytes = image_pixels_to_bytes(ghost_frame)
-                
-                # Save the jpgs!
-                save_one_jpg(temp_dir, each_idx, snap_bytes)
-            
-            # Create the video file and return for download
-            path_to_video = create_video(temp_dir, frame_rate, "Simple replay")
-            user_file_name = "simple_replay.mp4"
-            video_response = send_file(path_to_video,
-                                       attachment_filename = user_file_name,
-                                       mimetype = "video/mp4",
-                                       as_attachment = True)
+        # Send back an existing copy of the video, if possible
+        cached_video_file = open_cached_render(render_cache, render_key)
+        if cached_video_file is not None:
+            return send_file(cached_video_file,
+                             attachment_filename = user_file_name,
+                             mimetype = output_mimetype,
+                             as_attachment = True)
+        
+        # Figure out the output sizing & estimate how expensive the render will be, for scheduling
+        source_wh = get_snapshot_frame_wh(dbserver_url, camera_select, snapshot_ems_list)
+        output_wh = get_output_wh(source_wh, output_size_dict)
+        render_cost_mpx = estimate_render_cost_mpx(len(snapshot_ems_list), output_wh or source_wh)
+        frame_iter_func = lambda: generate_simple_replay_frames(dbserver_url, camera_select, snapshot_ems_list,
+                                                                ghost_config_dict, output_wh)
+        
+        # Stream the video back while frames are being rendered, if needed (holding a ticket until finished)
+        if stream_output:
+            render_ticket = request_render_ticket(render_scheduler, camera_select, render_cost_mpx)
+            if not render_ticket.admitted:
+                return rejected_render_response(render_ticket)
+            return stream_video_response(frame_iter_func(), frame_rate, "Simple replay", render_ticket.release,
+                                         output_wh, encoder_profile)
         
+        # Render the video (or share the result of an identical render in progress) and return for download
+        render_func = make_scheduled_render_func(frame_iter_func, frame_rate, "Simple replay",
+                                                 render_scheduler, camera_select, render_cost_mpx,
+                                                 output_wh, output_format, encoder_profile)
+        render_ticket, video_file = render_shared_video(render_key, render_func, render_cache)
+        if not render_ticket.admitted:
+            return rejected_render_response(render_ticket)
+        video_response = send_file(video_file,
+                                   attachment_filename = user_file_name,
+                                   mimetype = output_mimetype,
+                                   as_attachment = True)
+    
     except Exception as err:
         # If anything goes wrong, return an error response instead
         error_type = err.__class__.__name__
@@ -158,56 +775,52 @@ def create_video_simple_replay(dbserver_url, camera_select, snapshot_ems_list, e
 # .....................................................................................................................
 
 def create_video_from_instructions(dbserver_url, camera_select,
-                                   instructions_list, frames_per_second, ghost_config_dict):
+                                   instructions_list, frames_per_second, ghost_config_dict,
+                                   stream_output = False, render_cache = None, render_scheduler = None,
+                                   output_size_dict = None, output_format = "mp4", encoder_profile = "default",
+                                   drawing_plan = None):
+    
+    # Build a key describing the render, so we can re-use previous results
+    output_mimetype = get_output_mimetype(output_format)
+    render_key = get_instructions_render_key(camera_select, instructions_list, frames_per_second,
+                                             ghost_config_dict, output_size_dict, output_format, encoder_profile)
     
     try:
         
-        # Grab a background image if we're ghosting
-        bg_frame = None
-        enable_ghosting = ghost_config_dict.get("enable", False)
-        if enable_ghosting:
-            last_snapshot_instruction = instructions_list[-1]
-            last_snap_ems = last_snapshot_instruction.get("snapshot_ems", None)
-            got_background, bg_bytes = get_background_image_bytes(dbserver_url, camera_select, last_snap_ems)
-            if not got_background:
-                raise FileNotFoundError("Couldn't retrieve background image for ghosting!")
-            bg_frame = image_bytes_to_pixels(bg_bytes)
-        
-        # Convert each base64 string into image data
-        with TemporaryDirectory() as temp_dir:
-            for each_idx, each_instruction_dict in enumerate(instructions_list):
-                
-                # Pull out instruction data (skip if snapshot epoch ms value is missing)
-                drawing_list = each_instruction_dict.get("drawing", [])
-                snapshot_ems = each_instruction_dict.get("snapshot_ems", None)
-                if snapshot_ems is None:
-                    continue
-                
-                # First retrieve snapshot
-                got_snapshot, snap_bytes = get_snapshot_image_bytes(dbserver_url, camera_select, snapshot_ems)
-                if not got_snapshot:
-                    continue
-                
-                # Convert to pixel data so we can work with the image and apply ghosting if needed
-                display_frame = image_bytes_to_pixels(snap_bytes)
-                if enable_ghosting:
-                    display_frame = apply_ghosting(bg_frame, display_frame, **ghost_config_dict)
-                
-                # Interpret all drawing instructions
-                for each_draw_call in drawing_list:
-                    display_frame = interpret_drawing_call(display_frame, each_draw_call)
-                
-                # Save image data to file system
-                save_name = "{}.jpg".format(each_idx).rjust(20, "0")
-                save_path = os.path.join(temp_dir, save_name)
-                cv2.imwrite(save_path, display_frame)
-            
-            # Create the video file and return for download
-            path_to_video = create_video(temp_dir, frames_per_second, "From instructions")
-            video_response = send_file(path_to_video,
-                                       mimetype = "video/mp4",
-                                       as_attachment = False)
+        # Send back an existing copy of the video, if possible
+        cached_video_file = open_cached_render(render_cache, render_key)
+        if cached_video_file is not None:
+            return send_file(cached_video_file,
+                             mimetype = output_mimetype,
+                             as_attachment = False)
+        
+        # Figure out the output sizing & estimate how expensive the render will be, for scheduling
+        snapshot_ems_list = [each_instruction.get("snapshot_ems", None) for each_instruction in instructions_list]
+        source_wh = get_snapshot_frame_wh(dbserver_url, camera_select, snapshot_ems_list)
+        output_wh = get_output_wh(source_wh, output_size_dict)
+        render_cost_mpx = estimate_render_cost_mpx(len(snapshot_ems_list), output_wh or source_wh)
+        frame_iter_func = lambda: generate_instruction_frames(dbserver_url, camera_select, instructions_list,
+                                                              ghost_config_dict, output_wh, drawing_plan)
         
+        # Stream the video back while frames are being rendered, if needed (holding a ticket until finished)
+        if stream_output:
+            render_ticket = request_render_ticket(render_scheduler, camera_select, render_cost_mpx)
+            if not render_ticket.admitted:
+                return rejected_render_response(render_ticket)
+            return stream_video_response(frame_iter_func(), frames_per_second, "From instructions",
+                                         render_ticket.release, output_wh, encoder_profile)
+        
+        # Render the video (or share the result of an identical render in progress) and return for download
+        render_func = make_scheduled_render_func(frame_iter_func, frames_per_second, "From instructions",
+                                                 render_scheduler, camera_select, render_cost_mpx,
+                                                 output_wh, output_format, encoder_profile)
+        render_ticket, video_file = render_shared_video(render_key, render_func, render_cache)
+        if not render_ticket.admitted:
+            return rejected_render_response(render_ticket)
+        video_response = send_file(video_file,
+                                   mimetype = output_mimetype,
+                                   as_attachment = False)
+    
     except Exception as err:
         # If anything goes wrong, return an error response instead
         error_type = err.__class__.__name__
@@ -219,30 +832,45 @@ def create_video_from_instructions(dbserver_url, camera_select,
 
 # .....................................................................................................................
 
-def create_video_response_from_b64_jpgs(base64_jpgs_list, frames_per_second):
+def create_video_response_from_b64_jpgs(jpeg_frames, frames_per_second, stream_output = False,
+                                        render_scheduler = None, output_size_dict = None, output_format = "mp4",
+                                        encoder_profile = "default"):
+    
+    '''
+    Function which renders (already decoded) b64 jpgs into a video response
+    The jpeg frames can be a list of jpeg data or a Jpeg_Frame_Spool, so that frames don't need to be held in memory
+    '''
     
     try:
-        # Convert each base64 string into image data
-        with TemporaryDirectory() as temp_dir:
-            for each_idx, each_b64_jpg_string in enumerate(base64_jpgs_list):
-                
-                # Remove encoding prefix data
-                data_prefix, base64_string = each_b64_jpg_string.split(",")
-                image_bytes = base64.b64decode(base64_string)
-                image_array = np.frombuffer(image_bytes, np.uint8)
-                
-                # Save image data to file system
-                save_name = "{}.jpg".format(each_idx).rjust(20, "0")
-                save_path = os.path.join(temp_dir, save_name)
-                with open(save_path, "wb") as out_file:
-                    out_file.write(image_array)
+        
+        # Figure out the output sizing
+        source_wh = get_jpeg_frames_wh(jpeg_frames)
+        output_wh = get_output_wh(source_wh, output_size_dict)
+        
+        # Wait for our turn to render, or bail if the server is too busy
+        # -> These renders don't use a camera, so they're all limited as if they came from the same camera
+        render_cost_mpx = estimate_render_cost_mpx(len(jpeg_frames), output_wh or source_wh)
+        render_ticket = request_render_ticket(render_scheduler, None, render_cost_mpx)
+        if not render_ticket.admitted:
+            return rejected_render_response(render_ticket)
+        
+        # Stream the video back while frames are being rendered, if needed (holding the ticket until finished)
+        frame_iter = iter(jpeg_frames)
+        if stream_output:
+            return stream_video_response(frame_iter, frames_per_second, "From b64 jpgs", render_ticket.release,
+                                         output_wh, encoder_profile)
+        
+        # Render frames directly into a video file (in a temporary folder)
+        with render_ticket, TemporaryDirectory() as temp_dir:
             
             # Create the video file and return for download
-            path_to_video = create_video(temp_dir, frames_per_second, "From b64 jpgs")
+            path_to_video = create_video(temp_dir, frame_iter, frames_per_second, "From b64 jpgs",
+                                         output_wh = output_wh, output_format = output_format,
+                                         encoder_profile = encoder_profile)
             video_response = send_file(path_to_video,
-                                       mimetype = "video/mp4",
+                                       mimetype = get_output_mimetype(output_format),
                                        as_attachment = False)
-        
+    
     except Exception as err:
         # If anything goes wrong, return an error response instead
         error_type = err.__class__.__name__
@@ -256,6 +884,113 @@ def create_video_response_from_b64_jpgs(base64_jpgs_list, frames_per_second):
 # .....................................................................................................................
 
 
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Background job functions
+
+# .....................................................................................................................
+
+def submit_video_simple_replay_job(render_jobs, dbserver_url, camera_select, snapshot_ems_list, enable_ghosting,
+                                   render_cache = None, render_scheduler = None, output_size_dict = None,
+                                   output_format = "mp4", encoder_profile = "default"):
+    
+    '''
+    Function which queues up a simple replay to be rendered in the background
+    Returns the (queued) job, or None if the job queue is full
+    '''
+    
+    # Get simple replay settings
+    frame_rate, ghost_config_dict, render_key = \
+    get_simple_replay_settings(camera_select, snapshot_ems_list, enable_ghosting,
+                               output_size_dict, output_format, encoder_profile)
+    
+    # Figure out the output sizing & estimate how expensive the render will be, for scheduling
+    source_wh = get_snapshot_frame_wh(dbserver_url, camera_select, snapshot_ems_list)
+    output_wh = get_output_wh(source_wh, output_size_dict)
+    render_cost_mpx = estimate_render_cost_mpx(len(snapshot_ems_list), output_wh or source_wh)
+    
+    # Bundle the render into a job function
+    frame_iter_func = lambda: generate_simple_replay_frames(dbserver_url, camera_select, snapshot_ems_list,
+                                                            ghost_config_dict, output_wh)
+    run_func = make_video_job_func(frame_iter_func, frame_rate, "Simple replay (job)", render_cache, render_key,
+                                   render_scheduler, camera_select, render_cost_mpx,
+                                   output_wh, output_format, encoder_profile)
+    
+    return render_jobs.submit(run_func, len(snapshot_ems_list), "simple_replay.{}".format(output_format),
+                              get_output_mimetype(output_format), render_key)
+
+# .....................................................................................................................
+
+def submit_video_from_instructions_job(render_jobs, dbserver_url, camera_select,
+                                       instructions_list, frames_per_second, ghost_config_dict,
+                                       render_cache = None, render_scheduler = None, output_size_dict = None,
+                                       output_format = "mp4", encoder_profile = "default",
+                                       drawing_plan = None):
+    
+    '''
+    Function which queues up a render from instructions, to run in the background
+    Returns the (queued) job, or None if the job queue is full
+    '''
+    
+    # Build a key describing the render, so we can re-use previous results
+    render_key = get_instructions_render_key(camera_select, instructions_list, frames_per_second,
+                                             ghost_config_dict, output_size_dict, output_format, encoder_profile)
+    
+    # Figure out the output sizing & estimate how expensive the render will be, for scheduling
+    snapshot_ems_list = [each_instruction.get("snapshot_ems", None) for each_instruction in instructions_list]
+    source_wh = get_snapshot_frame_wh(dbserver_url, camera_select, snapshot_ems_list)
+    output_wh = get_output_wh(source_wh, output_size_dict)
+    render_cost_mpx = estimate_render_cost_mpx(len(snapshot_ems_list), output_wh or source_wh)
+    
+    # Bundle the render into a job function
+    frame_iter_func = lambda: generate_instruction_frames(dbserver_url, camera_select, instructions_list,
+                                                          ghost_config_dict, output_wh, drawing_plan)
+    run_func = make_video_job_func(frame_iter_func, frames_per_second, "From instructions (job)",
+                                   render_cache, render_key, render_scheduler, camera_select, render_cost_mpx,
+                                   output_wh, output_format, encoder_profile)
+    
+    return render_jobs.submit(run_func, len(instructions_list), "animation.{}".format(output_format),
+                              get_output_mimetype(output_format), render_key)
+
+# .....................................................................................................................
+
+def submit_video_from_b64_jpgs_job(render_jobs, jpeg_frames, frames_per_second, render_scheduler = None,
+                                   output_size_dict = None, output_format = "mp4", encoder_profile = "default"):
+    
+    '''
+    Function which queues up a render from (already decoded) b64 jpgs, to run in the background
+    The jpeg frames can be a list of jpeg data or a Jpeg_Frame_Spool
+    Returns the (queued) job, or None if the job queue is full
+    '''
+    
+    # Figure out the output sizing & estimate how expensive the render will be, for scheduling
+    source_wh = get_jpeg_frames_wh(jpeg_frames)
+    output_wh = get_output_wh(source_wh, output_size_dict)
+    render_cost_mpx = estimate_render_cost_mpx(len(jpeg_frames), output_wh or source_wh)
+    
+    # Bundle the render into a job function (these renders aren't cached, since the data is unlikely to repeat)
+    frame_iter_func = lambda: iter(jpeg_frames)
+    run_func = make_video_job_func(frame_iter_func, frames_per_second, "From b64 jpgs (job)",
+                                   render_scheduler = render_scheduler, render_cost_mpx = render_cost_mpx,
+                                   output_wh = output_wh, output_format = output_format,
+                                   encoder_profile = encoder_profile)
+    
+    return render_jobs.submit(run_func, len(jpeg_frames), "animation.{}".format(output_format),
+                              get_output_mimetype(output_format))
+
+# .....................................................................................................................
+# .....................................................................................................................
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Set up globals
+
+# Shared storage for keeping track of renders in progress, so that identical requests can share the same render
+RENDER_FLIGHTS = Single_Flight_Group()
+
+# Supported output formats (streaming is only supported for mp4)
+OUTPUT_FORMAT_MIMETYPES_LUT = {"mp4": "video/mp4", "webp": "image/webp", "gif": "image/gif"}
+
+
 # ---------------------------------------------------------------------------------------------------------------------
 #%% Demo
 
@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Oct 13 09:42:17 2026
+
+@author: eo
+"""
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Imports
+
+import cv2
+import tempfile
+import subprocess
+import numpy as np
+
+from imageio_ffmpeg import get_ffmpeg_exe
+
+from local.lib.image_read_write import image_bytes_to_pixels, image_pixels_to_bytes
+from local.lib.image_read_write import get_jpeg_dimensions, pick_jpeg_reduction_factor
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Define classes
+
+class FFmpeg_Video_Writer:
+    
+    '''
+    Class used to encode videos by piping frame data directly into an ffmpeg process
+    Avoids needing to save frames to disk (and re-load them) before encoding
+    The frame sizing is taken from the first frame written (unless an output size is given),
+    later frames are resized to match if needed
+    
+    Frames can be given either as BGR pixel data (i.e. opencv images) or as (compressed) jpeg data.
+    If the first frame is jpeg data, the encoder reads jpegs directly, so that jpegs can be passed
+    through without having to be decoded into pixels first (pixel data is converted to jpeg in this case).
+    When scaling jpegs down to the output size, the decoder skips decoding full-sized images where possible
+    
+    If no output path is given, the video is instead encoded as a fragmented mp4 which is written to stdout,
+    so that it can be streamed (see 'iter_output_chunks') while frames are still being written
+    
+    Animated WebP output can be created using the 'libwebp_anim' codec (with a .webp output path),
+    in which case the encoder stores only the changed region of each frame where possible
+    
+    For x264 encoding, a named encoder profile (see ENCODER_PROFILES_LUT) controls the trade-off between
+    encoding speed and file size. The number of encoder threads can be limited, so that several encoders
+    running at the same time don't compete for the same cpu cores (ffmpeg picks a thread count if not given)
+    '''
+    
+    # .................................................................................................................
+    
+    def __init__(self, output_path, frame_rate, codec = "libx264", output_wh = None,
+                 encoder_profile = "default", encoder_threads = None):
+        
+        # Store encoding settings
+        self.output_path = output_path
+        self.frame_rate = frame_rate
+        self.codec = codec
+        self.output_wh = None if output_wh is None else tuple(output_wh)
+        self.encoder_profile_dict = get_encoder_profile_settings(encoder_profile)
+        self.encoder_threads = encoder_threads
+        self.is_streaming = (output_path is None)
+        
+        # Allocate storage for the encoding process, which is started once we know the frame sizing
+        self.source_wh = None
+        self.frame_wh = None
+        self.jpeg_input = False
+        self.jpeg_reduction_factor = 1
+        self.frame_count = 0
+        self._ffmpeg_process = None
+        self._error_log_file = None
+    
+    # .................................................................................................................
+    
+    def __enter__(self):
+        return self
+    
+    # .................................................................................................................
+    
+    def __exit__(self, exception_type, exception_value, traceback):
+        
+        # Don't bother finishing the video if something went wrong while writing frames
+        if exception_type is not None:
+            self.kill()
+            return
+        
+        self.close()
+    
+    # .................................................................................................................
+    
+    def build_ffmpeg_command(self, frame_wh):
+        
+        ''' Function which builds the ffmpeg command used to encode piped frame data into the output file '''
+        
+        frame_width, frame_height = frame_wh
+        
+        # Raw (bgr24) frame data is piped in, with the frame size given explicitly since there is no header
+        input_args = ["-f", "rawvideo", "-pix_fmt", "bgr24",
+                      "-s", "{}x{}".format(frame_width, frame_height),
+                      "-r", "{}".format(self.frame_rate),
+                      "-i", "-"]
+        video_filters = []
+        
+        # When piping in jpegs, ffmpeg handles decoding but we need to force all frames to the same size
+        # -> 'lowres' decodes jpegs at 1/2, 1/4 or 1/8 size, which is much faster when scaling down
+        if self.jpeg_input:
+            lowres_value = {1: 0, 2: 1, 4: 2, 8: 3}.get(self.jpeg_reduction_factor, 0)
+            input_args = ["-lowres", str(lowres_value),
+                          "-f", "image2pipe", "-vcodec", "mjpeg",
+                          "-framerate", "{}".format(self.frame_rate),
+                          "-i", "-"]
+            video_filters.append("scale={}:{}".format(frame_width, frame_height))
+        
+        # Pad odd-sized frames, since yuv420p (needed for browser playback) requires even dimensions
+        video_filters.append("pad=ceil(iw/2)*2:ceil(ih/2)*2")
+        codec_args = ["-an",
+                      "-vf", ",".join(video_filters),
+                      "-vcodec", self.codec,
+                      "-pix_fmt", "yuv420p"]
+        
+        # Set up (lossy, looping) animated webp output, which is meant for embedding rather than playback
+        if self.codec == "libwebp_anim":
+            codec_args += ["-lossless", "0", "-quality", "75", "-loop", "0"]
+        
+        # Apply the encoder profile, when using x264
+        # -> When streaming, use frequent keyframes, since each (fragmented mp4) chunk can only be sent
+        #    once the following keyframe has been encoded
+        if self.codec == "libx264":
+            profile_dict = self.encoder_profile_dict
+            codec_args += ["-preset", profile_dict["preset"], "-crf", str(profile_dict["crf"])]
+            if profile_dict["tune"] is not None:
+                codec_args += ["-tune", profile_dict["tune"]]
+            keyframe_interval_sec = 1 if self.is_streaming else profile_dict["keyframe_interval_sec"]
+            if keyframe_interval_sec is not None:
+                keyframe_interval = max(1, int(round(keyframe_interval_sec * self.frame_rate)))
+                codec_args += ["-g", str(keyframe_interval)]
+        
+        # Limit encoder threading if needed
+        if self.encoder_threads is not None:
+            codec_args += ["-threads", str(self.encoder_threads)]
+        
+        # When streaming, output fragmented mp4 (playable before it's finished)
+        output_args = [self.output_path]
+        if self.is_streaming:
+            output_args = ["-f", "mp4",
+                           "-movflags", "frag_keyframe+empty_moov+default_base_moof",
+                           "pipe:1"]
+        
+        return [get_ffmpeg_exe(), "-y", "-loglevel", "error", *input_args, *codec_args, *output_args]
+    
+    # .................................................................................................................
+    
+    def start(self, frame_wh, jpeg_input = False):
+        
+        '''
+        Function used to start up the encoder. Called automatically on the first frame if not called directly
+        The given frame sizing should be the size of the (first) input frame, not the output size!
+        '''
+        
+        # Output to stdout if we're streaming, otherwise ffmpeg writes directly to the output file
+        stdout_target = subprocess.PIPE if self.is_streaming else subprocess.DEVNULL
+        
+        # Figure out the output sizing and whether jpegs can be decoded at reduced size
+        self.source_wh = tuple(frame_wh)
+        self.frame_wh = self.source_wh if self.output_wh is None else self.output_wh
+        self.jpeg_input = jpeg_input
+        if jpeg_input:
+            self.jpeg_reduction_factor = pick_jpeg_reduction_factor(self.source_wh, self.frame_wh)
+        
+        # Send error output to a temporary file, since a pipe that nobody reads could fill up & stall ffmpeg
+        self._error_log_file = tempfile.TemporaryFile()
+        self._ffmpeg_process = subprocess.Popen(self.build_ffmpeg_command(self.frame_wh),
+                                                stdin = subprocess.PIPE,
+                                                stdout = stdout_target,
+                                                stderr = self._error_log_file)
+    
+    # .................................................................................................................
+    
+    def write_frame(self, frame_data):
+        
+        '''
+        Function used to add a frame to the output video
+        Frame data can be a BGR uint8 image (i.e. opencv format) or jpeg data (bytes or a 1D uint8 array)
+        '''
+        
+        # Start up the encoder on the first frame, since we need the frame sizing
+        if self._ffmpeg_process is None:
+            self.start(get_frame_data_wh(frame_data), is_jpeg_data(frame_data))
+        
+        # Convert between jpeg & pixel data, if the frame doesn't match what the encoder is expecting
+        # -> Pixel data is sized to match the input jpegs, since the decoder will reduce every jpeg it reads
+        # -> Jpeg data is decoded at reduced size, if it's larger than needed
+        frame_is_jpeg = is_jpeg_data(frame_data)
+        if self.jpeg_input and not frame_is_jpeg:
+            if self.jpeg_reduction_factor > 1:
+                frame_data = cv2.resize(frame_data, dsize = self.source_wh, interpolation = cv2.INTER_LINEAR)
+            frame_data = image_pixels_to_bytes(frame_data, jpg_quality_0_to_100 = 95)
+        elif frame_is_jpeg and not self.jpeg_input:
+            reduction_factor = pick_jpeg_reduction_factor(get_jpeg_dimensions(frame_data), self.frame_wh)
+            frame_data = image_bytes_to_pixels(frame_data, reduction_factor)
+        
+        # Make sure all pixel frames share the same sizing, since the encoder can't handle changes
+        # -> Jpeg frames are resized by ffmpeg
+        if not self.jpeg_input:
+            frame_height, frame_width = frame_data.shape[0:2]
+            if (frame_width, frame_height) != self.frame_wh:
+                frame_data = cv2.resize(frame_data, dsize = self.frame_wh, interpolation = cv2.INTER_AREA)
+            frame_data = np.ascontiguousarray(frame_data, dtype = np.uint8).data
+        
+        # Hand frame data over to the encoder
+        try:
+            self._ffmpeg_process.stdin.write(frame_data)
+        except BrokenPipeError:
+            self._raise_encoder_error()
+        self.frame_count += 1
+    
+    # .................................................................................................................
+    
+    def close(self):
+        
+        ''' Function used to finish encoding. Returns the path to the output file '''
+        
+        # Bail if we never got any frames, since there won't be a video!
+        if self._ffmpeg_process is None:
+            raise ValueError("No frames were provided for encoding!")
+        
+        # Signal the end of the frame data and wait for the encoder to finish up
+        self.close_input()
+        return_code = self._ffmpeg_process.wait()
+        if return_code != 0:
+            self._raise_encoder_error()
+        self._close_error_log()
+        
+        return self.output_path
+    
+    # .................................................................................................................
+    
+    def close_input(self):
+        
+        ''' Function used to signal that there are no more frames, without waiting for the encoder to finish '''
+        
+        try:
+            self._ffmpeg_process.stdin.close()
+        except BrokenPipeError:
+            pass
+    
+    # .................................................................................................................
+    
+    def iter_output_chunks(self, chunk_size_bytes = 65536):
+        
+        '''
+        Generator used to read back encoded video data as it becomes available. Only usable when streaming!
+        Frames must be written from a separate thread, otherwise the encoder output won't be read in time
+        '''
+        
+        # Hand back encoded data until the encoder closes its output (i.e. after the input is closed)
+        while True:
+            data_chunk = self._ffmpeg_process.stdout.read1(chunk_size_bytes)
+            if not data_chunk:
+                break
+            yield data_chunk
+        
+        return
+    
+    # .................................................................................................................
+    
+    def kill(self):
+        
+        ''' Function used to shut down the encoder without finishing the output '''
+        
+        if self._ffmpeg_process is not None:
+            self._ffmpeg_process.kill()
+            self._ffmpeg_process.wait()
+        self._close_error_log()
+    
+    # .................................................................................................................
+    
+    def _raise_encoder_error(self):
+        
+        ''' Helper used to report encoder errors, including ffmpeg's own error output '''
+        
+        # Make sure ffmpeg is done writing before reading back its error output
+        self._ffmpeg_process.kill()
+        self._ffmpeg_process.wait()
+        self._error_log_file.seek(0)
+        error_output = self._error_log_file.read().decode("utf-8", errors = "replace").strip()
+        self._close_error_log()
+        
+        raise RuntimeError("Error encoding video (ffmpeg): {}".format(error_output))
+    
+    # .................................................................................................................
+    
+    def _close_error_log(self):
+        
+        ''' Helper used to clean up the (temporary) file holding ffmpeg's error output '''
+        
+        if self._error_log_file is not None:
+            self._error_log_file.close()
+            self._error_log_file = None
+    
+    # .................................................................................................................
+    # .................................................................................................................
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Functions
+
+# .....................................................................................................................
+
+def is_jpeg_data(frame_data):
+    
+    ''' Helper function which checks if frame data is (compressed) jpeg data, as opposed to pixel data '''
+    
+    is_pixel_data = isinstance(frame_data, np.ndarray) and (frame_data.ndim > 1)
+    
+    return not is_pixel_data
+
+# .....................................................................................................................
+
+def get_encoder_profile_settings(encoder_profile):
+    
+    ''' Helper function which looks up the settings of a named encoder profile. Raises a ValueError if unknown '''
+    
+    profile_dict = ENCODER_PROFILES_LUT.get(encoder_profile, None)
+    if profile_dict is None:
+        valid_names_str = ", ".join(ENCODER_PROFILES_LUT.keys())
+        raise ValueError("Unknown encoder profile: {} (must be one of: {})".format(encoder_profile, valid_names_str))
+    
+    return profile_dict
+
+# .....................................................................................................................
+
+def get_encoder_profile_names():
+    
+    ''' Helper function which returns a list of all available encoder profile names '''
+    
+    return list(ENCODER_PROFILES_LUT.keys())
+
+# .....................................................................................................................
+
+def get_frame_data_wh(frame_data):
+    
+    ''' Helper function which gets the (width, height) of frame data, which may be pixel or jpeg data '''
+    
+    # Get sizing directly from pixel data
+    if not is_jpeg_data(frame_data):
+        frame_height, frame_width = frame_data.shape[0:2]
+        return (frame_width, frame_height)
+    
+    # Try to read jpeg sizing from the header, but fall back to decoding if needed
+    frame_wh = get_jpeg_dimensions(frame_data)
+    if frame_wh is None:
+        frame_height, frame_width = image_bytes_to_pixels(frame_data).shape[0:2]
+        frame_wh = (frame_width, frame_height)
+    
+    return frame_wh
+
+# .....................................................................................................................
+# .....................................................................................................................
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Set up globals
+
+# Named x264 settings, trading encoding speed against file size
+# -> 'crf' controls quality (higher values give smaller files), 'preset' controls encoding speed
+# -> 'keyframe_interval_sec' of None leaves keyframe placement up to the encoder
+ENCODER_PROFILES_LUT = \
+{"default":     {"preset": "medium",    "crf": 23, "tune": None,          "keyframe_interval_sec": None},
+ "interactive": {"preset": "ultrafast", "crf": 26, "tune": "zerolatency", "keyframe_interval_sec": 1},
+ "balanced":    {"preset": "veryfast",  "crf": 24, "tune": None,          "keyframe_interval_sec": 4},
+ "archive":     {"preset": "slow",      "crf": 28, "tune": None,          "keyframe_interval_sec": 10}}
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Demo
+
+if __name__ == "__main__":
+    
+    pass
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Scrap
+
+
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 19:20:44 2026
+
+@author: eo
+"""
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Imports
+
+import argparse
+import signal
+
+from time import sleep, time
+from functools import lru_cache
+
+import cv2
+import numpy as np
+
+from waitress import serve as wsgi_serve
+
+from flask import Flask, Response, jsonify
+from flask import request as flask_request
+
+from local.lib.environment import get_dbserver_port
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Server control
+
+# .....................................................................................................................
+
+def register_waitress_shutdown_command():
+    
+    ''' Awkward hack to get waitress server to close on SIGTERM signals '''
+    
+    def convert_sigterm_to_keyboard_interrupt(signal_number, stack_frame):
+        print("", "", "*" * 48, "Kill signal received! ({})".format(signal_number), "*" * 48, "", sep = "\n")
+        raise KeyboardInterrupt
+    
+    # Replaces SIGTERM signals with a Keyboard interrupt, which the server will handle properly
+    signal.signal(signal.SIGTERM, convert_sigterm_to_keyboard_interrupt)
+    
+    return
+
+# .....................................................................................................................
+
+def parse_standin_args():
+    
+    ''' Helper function used to get stand-in server settings from the command line '''
+    
+    # Set up argument parsing
+    ap_obj = argparse.ArgumentParser(description = "Local stand-in for the dbserver, serving synthetic snapshots")
+    ap_obj.add_argument("-p", "--port", default = get_dbserver_port(), type = int,
+                        help = "Port to serve on (default: DBSERVER_PORT, or 8050)")
+    ap_obj.add_argument("-n", "--num_snapshots", default = 600, type = int,
+                        help = "Number of snapshots available per camera, ending at the server start time")
+    ap_obj.add_argument("-i", "--interval_ms", default = 1000, type = int,
+                        help = "Time between snapshots, in milliseconds")
+    ap_obj.add_argument("-s", "--frame_size", default = "1280x720", type = str,
+                        help = "Size of snapshot images, as WxH")
+    ap_obj.add_argument("-l", "--latency_ms", default = 5, type = float,
+                        help = "Delay added to every request, to mimic a remote server")
+    ap_obj.add_argument("--no_batch", default = False, action = "store_true",
+                        help = "Disable the batch snapshot route, to mimic an older dbserver")
+    
+    return ap_obj.parse_args()
+
+# .....................................................................................................................
+# .....................................................................................................................
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Image functions
+
+# .....................................................................................................................
+
+@lru_cache(maxsize = 2048)
+def make_snapshot_jpg(snapshot_epoch_ms, include_object = True):
+    
+    '''
+    Function which generates (jpeg encoded) synthetic snapshot data, with a circle that moves over time
+    Results are cached, so that serving images isn't slowed down by encoding
+    '''
+    
+    # Draw a static 'scene', with a moving 'object' if needed
+    frame_width, frame_height = FRAME_WH
+    snapshot_frame = np.full((frame_height, frame_width, 3), 80, dtype = np.uint8)
+    cv2.rectangle(snapshot_frame, (frame_width // 10, frame_height // 8), (frame_width // 2, frame_height // 2),
+                  (0, 120, 200), -1)
+    if include_object:
+        object_radius = max(4, frame_height // 16)
+        travel_px = max(1, frame_width - 2 * object_radius)
+        object_x = object_radius + (snapshot_epoch_ms // max(1, INTERVAL_MS)) * 7 % travel_px
+        object_xy = (int(object_x), int(frame_height * 0.7))
+        cv2.circle(snapshot_frame, object_xy, object_radius, (255, 255, 255), -1)
+    
+    # Stamp the time onto the image, so that frame ordering is easy to check
+    cv2.putText(snapshot_frame, str(snapshot_epoch_ms), (10, frame_height - 10), cv2.FONT_HERSHEY_SIMPLEX, 1,
+                (255, 255, 255), 2)
+    _, jpg_data = cv2.imencode(".jpg", snapshot_frame)
+    
+    return jpg_data.tobytes()
+
+# .....................................................................................................................
+
+def simulate_latency():
+    
+    ''' Helper used to add a fixed delay to each request '''
+    
+    if LATENCY_SEC > 0:
+        sleep(LATENCY_SEC)
+    
+    return
+
+# .....................................................................................................................
+# .....................................................................................................................
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Set up globals
+
+# Get settings from the command line when running as a server, otherwise use defaults
+standin_args = parse_standin_args() if __name__ == "__main__" else None
+FRAME_WH = (1280, 720) if standin_args is None else tuple(int(val) for val in standin_args.frame_size.split("x"))
+INTERVAL_MS = 1000 if standin_args is None else max(1, standin_args.interval_ms)
+NUM_SNAPSHOTS = 600 if standin_args is None else max(0, standin_args.num_snapshots)
+LATENCY_SEC = 0.005 if standin_args is None else (standin_args.latency_ms / 1000)
+ENABLE_BATCH_ROUTE = True if standin_args is None else (not standin_args.no_batch)
+
+# Every camera has the same (evenly spaced) snapshots, ending at the time the server starts
+END_EMS = int(1000 * time())
+SNAPSHOT_EMS_LIST = [END_EMS - INTERVAL_MS * k for k in reversed(range(NUM_SNAPSHOTS))]
+SNAPSHOT_EMS_SET = set(SNAPSHOT_EMS_LIST)
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Create routes
+
+# Create wsgi app so we can start adding routes
+wsgi_app = Flask(__name__)
+
+# .....................................................................................................................
+
+@wsgi_app.route("/is-alive")
+def is_alive_route():
+    return Response("Alive", status = 200)
+
+# .....................................................................................................................
+
+@wsgi_app.route("/<string:camera_select>/snapshots/get-ems-list/by-time-range/<int:start_ems>/<int:end_ems>")
+def snapshot_ems_list_route(camera_select, start_ems, end_ems):
+    
+    simulate_latency()
+    snapshot_ems_list = [each_ems for each_ems in SNAPSHOT_EMS_LIST if start_ems <= each_ems <= end_ems]
+    
+    return jsonify(snapshot_ems_list)
+
+# .....................................................................................................................
+
+@wsgi_app.route("/<string:camera_select>/snapshots/get-one-image/by-ems/<int:snapshot_ems>")
+def snapshot_image_route(camera_select, snapshot_ems):
+    
+    simulate_latency()
+    if snapshot_ems not in SNAPSHOT_EMS_SET:
+        return Response("No snapshot at {}".format(snapshot_ems), status = 404)
+    
+    return Response(make_snapshot_jpg(snapshot_ems), mimetype = "image/jpeg")
+
+# .....................................................................................................................
+
+@wsgi_app.route("/<string:camera_select>/snapshots/get-many-images/by-ems-list", methods = ["POST"])
+def snapshot_image_batch_route(camera_select):
+    
+    '''
+    Route which returns many snapshots at once, given a (json) list of epoch ms values.
+    Each snapshot is returned (in request order) as a 4-byte (big-endian, unsigned) image size,
+    followed by the image data itself. A size of zero is used for missing snapshots
+    '''
+    
+    # Act like an older dbserver if needed
+    if not ENABLE_BATCH_ROUTE:
+        return Response("Not found", status = 404)
+    
+    # Make sure we got a list of epoch ms values
+    snapshot_ems_list = flask_request.get_json(force = True, silent = True)
+    try:
+        snapshot_ems_list = [int(each_ems) for each_ems in snapshot_ems_list]
+    except (TypeError, ValueError):
+        return Response("Expecting a list of snapshot epoch ms values", status = 400)
+    
+    def generate_image_data():
+        for each_ems in snapshot_ems_list:
+            if each_ems not in SNAPSHOT_EMS_SET:
+                yield (0).to_bytes(4, "big")
+                continue
+            jpg_data = make_snapshot_jpg(each_ems)
+            yield len(jpg_data).to_bytes(4, "big")
+            yield jpg_data
+    
+    simulate_latency()
+    
+    return Response(generate_image_data(), mimetype = "application/octet-stream")
+
+# .....................................................................................................................
+
+@wsgi_app.route("/<string:camera_select>/backgrounds/get-active-image/by-time-target/<int:target_ems>")
+def background_image_route(camera_select, target_ems):
+    
+    simulate_latency()
+    
+    return Response(make_snapshot_jpg(0, include_object = False), mimetype = "image/jpeg")
+
+# .....................................................................................................................
+# .....................................................................................................................
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% *** Launch server ***
+
+if __name__ == "__main__":
+    
+    # Provide some feedback about the (fake) data being served
+    print("",
+          "Stand-in dbserver with {} snapshots per camera ({}x{})".format(NUM_SNAPSHOTS, *FRAME_WH),
+          "  Time range: {} to {}".format(SNAPSHOT_EMS_LIST[0] if SNAPSHOT_EMS_LIST else None, END_EMS),
+          "  Batch route: {}".format("enabled" if ENABLE_BATCH_ROUTE else "disabled"),
+          sep = "\n")
+    
+    # Launch server
+    register_waitress_shutdown_command()
+    print("")
+    wsgi_serve(wsgi_app, host = "0.0.0.0", port = standin_args.port, threads = 16)
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+#%% Scrap
+
+